@@ -0,0 +1,65 @@
+import argparse
+import io
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+from src.pybitbucket.bitbucket import Workspace, PullRequest, Commit, CommitList
+from src.pybitbucket.export import normalize_commits
+from src.pybitbucket.stub import SyntheticDataset
+
+# Commits listed by several PRs (each change promoted through --prs-per-change branches): parse time, memory held by
+# the CommitList, and CSV size of the flat (PR, commit) output against the normalized commits + pr_commits output.
+# Run from the repository root: python -m benchmarks.bench_commit_dedup --prs-per-change 3
+
+
+def build(workspace, project, repo, dataset, prs, commits_per_pr):
+    commit_list = CommitList()
+    for pr_id in range(1, prs + 1):
+        pr = PullRequest(workspace, project, repo, dataset.pull_request(0, pr_id),
+                         require_jira_issue_id_in_commit_message=True)
+        for index in range(commits_per_pr):
+            commit_list.add(Commit(workspace, project=project, pr=pr, pr_commit_dict=dataset.commit(0, pr_id, index),
+                                   require_jira_issue_id_in_commit_message=True))
+    return commit_list
+
+
+def get_csv_bytes(df):
+    output = io.StringIO()
+    df.to_csv(output, index=False)
+    return len(output.getvalue())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--prs", type=int, default=3000)
+    parser.add_argument("--commits", type=int, default=20)
+    parser.add_argument("--prs-per-change", type=int, default=3)
+    args = parser.parse_args()
+
+    dataset = SyntheticDataset(repos=1, prs_per_repo=args.prs, commits_per_pr=args.commits,
+                               prs_per_change=args.prs_per_change)
+    dataset.api_base_url = "https://api.bitbucket.org/2.0"
+    workspace = Workspace({"links": {}, "slug": "ws", "name": "ws", "uuid": "{ws}"}, "token")
+    project = SimpleNamespace(name="PROJ")
+    repo = SimpleNamespace(name="repo-0", full_name="ws/repo-0")
+
+    start = time.perf_counter()
+    tracemalloc.start()
+    commit_list = build(workspace, project, repo, dataset, args.prs, args.commits)
+    held = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    elapsed = time.perf_counter() - start
+    df_commits = commit_list.to_dataframe()
+    df_unique, df_pr_commits = normalize_commits(df_commits)
+    flat_bytes = get_csv_bytes(df_commits)
+    normalized_bytes = get_csv_bytes(df_unique) + get_csv_bytes(df_pr_commits)
+    print(f"{len(commit_list)} PR commits, {commit_list.count_unique()} unique: {elapsed:.2f}s (traced), "
+          f"{held / len(commit_list):.0f} bytes/PR commit held")
+    print(f"CSV: flat {flat_bytes / 1e6:.1f} MB, normalized {normalized_bytes / 1e6:.1f} MB "
+          f"({len(df_unique)} commits + {len(df_pr_commits)} pr_commits rows)")
+    workspace.commit_fetcher.shutdown()
+
+
+if __name__ == "__main__":
+    main()
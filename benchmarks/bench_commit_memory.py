@@ -0,0 +1,72 @@
+import argparse
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+import pandas as pd
+
+from src.pybitbucket.bitbucket import Workspace, Commit, CommitList
+
+# Peak memory of accumulating synthetic commits and materialising a DataFrame: the previous object + to_dict() lists
+# versus the columnar CommitList. Run from the repository root: python -m benchmarks.bench_commit_memory
+
+
+def synthetic_commit_dicts(count):
+    for index in range(count):
+        yield {"hash": f"{index:040x}",
+               "date": f"2022-{index % 12 + 1:02d}-{index % 28 + 1:02d}T09:{index % 60:02d}:00+00:00",
+               "message": f"PROJ-{index % 5000} change number {index}",
+               "author": {"user": {"display_name": f"Author {index % 200}"}},
+               "links": {"self": {"href": f"https://api.bitbucket.org/2.0/repositories/ws/repo/commit/{index:040x}"}}}
+
+
+def make_prs(workspace, project):
+    prs = []
+    for repo_index in range(40):
+        repo = SimpleNamespace(name=f"repo-{repo_index}")
+        for pr_index in range(25):
+            prs.append(SimpleNamespace(id=pr_index, repo=repo, source_branch=f"feature/PROJ-{pr_index}",
+                                       destination_branch="main"))
+    return prs
+
+
+def run(count, columnar):
+    workspace = Workspace({"links": {}, "slug": "ws", "name": "ws", "uuid": "{ws}"}, "token",
+                          default_deploy_repo_list=["repo-0"], keep_raw_json=not columnar)
+    project = SimpleNamespace(name="PROJ")
+    prs = make_prs(workspace, project)
+    tracemalloc.start()
+    start = time.perf_counter()
+    if columnar:
+        commit_list = CommitList(workspace.default_deploy_repo_list)
+        for index, commit_dict in enumerate(synthetic_commit_dicts(count)):
+            commit_list.add(Commit(workspace, project, prs[index % len(prs)], commit_dict))
+        df = commit_list.to_dataframe()
+    else:
+        # The pre-columnar CommitList: every Commit object (with its raw JSON) plus a to_dict() copy
+        commits = []
+        commit_dicts = []
+        for index, commit_dict in enumerate(synthetic_commit_dicts(count)):
+            commit = Commit(workspace, project, prs[index % len(prs)], commit_dict)
+            commits.append(commit)
+            commit_dicts.append(commit.to_dict())
+        df = pd.DataFrame(commit_dicts)
+    elapsed = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, current, len(df)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--commits", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    print(f"{'storage':>9} {'rows':>9} {'seconds':>8} {'peak MB':>8} {'retained MB':>12}")
+    for name, columnar in (("objects", False), ("columnar", True)):
+        elapsed, peak, current, rows = run(args.commits, columnar)
+        print(f"{name:>9} {rows:>9} {elapsed:>8.1f} {peak / 2 ** 20:>8.0f} {current / 2 ** 20:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
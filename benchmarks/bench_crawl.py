@@ -0,0 +1,66 @@
+import argparse
+import contextlib
+import io
+import tempfile
+import time
+import tracemalloc
+
+from src.pybitbucket.bitbucket import Bitbucket
+from src.pybitbucket.stub import StubBitbucketServer, SyntheticDataset
+
+# End-to-end Bitbucket crawl (token, discovery, PR listings, PR commits, export) against the local stub at several
+# workspace sizes: throughput, requests and peak traced memory. Faults exercise the retry path.
+# Run from the repository root: python -m benchmarks.bench_crawl --scales 10,100,1000
+
+
+def crawl(args, repos):
+    dataset = SyntheticDataset(projects=args.projects, repos=repos, prs_per_repo=args.prs,
+                               commits_per_pr=args.commits)
+    with StubBitbucketServer(dataset, latency_seconds=args.latency, fault_rate=args.fault_rate) as server, \
+            tempfile.TemporaryDirectory() as directory:
+        settings = server.write_settings(directory, general={"max_concurrency": args.max_concurrency,
+                                                             "repo_concurrency": args.repo_concurrency})
+        if args.memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            bitbucket = Bitbucket(settings)
+            bitbucket.crawl()
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] if args.memory else None
+        if args.memory:
+            tracemalloc.stop()
+        expected = dataset.count_pull_requests()
+        return {"seconds": elapsed, "prs": len(bitbucket.df_prs), "expected_prs": expected,
+                "commits": len(bitbucket.df_commits), "requests": server.stats()["requests"],
+                "faults": server.stats()["faults"], "peak_mb": peak / 1e6 if peak is not None else None}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scales", default="10,100,1000", help="comma separated repo counts")
+    parser.add_argument("--projects", type=int, default=4)
+    parser.add_argument("--prs", type=int, default=10)
+    parser.add_argument("--commits", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.005)
+    parser.add_argument("--fault-rate", type=float, default=0.0)
+    parser.add_argument("--max-concurrency", type=int, default=8)
+    parser.add_argument("--repo-concurrency", type=int, default=4)
+    parser.add_argument("--no-memory", dest="memory", action="store_false",
+                        help="skip tracemalloc, which slows the crawl down")
+    args = parser.parse_args()
+
+    print(f"{'repos':>6} {'seconds':>8} {'prs':>7} {'commits':>8} {'requests':>9} {'faults':>6} {'req/s':>7} "
+          f"{'PRs/s':>7} {'peak MB':>8}")
+    for repos in [int(scale) for scale in args.scales.split(",")]:
+        result = crawl(args, repos)
+        if result["prs"] != result["expected_prs"]:
+            print(f"warning: crawled {result['prs']} PRs, expected {result['expected_prs']}")
+        peak = f"{result['peak_mb']:>8.1f}" if result["peak_mb"] is not None else f"{'-':>8}"
+        print(f"{repos:>6} {result['seconds']:>8.2f} {result['prs']:>7} {result['commits']:>8} "
+              f"{result['requests']:>9} {result['faults']:>6} {result['requests'] / result['seconds']:>7.0f} "
+              f"{result['prs'] / result['seconds']:>7.0f} {peak}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import time
+
+from src.pybitbucket.bitbucket import Bitbucket
+from src.pybitbucket.stub import StubBitbucketServer, SyntheticDataset
+
+# Cost of the PR enrichment stage (diffstat, activity and statuses per PR) against the local stub: the crawl without
+# it, with it at each --levels pool size, and a re-run served from the response cache (merged PRs are cached for good).
+# Run from the repository root: python -m benchmarks.bench_enrichment --levels 1,4,8,16
+
+
+def crawl(server, directory, enrichment_concurrency=None, cache=False):
+    settings = server.write_settings(directory)
+    with open(settings["properties"], "a") as properties_file:
+        if enrichment_concurrency is not None:
+            properties_file.write(f"[enrichment]\nenabled=1\nmax_concurrency={enrichment_concurrency}\n")
+        if cache:
+            properties_file.write(f"[cache]\nenabled=1\npath={os.path.join(directory, 'cache.sqlite')}\n")
+    requests = server.request_count
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        bitbucket = Bitbucket(settings)
+        bitbucket.crawl()
+    return time.perf_counter() - start, server.request_count - requests, len(bitbucket.df_prs)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repos", type=int, default=10)
+    parser.add_argument("--prs", type=int, default=40)
+    parser.add_argument("--commits", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.01)
+    parser.add_argument("--levels", default="1,4,8,16", help="comma separated enrichment pool sizes")
+    args = parser.parse_args()
+
+    dataset = SyntheticDataset(repos=args.repos, prs_per_repo=args.prs, commits_per_pr=args.commits)
+    with StubBitbucketServer(dataset, latency_seconds=args.latency) as server:
+        print(f"{'run':<22} {'seconds':>8} {'requests':>9} {'prs':>6}")
+        with tempfile.TemporaryDirectory() as directory:
+            seconds, requests, prs = crawl(server, directory)
+            print(f"{'no enrichment':<22} {seconds:>8.2f} {requests:>9} {prs:>6}")
+        for level in [int(level) for level in args.levels.split(",")]:
+            with tempfile.TemporaryDirectory() as directory:
+                seconds, requests, prs = crawl(server, directory, level)
+                print(f"{f'enrichment x{level}':<22} {seconds:>8.2f} {requests:>9} {prs:>6}")
+        with tempfile.TemporaryDirectory() as directory:
+            crawl(server, directory, cache=True, enrichment_concurrency=8)
+            seconds, requests, prs = crawl(server, directory, cache=True, enrichment_concurrency=8)
+            print(f"{'enrichment x8, cached':<22} {seconds:>8.2f} {requests:>9} {prs:>6}")
+
+
+if __name__ == "__main__":
+    main()
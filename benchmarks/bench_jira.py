@@ -0,0 +1,54 @@
+import argparse
+import re
+import time
+
+import pandas as pd
+
+from src.pybitbucket.jira import JiraKeyExtractor
+
+# Jira key extraction over synthetic commit messages: the previous compile-per-call find_jira_id, the precompiled
+# per-message extractor, and the vectorised Series path. Run from the repository root: python -m benchmarks.bench_jira
+
+
+def legacy_find_jira_id(search_string):
+    pattern = re.compile(r"([0-Z]+\-\d+)")
+    match = pattern.search(search_string)
+    if match is not None:
+        return match.group(1)
+    else:
+        return None
+
+
+def synthetic_messages(count):
+    templates = ["PROJ-{n} fix the build", "Merged in feature/OPS-{n}-cleanup (pull request #{n})",
+                 "bump UTF-8 handling, no ticket {n}", "WEB-{n} WEB-{m}: follow up", "typo {n}"]
+    return [templates[index % len(templates)].format(n=index % 9000 + 1, m=index % 7000 + 1) for index in range(count)]
+
+
+def timed(label, function, count):
+    start = time.perf_counter()
+    result = function()
+    elapsed = time.perf_counter() - start
+    print(f"{label:>28} {elapsed:>8.2f}s {count / elapsed / 1e6:>8.2f}M msgs/s")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    messages = synthetic_messages(args.messages)
+    series = pd.Series(messages)
+    extractor = JiraKeyExtractor()
+    known_keys_extractor = JiraKeyExtractor(["PROJ", "OPS", "WEB"])
+
+    timed("legacy find_jira_id", lambda: [legacy_find_jira_id(message) for message in messages], args.messages)
+    timed("precompiled find", lambda: [extractor.find(message) for message in messages], args.messages)
+    timed("known keys find", lambda: [known_keys_extractor.find(message) for message in messages], args.messages)
+    timed("vectorised extract_series", lambda: extractor.extract_series(series), args.messages)
+    timed("vectorised all keys", lambda: extractor.extract_series(series, all_keys=True), args.messages)
+
+
+if __name__ == "__main__":
+    main()
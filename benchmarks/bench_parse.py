@@ -0,0 +1,73 @@
+import argparse
+import cProfile
+import io
+import pstats
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+from src.pybitbucket.bitbucket import Workspace, PullRequest, Commit
+from src.pybitbucket.stub import SyntheticDataset
+
+# Per-record cost of building PullRequest and Commit objects from full Bitbucket payloads (no network), and the memory
+# held by the parsed objects. Run from the repository root: python -m benchmarks.bench_parse --profile
+
+
+def make_payloads(prs, commits_per_pr):
+    dataset = SyntheticDataset(repos=1, prs_per_repo=prs, commits_per_pr=commits_per_pr)
+    dataset.api_base_url = "https://api.bitbucket.org/2.0"
+    pr_dicts = [dataset.pull_request(0, pr_id) for pr_id in range(1, prs + 1)]
+    commit_dicts = [[dataset.commit(0, pr_id, index) for index in range(commits_per_pr)]
+                    for pr_id in range(1, prs + 1)]
+    return pr_dicts, commit_dicts
+
+
+def parse(workspace, project, repo, pr_dicts, commit_dicts):
+    prs = []
+    commits = []
+    for pr_dict, pr_commit_dicts in zip(pr_dicts, commit_dicts):
+        pr = PullRequest(workspace, project, repo, pr_dict, require_jira_issue_id_in_commit_message=True)
+        prs.append(pr)
+        for pr_commit_dict in pr_commit_dicts:
+            commits.append(Commit(workspace, project=project, pr=pr, pr_commit_dict=pr_commit_dict,
+                                  require_jira_issue_id_in_commit_message=True))
+    return prs, commits
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--prs", type=int, default=5000)
+    parser.add_argument("--commits", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--profile", action="store_true")
+    args = parser.parse_args()
+
+    pr_dicts, commit_dicts = make_payloads(args.prs, args.commits)
+    workspace = Workspace({"links": {}, "slug": "ws", "name": "ws", "uuid": "{ws}"}, "token")
+    project = SimpleNamespace(name="PROJ")
+    repo = SimpleNamespace(name="repo-0", full_name="ws/repo-0")
+    records = args.prs * (1 + args.commits)
+
+    best = None
+    for attempt in range(args.repeat):
+        start = time.perf_counter()
+        parse(workspace, project, repo, pr_dicts, commit_dicts)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    tracemalloc.start()
+    prs, commits = parse(workspace, project, repo, pr_dicts, commit_dicts)
+    held = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(f"{args.prs} PRs + {len(commits)} commits: {best:.3f}s, {best / records * 1e6:.2f} us/record, "
+          f"{held / records:.0f} bytes/record held")
+    if args.profile:
+        profiler = cProfile.Profile()
+        profiler.runcall(parse, workspace, project, repo, pr_dicts, commit_dicts)
+        output = io.StringIO()
+        pstats.Stats(profiler, stream=output).sort_stats("tottime").print_stats(12)
+        print(output.getvalue())
+    workspace.commit_fetcher.shutdown()
+
+
+if __name__ == "__main__":
+    main()
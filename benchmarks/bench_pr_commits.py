@@ -0,0 +1,47 @@
+import argparse
+import time
+
+from src.pybitbucket.bitbucket import Workspace, Project
+from src.pybitbucket.stub import StubBitbucketServer, SyntheticDataset
+
+# Wall-clock of Repository.get_pull_requests against a local stub, per PR-commit fetch concurrency level.
+# Run from the repository root: python -m benchmarks.bench_pr_commits
+
+
+def crawl(server, max_concurrency):
+    workspace_dict = {"links": {}, "slug": "stub", "name": "stub", "uuid": "{stub}"}
+    workspace = Workspace(workspace_dict, "stub-token", max_concurrency=max_concurrency,
+                          api_base_url=server.api_base_url)
+    project = Project(workspace, server.dataset.project("P0"))
+    start = time.perf_counter()
+    for repo_name, repo in project.get_repos().items():
+        repo.get_pull_requests()
+    elapsed = time.perf_counter() - start
+    workspace.commit_fetcher.shutdown()
+    return elapsed, len(workspace.pr_list), len(workspace.commit_list)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--prs", type=int, default=50)
+    parser.add_argument("--commits", type=int, default=30)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--levels", default="1,2,4,8,16,32")
+    args = parser.parse_args()
+
+    dataset = SyntheticDataset(repos=1, prs_per_repo=args.prs, commits_per_pr=args.commits)
+    server = StubBitbucketServer(dataset, latency_seconds=args.latency).start()
+    try:
+        print(f"{'concurrency':>11} {'seconds':>8} {'prs':>5} {'commits':>8} {'speedup':>8}")
+        baseline = None
+        for level in [int(level) for level in args.levels.split(",")]:
+            elapsed, prs, commits = crawl(server, level)
+            if baseline is None:
+                baseline = elapsed
+            print(f"{level:>11} {elapsed:>8.2f} {prs:>5} {commits:>8} {baseline / elapsed:>7.1f}x")
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
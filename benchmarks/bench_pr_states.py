@@ -0,0 +1,56 @@
+import argparse
+import contextlib
+import io
+import tempfile
+import time
+
+from src.pybitbucket.bitbucket import Bitbucket
+from src.pybitbucket.stub import StubBitbucketServer, SyntheticDataset
+
+# All-state PR crawl against the local stub: one crawl per state (the old way to get every state) versus one crawl
+# listing all of them together (pr_states). Reports seconds, requests, the requests that are not PR commit pages
+# (discovery and PR listings; each PR needs its commit pages either way) and PRs of each.
+# Run from the repository root: python -m benchmarks.bench_pr_states --repos 50
+STATES = ["MERGED", "OPEN", "DECLINED", "SUPERSEDED"]
+PR_COMMITS_ENDPOINT = "/2.0/repositories/{workspace}/{repo_slug}/pullrequests/{pull_request_id}/commits"
+
+
+def crawl(server, directory, pr_states):
+    settings = server.write_settings(directory, atlassian={"pr_states": ",".join(pr_states)})
+    requests = server.request_count
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        bitbucket = Bitbucket(settings)
+        bitbucket.crawl()
+    endpoints = bitbucket.get_instrumentation_summary()["endpoints"]
+    commit_requests = endpoints.get(PR_COMMITS_ENDPOINT, {}).get("requests", 0)
+    requests = server.request_count - requests
+    return time.perf_counter() - start, requests, requests - commit_requests, len(bitbucket.df_prs)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repos", type=int, default=50)
+    parser.add_argument("--projects", type=int, default=4)
+    parser.add_argument("--prs", type=int, default=100)
+    parser.add_argument("--commits", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.005)
+    args = parser.parse_args()
+
+    dataset = SyntheticDataset(projects=args.projects, repos=args.repos, prs_per_repo=args.prs,
+                               commits_per_pr=args.commits, states=tuple(STATES))
+    with StubBitbucketServer(dataset, latency_seconds=args.latency) as server:
+        print(f"{'run':<20} {'seconds':>8} {'requests':>9} {'listing':>8} {'prs':>6}")
+        totals = [0.0, 0, 0, 0]
+        for state in STATES:
+            with tempfile.TemporaryDirectory() as directory:
+                totals = [total + value for total, value in zip(totals, crawl(server, directory, [state]))]
+        seconds, requests, listing_requests, prs = totals
+        print(f"{'one crawl per state':<20} {seconds:>8.2f} {requests:>9} {listing_requests:>8} {prs:>6}")
+        with tempfile.TemporaryDirectory() as directory:
+            seconds, requests, listing_requests, prs = crawl(server, directory, STATES)
+        print(f"{'single pass':<20} {seconds:>8.2f} {requests:>9} {listing_requests:>8} {prs:>6}")
+
+
+if __name__ == "__main__":
+    main()
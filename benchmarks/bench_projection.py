@@ -0,0 +1,49 @@
+import argparse
+import time
+
+from src.pybitbucket.bitbucket import Workspace, Project
+from src.pybitbucket.stub import StubBitbucketServer, SyntheticDataset
+
+# Requests and bytes transferred by a full crawl against a local stub, with Bitbucket's default page length and full
+# payloads versus the largest pages and a fields= projection.
+# Run from the repository root: python -m benchmarks.bench_projection
+
+
+def crawl(server, field_projection, max_pagelen=None):
+    workspace_dict = {"links": {}, "slug": "stub", "name": "stub", "uuid": "{stub}"}
+    kwargs = {} if max_pagelen is None else {"max_pagelen": max_pagelen}
+    workspace = Workspace(workspace_dict, "stub-token", api_base_url=server.api_base_url,
+                          field_projection=field_projection, **kwargs)
+    project = Project(workspace, server.dataset.project("P0"))
+    start = time.perf_counter()
+    for repo_name, repo in project.get_repos().items():
+        repo.get_pull_requests()
+    elapsed = time.perf_counter() - start
+    workspace.commit_fetcher.shutdown()
+    return elapsed, len(workspace.pr_list), len(workspace.commit_list), workspace.transport.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repos", type=int, default=5)
+    parser.add_argument("--prs", type=int, default=120)
+    parser.add_argument("--commits", type=int, default=25)
+    parser.add_argument("--latency", type=float, default=0.01)
+    args = parser.parse_args()
+
+    dataset = SyntheticDataset(repos=args.repos, prs_per_repo=args.prs, commits_per_pr=args.commits)
+    server = StubBitbucketServer(dataset, latency_seconds=args.latency).start()
+    try:
+        print(f"{'mode':>22} {'seconds':>8} {'prs':>6} {'commits':>8} {'requests':>9} {'MB':>8}")
+        for mode, field_projection, max_pagelen in [("default pages, full", False, {}),
+                                                    ("max pagelen, full", False, None),
+                                                    ("max pagelen, fields=", True, None)]:
+            elapsed, prs, commits, stats = crawl(server, field_projection, max_pagelen)
+            print(f"{mode:>22} {elapsed:>8.2f} {prs:>6} {commits:>8} {stats['requests']:>9} "
+                  f"{stats['bytes_received'] / 1e6:>8.2f}")
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+import argparse
+import contextlib
+import io
+import subprocess
+import sys
+import tempfile
+import time
+
+from src.pybitbucket.stub import StubBitbucketServer, SyntheticDataset
+
+# Start-up cost: importing the package (and which heavy modules that pulls in), "--help", the Bitbucket constructor,
+# and one small CLI query against the local stub. Each is timed in a fresh interpreter, best of --repeat.
+# Run from the repository root: python -m benchmarks.bench_startup
+HEAVY_MODULES = ["pandas", "numpy", "pyarrow", "aiohttp"]
+IMPORT_CODE = "import sys; import src.pybitbucket.bitbucket; " \
+              f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+
+
+def run(command, repeat):
+    best = None
+    for attempt in range(repeat):
+        start = time.perf_counter()
+        result = subprocess.run(command, capture_output=True, text=True, check=True)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result.stdout
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    baseline, output = run([sys.executable, "-c", "pass"], args.repeat)
+    print(f"{'interpreter':<28} {baseline * 1000:>8.0f} ms")
+    elapsed, output = run([sys.executable, "-c", IMPORT_CODE], args.repeat)
+    print(f"{'import bitbucket':<28} {elapsed * 1000:>8.0f} ms  heavy modules loaded: {output.strip() or 'none'}")
+    elapsed, output = run([sys.executable, "-m", "src.pybitbucket", "--help"], args.repeat)
+    print(f"{'cli --help':<28} {elapsed * 1000:>8.0f} ms")
+
+    with StubBitbucketServer(SyntheticDataset(repos=2, prs_per_repo=20)) as server, \
+            tempfile.TemporaryDirectory() as directory:
+        settings = server.write_settings(directory)
+        from src.pybitbucket.bitbucket import Bitbucket
+        requests = server.request_count
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            Bitbucket(settings)
+        elapsed = time.perf_counter() - start
+        print(f"{'Bitbucket(settings)':<28} {elapsed * 1000:>8.1f} ms  requests: {server.request_count - requests}")
+        command = [sys.executable, "-m", "src.pybitbucket", "--properties", settings["properties"],
+                   "--secret-properties", settings["secret-properties"], "prs", "repo-0", "--limit", "5"]
+        requests = server.request_count
+        elapsed, output = run(command, args.repeat)
+        print(f"{'cli prs repo-0 --limit 5':<28} {elapsed * 1000:>8.0f} ms  requests/run: "
+              f"{(server.request_count - requests) / args.repeat:.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,9 +5,9 @@ config = {
     "properties": "properties.properties"}
 
 bb = Bitbucket(settings=config)
+# The constructor only reads the configuration; crawl() fetches everything and writes the outputs
+prs_df, commits_df = bb.crawl()
 
 # workspace = bb.workspace
-prs_df = bb.df_prs
-commits_df = bb.df_commits
 prs_list = prs_df["pr_id"].unique().tolist().sort()
 print(f"PRs: {prs_list}")
@@ -0,0 +1,399 @@
+import asyncio
+import json
+import time
+from collections import deque
+from datetime import datetime
+
+from src.pybitbucket.bitbucket import API_BASE_URL, API_FIELDS, DEFAULT_MAX_CONCURRENCY, CommitList, PullRequestList, \
+    Project, Repository, PullRequest, get_list_url
+from src.pybitbucket.instrumentation import Instrumentation
+from src.pybitbucket.jira import default_extractor
+from src.pybitbucket.scheduler import RequestScheduler, BitbucketRequestError, RETRYABLE_STATUS_CODES
+from src.pybitbucket.sync import get_sync_key, get_volatile_states
+
+DEFAULT_MAX_IN_FLIGHT = 16
+
+
+class AsyncBbTransport:
+    def __init__(self, access_token=None, max_in_flight=DEFAULT_MAX_IN_FLIGHT, scheduler=None, instrumentation=None):
+        # asyncio counterpart of BbTransport: one aiohttp session, at most max_in_flight requests on the wire at once.
+        # Retries, backoff and the hourly budget follow the same RequestScheduler settings as the blocking client.
+        try:
+            import aiohttp
+        except ImportError as e:
+            raise ImportError("AsyncBitbucket requires aiohttp (pip install aiohttp)") from e
+        self.aiohttp = aiohttp
+        self.access_token = access_token
+        self.token_provider = None
+        self.max_in_flight = max(1, int(max_in_flight))
+        if scheduler is None:
+            scheduler = RequestScheduler()
+        self.scheduler = scheduler
+        self.instrumentation = instrumentation
+        self.semaphore = asyncio.Semaphore(self.max_in_flight)
+        self.session = None
+        self.request_count = 0
+        self.bytes_received = 0  # as sent on the wire, i.e. compressed when the server gzips
+        self.bytes_decoded = 0
+
+    def set_access_token(self, access_token):
+        self.access_token = access_token
+
+    def set_token_provider(self, token_provider):
+        # A provider (BbOauth2) takes precedence over a fixed access token and is consulted on every request
+        self.token_provider = token_provider
+
+    async def get_access_token(self):
+        if self.token_provider is not None:
+            # BbOauth2 may block on a refresh, so it runs off the event loop
+            return await asyncio.to_thread(self.token_provider.get_token)
+        return self.access_token
+
+    def get_session(self):
+        # Created on first use so that it binds to the running event loop
+        if self.session is None:
+            connector = self.aiohttp.TCPConnector(limit=self.max_in_flight)
+            self.session = self.aiohttp.ClientSession(connector=connector,
+                                                      headers={"Accept": "application/json",
+                                                               "Accept-Encoding": "gzip, deflate"})
+        return self.session
+
+    async def execute(self, url, headers, params=None):
+        # Async RequestScheduler.execute: returns (status, body) and raises BitbucketRequestError after max_attempts
+        scheduler = self.scheduler
+        status_code = None
+        reason = None
+        for attempt in range(1, scheduler.max_attempts + 1):
+            if scheduler.bucket is not None:
+                waited = await asyncio.to_thread(scheduler.bucket.acquire)
+                if waited > 0:
+                    with scheduler.lock:
+                        scheduler.throttled_seconds += waited
+                    if self.instrumentation is not None:
+                        self.instrumentation.record_throttle(waited)
+            try:
+                async with self.semaphore:
+                    started_at = time.perf_counter()
+                    async with self.get_session().get(url, headers=headers, params=params) as response:
+                        body = await response.read()
+                        wire_bytes = response.content_length or len(body)
+                        self.request_count += 1
+                        self.bytes_received += wire_bytes
+                        self.bytes_decoded += len(body)
+                        if self.instrumentation is not None:
+                            self.instrumentation.record_request(url, response.status, time.perf_counter() - started_at,
+                                                                wire_bytes, len(body))
+                        if response.status not in RETRYABLE_STATUS_CODES:
+                            return response.status, body
+                        status_code = response.status
+                        reason = response.reason
+                        delay = scheduler.retry_after_delay(response)
+                        if delay is None:
+                            delay = scheduler.backoff_delay(attempt)
+            except (self.aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                status_code = None
+                reason = str(e)
+                delay = scheduler.backoff_delay(attempt)
+            if attempt < scheduler.max_attempts:
+                print(f"Retrying {url} in {delay:.1f}s (attempt {attempt} of {scheduler.max_attempts}, "
+                      f"status {status_code})")
+                with scheduler.lock:
+                    scheduler.retries += 1
+                if self.instrumentation is not None:
+                    self.instrumentation.record_retry(url, status_code, delay)
+                await asyncio.sleep(delay)
+        raise BitbucketRequestError(url, status_code, scheduler.max_attempts, reason)
+
+    async def get_json(self, url, params=None):
+        # Returns the decoded JSON body, or None on failure
+        access_token = await self.get_access_token()
+        headers = {}
+        if access_token is not None:
+            headers["Authorization"] = f"Bearer {access_token}"
+        status, body = await self.execute(url, headers, params)
+        if status == 401 and self.token_provider is not None:
+            # The token expired or was revoked mid-crawl: refresh it once and transparently retry the request
+            access_token = await asyncio.to_thread(self.token_provider.invalidate, access_token)
+            if access_token is not None:
+                headers["Authorization"] = f"Bearer {access_token}"
+                status, body = await self.execute(url, headers, params)
+        if status == 200:
+            if self.instrumentation is None:
+                return json.loads(body)
+            with self.instrumentation.stage("json_decode"):
+                return json.loads(body)
+        print(f"GET {url} failed with status {status}")
+        return None
+
+    async def iter_pages(self, url):
+        # Yields each page of a paged listing, following "next" until it runs out or a request fails
+        while url is not None:
+            response = await self.get_json(url)
+            if response is None:
+                # Non-retryable failure: stop paging instead of re-requesting the same URL
+                break
+            yield response
+            url = response.get("next")
+
+    def stats(self):
+        return {"requests": self.request_count,
+                "bytes_received": self.bytes_received,
+                "bytes_decoded": self.bytes_decoded}
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+
+class AsyncWorkspace:
+    def __init__(self, workspace_dict, transport, default_project_keys_list=[], default_deploy_repo_list=[],
+                 max_concurrency=DEFAULT_MAX_CONCURRENCY, api_base_url=API_BASE_URL, keep_raw_json=False,
+                 jira_key_extractor=default_extractor, field_projection=True, api_fields=API_FIELDS):
+        # Project, Repository, PullRequest and Commit are the same parsing classes the blocking Workspace builds;
+        # only the paging loops are async. max_concurrency bounds the PRs whose commits are fetched concurrently.
+        self.default_project_keys_list = default_project_keys_list
+        self.default_deploy_repo_list = default_deploy_repo_list
+        self.deploy_repo_names = set(default_deploy_repo_list)
+        self.transport = transport
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.api_base_url = api_base_url
+        self.keep_raw_json = keep_raw_json
+        self.jira_key_extractor = jira_key_extractor
+        self.field_projection = field_projection
+        self.api_fields = api_fields
+        self.instrumentation = transport.instrumentation if transport.instrumentation is not None else Instrumentation()
+        self.workspace_dict = workspace_dict if keep_raw_json else None
+        self.commit_list = CommitList(default_deploy_repo_list)
+        self.pr_list = PullRequestList()
+        self.projects_dict = {}
+        self.dict_urls = None
+        self.slug = None
+        self.name = None
+        self.uuid = None
+
+        try:
+            self.dict_urls = workspace_dict["links"]
+            self.slug = workspace_dict["slug"]
+            self.name = workspace_dict["name"]
+            self.uuid = workspace_dict["uuid"]
+
+        except (IndexError, KeyError, TypeError) as e:
+            print(f"Exception {e}")
+            print(f"Workspace: {workspace_dict}")
+
+    def get_list_url(self, url, kind):
+        return get_list_url(url, kind, self.field_projection, self.api_fields)
+
+    async def get_project(self, key):
+        if key in self.projects_dict:
+            return self.projects_dict[key]
+        project_dict = await self.transport.get_json(f"{self.api_base_url}/workspaces/{self.slug}/projects/{key}")
+        if project_dict is None:
+            return None
+        project = Project(self, project_dict)
+        self.projects_dict[project.key] = project
+        return project
+
+    async def iter_projects(self, project_keys=None):
+        if project_keys is None:
+            project_keys = self.default_project_keys_list
+        if len(project_keys) > 0:
+            for project in await asyncio.gather(*[self.get_project(key) for key in project_keys]):
+                if project is not None:
+                    yield project
+        else:
+            projects_url = self.get_list_url(self.dict_urls["projects"]["href"], "projects")
+            async for projects_response in self.transport.iter_pages(projects_url):
+                for project_dict in projects_response.get("values", []):
+                    project = Project(self, project_dict)
+                    self.projects_dict[project.key] = project
+                    yield project
+
+    async def get_repos(self, project):
+        # Async Project.load_repos: pages the project's repositories once, later calls reuse project.repos_dict
+        if not project.repos_loaded and project.repos_url is not None:
+            async for repos_response in self.transport.iter_pages(self.get_list_url(project.repos_url, "repositories")):
+                for repo_dict in repos_response.get("values", []):
+                    repo = Repository(self, project=project, repo_dict=repo_dict)
+                    project.repos_dict[repo.name] = repo
+        project.repos_loaded = True
+        return project.repos_dict
+
+    async def iter_repositories(self, project_keys=None):
+        async for project in self.iter_projects(project_keys):
+            for repo in (await self.get_repos(project)).values():
+                yield repo
+
+    async def fetch_commit_dicts(self, pr):
+        # Async PullRequest.fetch_commit_dicts
+        pr_commit_dicts = []
+        if pr.commits_url is not None and not pr.commits_unchanged:
+            async for pr_commits_response in self.transport.iter_pages(self.get_list_url(pr.commits_url, "commits")):
+                pr_commit_dicts.extend(pr_commits_response.get("values", []))
+        return pr_commit_dicts
+
+    async def iter_repo_pull_requests(self, repo, default_deploy_repo_list=None, get_prs_updated_since_utc=None,
+                                      require_jira_issue_id_in_commit_message=False, state="MERGED", sync_state=None):
+        # Async Repository.iter_pull_requests: the PR listing is paged while the commits of up to
+        # 2 * max_concurrency PRs are fetched as tasks, and PRs are yielded in listing order with their commits
+        if default_deploy_repo_list is None:
+            default_deploy_repo_list = self.default_deploy_repo_list
+        url, high_water_mark_dt = repo.get_pull_requests_url(get_prs_updated_since_utc, state, sync_state)
+        volatile_states = get_volatile_states(state)
+        sync_key = get_sync_key(repo.full_name, state)
+        pr_commit_tasks = deque()
+        max_in_flight = 2 * self.max_concurrency
+        try:
+            async for pr_response in self.transport.iter_pages(url):
+                reached_known_data = False
+                for pr_dict in pr_response.get("values", []):
+                    if high_water_mark_dt is not None and "updated_on" in pr_dict and \
+                            datetime.fromisoformat(pr_dict["updated_on"]) <= high_water_mark_dt:
+                        if len(volatile_states) == 0:
+                            # PRs are sorted by -updated_on, so everything from here on was fetched by an earlier run
+                            reached_known_data = True
+                            break
+                        if pr_dict.get("state") not in volatile_states:
+                            continue
+                    with self.instrumentation.stage("parse_pull_requests"):
+                        pr = PullRequest(self, project=repo.project, repo=repo, pr_dict=pr_dict,
+                                         default_deploy_repo_list=default_deploy_repo_list,
+                                         require_jira_issue_id_in_commit_message=require_jira_issue_id_in_commit_message)
+                    if sync_state is not None:
+                        sync_state.observe_pull_request(repo.full_name, pr)
+                    pr_commit_tasks.append((pr, asyncio.ensure_future(self.fetch_commit_dicts(pr))))
+                    if sync_state is not None and sync_key is not None:
+                        sync_state.observe(sync_key, pr_dict.get("updated_on"))
+
+                while len(pr_commit_tasks) > max_in_flight:
+                    pr, task = pr_commit_tasks.popleft()
+                    pr.add_commits(await task)
+                    yield pr
+                if reached_known_data:
+                    break
+
+            while len(pr_commit_tasks) > 0:
+                pr, task = pr_commit_tasks.popleft()
+                pr.add_commits(await task)
+                yield pr
+        finally:
+            # The caller stopped early or a request failed: don't leave commit fetches running
+            for pr, task in pr_commit_tasks:
+                task.cancel()
+
+    async def iter_pull_requests(self, project_keys=None, **kwargs):
+        # Lazily yields PullRequest objects (with their commits) across projects and repos, page by page.
+        # Nothing is added to pr_list/commit_list, so memory stays bounded by what the caller keeps.
+        async for repo in self.iter_repositories(project_keys):
+            async for pr in self.iter_repo_pull_requests(repo, **kwargs):
+                yield pr
+
+    async def iter_commits(self, project_keys=None, **kwargs):
+        async for pr in self.iter_pull_requests(project_keys, **kwargs):
+            for commit in pr.get_commits():
+                yield commit
+
+    def add_pull_request(self, pr):
+        with self.instrumentation.stage("append_records", count=1 + len(pr.get_commits())):
+            if pr.is_valid:
+                self.pr_list.add(pr)
+            for commit in pr.get_commits():
+                if commit.is_valid:
+                    self.commit_list.add(commit)
+        return pr.is_valid
+
+    async def crawl_pull_requests(self, project_keys=None, **kwargs):
+        # Crawls every repo concurrently (bounded by the transport's in-flight limit) into pr_list/commit_list,
+        # in project/repo order so output matches the blocking Workspace.crawl_pull_requests
+        repos = [repo async for repo in self.iter_repositories(project_keys)]
+        repo_pull_requests = await asyncio.gather(*[self.collect_repo_pull_requests(repo, **kwargs)
+                                                    for repo in repos])
+        pr_count = 0
+        for pull_requests in repo_pull_requests:
+            for pr in pull_requests:
+                if self.add_pull_request(pr):
+                    pr_count = pr_count + 1
+        return pr_count
+
+    async def collect_repo_pull_requests(self, repo, **kwargs):
+        return [pr async for pr in self.iter_repo_pull_requests(repo, **kwargs)]
+
+
+class AsyncBitbucket:
+    def __init__(self, workspace_id, access_token, api_base_url=API_BASE_URL, max_in_flight=DEFAULT_MAX_IN_FLIGHT,
+                 max_concurrency=DEFAULT_MAX_CONCURRENCY, scheduler=None, default_project_keys_list=[],
+                 default_deploy_repo_list=[], keep_raw_json=False, jira_key_extractor=default_extractor,
+                 field_projection=True, instrumentation=None):
+        # No I/O happens here. access_token is either a BbOauth2 token provider or a plain token string.
+        # Use as "async with AsyncBitbucket(...) as bitbucket:" so the HTTP session is closed.
+        self.workspace_id = workspace_id
+        self.api_base_url = api_base_url
+        self.max_concurrency = max_concurrency
+        self.default_project_keys_list = default_project_keys_list
+        self.default_deploy_repo_list = default_deploy_repo_list
+        self.keep_raw_json = keep_raw_json
+        self.jira_key_extractor = jira_key_extractor
+        self.field_projection = field_projection
+        self.instrumentation = instrumentation if instrumentation is not None else Instrumentation()
+        self.transport = AsyncBbTransport(max_in_flight=max_in_flight, scheduler=scheduler,
+                                          instrumentation=self.instrumentation)
+        if isinstance(access_token, str):
+            self.transport.set_access_token(access_token)
+        else:
+            self.transport.set_token_provider(access_token)
+        self.workspace = None
+
+    def new_workspace(self, workspace_dict):
+        return AsyncWorkspace(workspace_dict, self.transport, self.default_project_keys_list,
+                              self.default_deploy_repo_list, max_concurrency=self.max_concurrency,
+                              api_base_url=self.api_base_url, keep_raw_json=self.keep_raw_json,
+                              jira_key_extractor=self.jira_key_extractor,
+                              field_projection=self.field_projection)
+
+    async def get_workspace(self):
+        if self.workspace is None:
+            url = "{api_base_url}/workspaces/{{{workspace}}}".format(api_base_url=self.api_base_url,
+                                                                     workspace=self.workspace_id)
+            workspace_dict = await self.transport.get_json(url)
+            if workspace_dict is not None:
+                self.workspace = self.new_workspace(workspace_dict)
+        return self.workspace
+
+    async def iter_workspaces(self):
+        # Every workspace the access token can see
+        async for workspaces_response in self.transport.iter_pages(f"{self.api_base_url}/workspaces"):
+            for workspace_dict in workspaces_response.get("values", []):
+                yield self.new_workspace(workspace_dict)
+
+    async def iter_projects(self, project_keys=None):
+        async for project in (await self.get_workspace()).iter_projects(project_keys):
+            yield project
+
+    async def iter_repositories(self, project_keys=None):
+        async for repo in (await self.get_workspace()).iter_repositories(project_keys):
+            yield repo
+
+    async def iter_pull_requests(self, project_keys=None, **kwargs):
+        async for pr in (await self.get_workspace()).iter_pull_requests(project_keys, **kwargs):
+            yield pr
+
+    async def iter_commits(self, project_keys=None, **kwargs):
+        async for commit in (await self.get_workspace()).iter_commits(project_keys, **kwargs):
+            yield commit
+
+    async def crawl_pull_requests(self, project_keys=None, **kwargs):
+        # Returns (df_prs, df_commits) for every repo of the given (or default, or all) projects
+        workspace = await self.get_workspace()
+        await workspace.crawl_pull_requests(project_keys, **kwargs)
+        with self.instrumentation.stage("build_dataframes"):
+            return workspace.pr_list.to_dataframe(), workspace.commit_list.to_dataframe()
+
+    async def close(self):
+        await self.transport.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        await self.close()
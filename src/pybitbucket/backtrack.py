@@ -0,0 +1,140 @@
+import pandas as pd
+
+# Bitbucket abbreviates PR merge_commit hashes to 12 characters, so every hash is indexed by this prefix
+SHORT_HASH_LENGTH = 12
+# How a deploy-repo commit was traced back to a source PR, strongest evidence first
+MATCH_MERGE_COMMIT = "merge_commit"  # the deploy commit is the merge commit of the source PR
+MATCH_HASH = "hash"  # the deploy commit is one of the source PR's commits
+MATCH_JIRA_ID = "jira_id"  # the deploy commit references the Jira issue of the source PR
+DEPLOY_COLUMNS = ["deploy_hash", "deploy_workspace", "deploy_repo", "deploy_pr_id", "deploy_datetime", "match",
+                  "workspace", "repo", "pr_id", "jira_id", "pr_created_datetime", "first_commit_datetime",
+                  "commits", "lead_time"]
+
+
+def get_short_hash(commit_hash):
+    if not isinstance(commit_hash, str) or len(commit_hash) == 0:
+        return None
+    return commit_hash[:SHORT_HASH_LENGTH]
+
+
+def get_column(df, column):
+    # Plain Python values of a column (None for missing ones), or a column of None if the frame lacks it
+    if column not in df.columns:
+        return [None] * len(df)
+    series = df[column]
+    if column.endswith("datetime") and not pd.api.types.is_datetime64_any_dtype(series):
+        series = pd.to_datetime(series)  # frames read back from CSV hold the timestamps as strings
+    return [None if pd.isna(value) else value for value in series.tolist()]
+
+
+class DeployIndex:
+    def __init__(self, df_prs, df_commits):
+        # Built once after a crawl, in one pass over each frame; every lookup is then a dict access instead of a
+        # merge over the whole frames. PRs are keyed (workspace, repo, pr_id); rows are positions in df_prs and
+        # df_commits, which are re-indexed 0..n-1.
+        self.df_prs = df_prs.reset_index(drop=True)
+        self.df_commits = df_commits.reset_index(drop=True)
+        self.pr_rows = {}
+        self.pr_keys_by_jira_id = {}
+        self.pr_key_by_merge_commit = {}
+        self.commit_rows_by_hash = {}
+        self.commit_rows_by_pr = {}
+        self.first_commit_datetime_by_pr = {}
+        self.deploy_pr_keys = set()
+        self.deploy_commit_rows = []
+
+        pr_keys = list(zip(get_column(self.df_prs, "workspace"), get_column(self.df_prs, "repo"),
+                           get_column(self.df_prs, "pr_id")))
+        self.pr_created_datetimes = get_column(self.df_prs, "created_datetime")
+        self.pr_jira_ids = get_column(self.df_prs, "jira_id")
+        for row, (pr_key, jira_id, merge_commit_hash) in enumerate(
+                zip(pr_keys, self.pr_jira_ids, get_column(self.df_prs, "merge_commit_hash"))):
+            self.pr_rows[pr_key] = row
+            if jira_id is not None:
+                self.pr_keys_by_jira_id.setdefault(jira_id, []).append(pr_key)
+            short_hash = get_short_hash(merge_commit_hash)
+            if short_hash is not None:
+                self.pr_key_by_merge_commit[short_hash] = pr_key
+
+        self.commit_hashes = get_column(self.df_commits, "hash")
+        self.commit_jira_ids = get_column(self.df_commits, "jira_id")
+        self.commit_datetimes = get_column(self.df_commits, "created_datetime")
+        self.commit_pr_keys = list(zip(get_column(self.df_commits, "workspace"), get_column(self.df_commits, "repo"),
+                                       get_column(self.df_commits, "pr_id")))
+        for row, (commit_hash, pr_key, created, is_deploy_repo) in enumerate(
+                zip(self.commit_hashes, self.commit_pr_keys, self.commit_datetimes,
+                    get_column(self.df_commits, "is_deploy_repo"))):
+            short_hash = get_short_hash(commit_hash)
+            if short_hash is not None:
+                self.commit_rows_by_hash.setdefault(short_hash, []).append(row)
+            self.commit_rows_by_pr.setdefault(pr_key, []).append(row)
+            first = self.first_commit_datetime_by_pr.get(pr_key)
+            if created is not None and (first is None or created < first):
+                self.first_commit_datetime_by_pr[pr_key] = created
+            if is_deploy_repo:
+                self.deploy_pr_keys.add(pr_key)
+                self.deploy_commit_rows.append(row)
+
+    def get_pull_request(self, workspace, repo, pr_id):
+        # The PR row as a dict, or None
+        row = self.pr_rows.get((workspace, repo, pr_id))
+        return self.df_prs.iloc[row].to_dict() if row is not None else None
+
+    def get_commits(self, commit_hash):
+        # Every commit row with this hash (full or abbreviated), one per PR that contains it
+        rows = self.commit_rows_by_hash.get(get_short_hash(commit_hash), [])
+        return self.df_commits.iloc[rows]
+
+    def get_pull_request_commits(self, workspace, repo, pr_id):
+        return self.df_commits.iloc[self.commit_rows_by_pr.get((workspace, repo, pr_id), [])]
+
+    def get_pull_requests_for_jira_id(self, jira_id):
+        return self.df_prs.iloc[[self.pr_rows[pr_key] for pr_key in self.pr_keys_by_jira_id.get(jira_id, [])]]
+
+    def get_pull_request_for_merge_commit(self, commit_hash):
+        # The PR whose merge produced this commit, as a (workspace, repo, pr_id) key, or None
+        return self.pr_key_by_merge_commit.get(get_short_hash(commit_hash))
+
+    def backtrack(self, commit_hash, jira_id=None):
+        # The source PRs (outside the deploy repos) a deploy-repo commit originates from, as a list of
+        # (match, (workspace, repo, pr_id)). A commit that is the merge commit of a source PR, or is itself one of
+        # its commits, is traced by hash; otherwise the PRs of the commit's Jira issue are the candidates.
+        short_hash = get_short_hash(commit_hash)
+        matches = {}
+        pr_key = self.pr_key_by_merge_commit.get(short_hash)
+        if pr_key is not None and pr_key not in self.deploy_pr_keys:
+            matches[pr_key] = MATCH_MERGE_COMMIT
+        for row in self.commit_rows_by_hash.get(short_hash, []):
+            pr_key = self.commit_pr_keys[row]
+            if pr_key not in self.deploy_pr_keys:
+                matches.setdefault(pr_key, MATCH_HASH)
+        if len(matches) == 0 and jira_id is not None:
+            for pr_key in self.pr_keys_by_jira_id.get(jira_id, []):
+                if pr_key not in self.deploy_pr_keys:
+                    matches.setdefault(pr_key, MATCH_JIRA_ID)
+        return [(match, pr_key) for pr_key, match in matches.items()]
+
+    def backtrack_deploys(self):
+        # One row per (deploy-repo commit, source PR) pair. lead_time runs from the source PR's first commit to the
+        # deploy commit; deploy commits that trace back to nothing are kept with an empty match.
+        rows = []
+        for row in self.deploy_commit_rows:
+            deploy_workspace, deploy_repo, deploy_pr_id = self.commit_pr_keys[row]
+            deploy_datetime = self.commit_datetimes[row]
+            deploy = [self.commit_hashes[row], deploy_workspace, deploy_repo, deploy_pr_id, deploy_datetime]
+            matches = self.backtrack(self.commit_hashes[row], self.commit_jira_ids[row])
+            if len(matches) == 0:
+                rows.append(deploy + [None] * (len(DEPLOY_COLUMNS) - len(deploy)))
+            for match, pr_key in matches:
+                pr_row = self.pr_rows.get(pr_key)
+                first_commit_datetime = self.first_commit_datetime_by_pr.get(pr_key)
+                lead_time = None
+                if first_commit_datetime is not None and deploy_datetime is not None:
+                    lead_time = deploy_datetime - first_commit_datetime
+                rows.append(deploy + [match, *pr_key,
+                                      self.pr_jira_ids[pr_row] if pr_row is not None else None,
+                                      self.pr_created_datetimes[pr_row] if pr_row is not None else None,
+                                      first_commit_datetime, len(self.commit_rows_by_pr.get(pr_key, [])), lead_time])
+        df = pd.DataFrame(rows, columns=DEPLOY_COLUMNS)
+        df["lead_time"] = pd.to_timedelta(df["lead_time"])
+        return df
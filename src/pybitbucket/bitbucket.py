@@ -1,111 +1,328 @@
 import configparser
+import functools
 import json
+import os
+import sys
+import threading
+import time
 import traceback
-
-from src.pybitbucket.jira import find_jira_id
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from src.pybitbucket.jira import JiraKeyExtractor, default_extractor
+from src.pybitbucket.transport import BbTransport, DEFAULT_POOL_SIZE, add_query_params
+from src.pybitbucket.cache import ResponseCache, CACHE_IMMUTABLE, CACHE_REVALIDATE, CACHE_TTL, \
+    DEFAULT_CACHE_TTL_SECONDS, DEFAULT_CACHE_MAX_BYTES
+from src.pybitbucket.scheduler import RequestScheduler, DEFAULT_REQUESTS_PER_HOUR, DEFAULT_MAX_ATTEMPTS, \
+    DEFAULT_BACKOFF_BASE_SECONDS, DEFAULT_BACKOFF_MAX_SECONDS, BitbucketAuthError
+from src.pybitbucket.records import ColumnarRecords, CATEGORY, STRING, INT, BOOL, DATETIME, concat_dataframes
+from src.pybitbucket.export import get_exporter, normalize_commits, denormalize_commits, EXPORT_CSV
+from src.pybitbucket.instrumentation import Instrumentation
+from src.pybitbucket.enrichment import PullRequestEnrichment, PullRequestEnrichmentFetcher, ENRICHMENT_KINDS, \
+    ENRICHMENT_API_FIELDS, ENRICHMENT_SCHEMA, DEFAULT_ENRICHMENT_CONCURRENCY, ENRICHMENT_DIFFSTAT, \
+    ENRICHMENT_ACTIVITY, ENRICHMENT_STATUSES
+from src.pybitbucket.store import Datastore, DEFAULT_DATASTORE_PATH
+from src.pybitbucket.sync import SyncState, merge_records, filter_pull_request_rows, get_states, get_volatile_states, \
+    get_sync_key, PR_KEY_COLUMNS, COMMIT_KEY_COLUMNS, COMMIT_HASH_KEY_COLUMNS, PR_STATES
 from datetime import datetime
 from urllib.parse import urlencode, quote_plus
-import numpy as np
-import pandas as pd
 
-import requests
+API_BASE_URL = "https://api.bitbucket.org/2.0"
+TOKEN_URL = "https://bitbucket.org/site/oauth2/access_token"
+DEFAULT_TOKEN_LIFETIME_SECONDS = 7200
+DEFAULT_TOKEN_REFRESH_MARGIN_SECONDS = 300
+# After a failed token request, get_token() raises without asking the token endpoint again for this long
+DEFAULT_TOKEN_FAILURE_RETRY_SECONDS = 60
+DEFAULT_MAX_CONCURRENCY = 8
+DEFAULT_REPO_CONCURRENCY = 4
+DEFAULT_WORKSPACE_CONCURRENCY = 4
+TIMESTAMP_CACHE_SIZE = 65536
+EMPTY_DICT = {}  # shared read-only default for chained .get() lookups on payloads
+# workspace_output values: one set of output files for all workspaces, or one per Workspace.slug
+WORKSPACE_OUTPUT_COMBINED = "combined"
+WORKSPACE_OUTPUT_PER_WORKSPACE = "per_workspace"
+# Largest page each list endpoint serves
+MAX_PAGELEN = {"projects": 100, "repositories": 100, "pullrequests": 50, "commits": 100}
+# The fields the Project, Repository, PullRequest and Commit constructors (and the enrichment extractors) read,
+# requested with fields= so list pages carry nothing else
+API_FIELDS = {
+    "projects": ["key", "name", "description", "uuid", "links.repositories.href", "links.avatar.href"],
+    "repositories": ["name", "slug", "full_name", "description", "uuid", "links.self.href", "links.avatar.href"],
+    "pullrequests": ["id", "title", "description", "state", "created_on", "updated_on", "author.display_name",
+                     "source.branch.name", "source.commit.hash", "source.commit.links.self.href",
+                     "destination.branch.name", "destination.commit.hash", "destination.commit.links.self.href",
+                     "merge_commit.hash", "merge_commit.links.self.href", "links.self.href", "links.commits.href"],
+    "commits": ["hash", "date", "message", "author.user.display_name"],
+    **ENRICHMENT_API_FIELDS
+}
+
+
+def get_list_url(url, kind, field_projection=True, api_fields=API_FIELDS, max_pagelen=MAX_PAGELEN):
+    # First page of a list endpoint at its largest page size and, with field_projection, only the fields we parse.
+    # Bitbucket carries these query parameters over into each page's "next" link.
+    params = {}
+    if kind in max_pagelen:
+        params["pagelen"] = max_pagelen[kind]
+    if field_projection:
+        params["fields"] = ",".join(["next"] + [f"values.{field}" for field in api_fields[kind]])
+    return add_query_params(url, params)
+
+
+def get_list_setting(section, key):
+    if key not in section:
+        return []
+    return [value.strip() for value in section[key].split(",") if value.strip() != ""]
+
+
+def get_workspace_path(path, slug):
+    # "prs.csv" -> "prs.<slug>.csv"; a directory gets a <slug> subdirectory
+    if path is None:
+        return None
+    root, extension = os.path.splitext(path)
+    if extension == "":
+        return os.path.join(path, slug)
+    return f"{root}.{slug}{extension}"
+
+
+@functools.lru_cache(maxsize=TIMESTAMP_CACHE_SIZE)
+def parse_timestamp(timestamp):
+    # Bitbucket's ISO 8601 timestamps. fromisoformat is several times faster than strptime, and the cache serves the
+    # dates repeated across PRs (commits listed by several PRs) and across re-crawled pages. datetimes are immutable.
+    try:
+        return datetime.fromisoformat(timestamp)
+    except ValueError:
+        # "Z" suffixes before Python 3.11
+        return datetime.strptime(timestamp, "%Y-%m-%dT%H:%M:%S%z")
+
+
+def intern_string(value):
+    # Author and branch names repeat across thousands of PRs and commits; interned, each is held once
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def get_href(links, name):
+    # links[name]["href"] of a payload's links dict, or None if any part is missing
+    return ((links or EMPTY_DICT).get(name) or EMPTY_DICT).get("href")
 
 
 class BbOauth2Test:
-    def __init__(self, settings):
-        print("Not implemented")
+    # Fixed-token provider with BbOauth2's interface, for a pre-issued token (e.g. a workspace access token) or a
+    # local stub server. settings is an [atlassian_oauth] section with an access_token key.
+    def __init__(self, settings, transport=None):
+        self.access_token = settings["access_token"]
+        self.refresh_token = None
+        self.expires_at = None
+        self.settings = settings
+        self.refresh_count = 0
+        self.transport = transport
+
+    def get_access_token(self):
+        return self.access_token
+
+    def refresh_access_token(self):
+        return self.access_token
+
+    def get_token(self):
+        return self.access_token
+
+    def invalidate(self, rejected_token):
+        # A fixed token cannot be refreshed; returning None stops the transport retrying a 401
+        return None
 
 
 class BbOauth2:
-    def __init__(self, settings):
+    # Token provider shared by reference with BbTransport. It records the token's expiry, refreshes it shortly before
+    # it expires, and serialises refreshes behind a lock so concurrent workers never stampede the token endpoint.
+    def __init__(self, settings, transport=None, token_uri=TOKEN_URL,
+                 refresh_margin_seconds=DEFAULT_TOKEN_REFRESH_MARGIN_SECONDS,
+                 failure_retry_seconds=DEFAULT_TOKEN_FAILURE_RETRY_SECONDS):
         self.access_token = None
         self.refresh_token = None
+        self.expires_at = None
         self.dict_urls = None
         self.auth_uri = "https://bitbucket.org/site/oauth2/authorize"
-        self.token_uri = "https://bitbucket.org/site/oauth2/access_token"
+        self.token_uri = token_uri
         self.server_base_uri = "https://api.bitbucket.org/"
         self.settings = settings
         self.key = settings["key"]
         self.secret = settings["secret"]
-
-    def get_access_token(self):
-        data = {
-            'grant_type': 'client_credentials'
-        }
-        response = requests.post('https://bitbucket.org/site/oauth2/access_token', data=data,
-                                 auth=(self.key, self.secret))
-        if response:
-            if response.status_code == 200:
-                try:
-                    data = response.json()
-                    self.access_token = data["access_token"]
-                    self.refresh_token = data["refresh_token"]
-                except (IndexError, KeyError, TypeError) as e:
-                    print(f"Exception {e}")
-                    self.access_token = None
-                    self.refresh_token = None
-
-            elif response.status_code == 401:
-                self.access_token = self.refresh_access_token()
+        self.refresh_margin_seconds = refresh_margin_seconds
+        self.failure_retry_seconds = failure_retry_seconds
+        self.refresh_count = 0
+        # The status and reason of the last failed token request, and when every grant last failed
+        self.last_status_code = None
+        self.last_reason = None
+        self.failed_at = None
+        self.lock = threading.Lock()
+        if transport is None:
+            transport = BbTransport()
+        self.transport = transport
+
+    def request_token(self, data):
+        response = self.transport.post(self.token_uri, data=data, auth=(self.key, self.secret))
+        if response is not None and response.status_code == 200:
+            try:
+                data = response.json()
+                self.access_token = data["access_token"]
+                self.refresh_token = data.get("refresh_token", self.refresh_token)
+                self.expires_at = time.monotonic() + float(data.get("expires_in", DEFAULT_TOKEN_LIFETIME_SECONDS))
+                return self.access_token
+            except (IndexError, KeyError, TypeError, ValueError) as e:
+                print(f"Exception {e}")
+                self.last_reason = f"unreadable token response: {e}"
         else:
-            self.access_token = None
+            print(f"Token request ({data['grant_type']}) failed: {response.status_code} {response.text}")
+            self.last_reason = response.text
+        self.last_status_code = response.status_code
+        self.access_token = None
+        self.expires_at = None
+        return None
 
-        # print(response.text)
-        return self.access_token
+    def get_access_token(self):
+        with self.lock:
+            return self.request_token({'grant_type': 'client_credentials'})
 
     def refresh_access_token(self):
-        print("refresh_token")
-        data = {
-            'grant_type': 'refresh_token',
-            'refresh_token': self.refresh_token
-        }
-        response = requests.post('https://bitbucket.org/site/oauth2/access_token', data=data,
-                                 auth=(self.key, self.secret))
-        if response:
-            if response.status_code == 200:
-                try:
-                    data = response.json()
-                    self.access_token = data["access_token"]
-                    self.refresh_token = data["refresh_token"]
-                except (IndexError, KeyError, TypeError) as e:
-                    print(f"Exception {e}")
-                    self.access_token = None
-                    self.refresh_token = None
-        else:
-            self.access_token = None
-
-        print(response.text)
-        return self.access_token
+        with self.lock:
+            return self.refresh_locked()
+
+    def refresh_locked(self):
+        # Caller holds self.lock. Falls back to a new client-credentials grant if the refresh token is rejected. Raises
+        # BitbucketAuthError when both fail, and keeps raising without a request for failure_retry_seconds, so bad
+        # credentials cost one token request rather than one (or two) per API call.
+        if self.failed_at is not None and time.monotonic() < self.failed_at + self.failure_retry_seconds:
+            raise BitbucketAuthError(self.token_uri, self.last_status_code, self.last_reason)
+        self.refresh_count = self.refresh_count + 1
+        access_token = None
+        if self.refresh_token is not None:
+            print("refresh_token")
+            access_token = self.request_token({'grant_type': 'refresh_token', 'refresh_token': self.refresh_token})
+        if access_token is None:
+            access_token = self.request_token({'grant_type': 'client_credentials'})
+        if access_token is None:
+            self.failed_at = time.monotonic()
+            raise BitbucketAuthError(self.token_uri, self.last_status_code, self.last_reason)
+        self.failed_at = None
+        return access_token
+
+    def get_token(self):
+        # The current token, refreshed first if it is missing or within refresh_margin_seconds of expiring
+        with self.lock:
+            if self.access_token is None or self.expires_at is None or \
+                    time.monotonic() >= self.expires_at - self.refresh_margin_seconds:
+                return self.refresh_locked()
+            return self.access_token
+
+    def invalidate(self, rejected_token):
+        # Called after a 401. Only the first worker to report a given token refreshes it; the rest reuse the result.
+        # Raises BitbucketAuthError if no new token can be obtained.
+        with self.lock:
+            if rejected_token == self.access_token:
+                return self.refresh_locked()
+            return self.access_token
 
 
 class CommitList:
-    def __init__(self):
-        self.commit_list_dict = []  # This is a list of dictionaries of commits (for data framing)
-        self.commit_list = []  # This is a list of Commit objects
+    # Columnar accumulator: fields are appended straight into typed/categorical columns instead of keeping each
+    # Commit object plus a to_dict() copy of it. The same commit usually belongs to several PRs (feature -> develop ->
+    # release -> main, deploy repos), so each hash is stored once and PR membership is a compact edge list of
+    # (commit row, PR) entries. to_dataframe() still returns one row per (PR, commit) in schema order.
+    schema = [("type", CATEGORY),
+              ("hash", STRING),
+              ("jira_id", STRING),
+              ("created_datetime", DATETIME),
+              ("message", STRING),
+              ("project", CATEGORY),
+              ("repo", CATEGORY),
+              ("workspace", CATEGORY),
+              ("author", CATEGORY),
+              ("pr_id", INT),
+              ("source_branch", CATEGORY),
+              ("destination_branch", CATEGORY),
+              ("is_deploy_repo", BOOL)]
+    commit_schema = [("hash", STRING),
+                     ("jira_id", STRING),
+                     ("created_datetime", DATETIME),
+                     ("message", STRING),
+                     ("author", CATEGORY)]
+    edge_schema = [("type", CATEGORY),
+                   ("commit_row", INT),
+                   ("project", CATEGORY),
+                   ("repo", CATEGORY),
+                   ("workspace", CATEGORY),
+                   ("pr_id", INT),
+                   ("source_branch", CATEGORY),
+                   ("destination_branch", CATEGORY),
+                   ("is_deploy_repo", BOOL)]
+
+    def __init__(self, default_deploy_repo_list=[]):
+        self.commits = ColumnarRecords(self.commit_schema)
+        self.edges = ColumnarRecords(self.edge_schema)
+        self.rows_by_hash = {}
+        self.deploy_repo_names = set(default_deploy_repo_list)
         self.df = None
 
+    def __len__(self):
+        return len(self.edges)
+
+    def count_unique(self):
+        return len(self.commits)
+
     def add(self, commit):
-        self.commit_list.append(commit)
-        self.commit_list_dict.append(commit.to_dict())
+        pr = commit.pr
+        row = self.rows_by_hash.get(commit.hash)
+        if row is None:
+            row = len(self.commits)
+            self.rows_by_hash[commit.hash] = row
+            self.commits.append((commit.hash, commit.jira_id, commit.datetime, commit.message, commit.author))
+        self.edges.append(("Commit", row, commit.project.name, pr.repo.name, commit.workspace.name, pr.id,
+                           pr.source_branch, pr.destination_branch, pr.repo.name in self.deploy_repo_names))
         # print(f"CommitList {commit.message}")
 
     def to_dataframe(self):
-        self.df = pd.DataFrame(self.commit_list_dict)
+        # Joins the edge list back to the unique commits with one positional take per commit column
+        df_edges = self.edges.to_dataframe()
+        df_commits = self.commits.to_dataframe().take(df_edges["commit_row"].to_numpy()).reset_index(drop=True)
+        self.df = df_edges.join(df_commits)[[name for name, kind in self.schema]]
         return self.df
 
 
 class PullRequestList:
-    def __init__(self):
-        self.pr_list_dict = []  # This is a list of dictionaries of commits (for data framing)
-        self.pr_list = []  # This is a list of Commit objects
+    schema = [("type", CATEGORY),
+              ("pr_id", INT),
+              ("message", STRING),  # the PR title, named to match Commit.message in dataframe.concat
+              ("created_datetime", DATETIME),
+              ("updated_datetime", DATETIME),
+              ("project", CATEGORY),
+              ("workspace", CATEGORY),
+              ("author", CATEGORY),
+              ("repo", CATEGORY),
+              ("state", CATEGORY),
+              ("source_branch", CATEGORY),
+              ("destination_branch", CATEGORY),
+              ("jira_id", STRING),
+              ("merge_commit_hash", STRING)]
+
+    def __init__(self, enrichment=False):
+        # With enrichment, each record also carries the ENRICHMENT_SCHEMA columns
+        self.enrichment = enrichment
+        self.records = ColumnarRecords(self.schema + ENRICHMENT_SCHEMA if enrichment else self.schema)
         self.df = None
 
-    def add(self, commit):
-        self.pr_list.append(commit)
-        self.pr_list_dict.append(commit.to_dict())
+    def __len__(self):
+        return len(self.records)
+
+    def add(self, pr):
+        values = ("PR", pr.id, pr.title, pr.created_on_dt, pr.updated_on_dt, pr.project.name, pr.workspace.name,
+                  pr.author, pr.repo.name, pr.state, pr.source_branch, pr.destination_branch, pr.jira_id,
+                  pr.merge_commit_hash)
+        if self.enrichment:
+            enrichment = pr.enrichment if pr.enrichment is not None else PullRequestEnrichment()
+            values = values + enrichment.to_values(pr.created_on_dt)
+        self.records.append(values)
 
     def to_dataframe(self):
-        self.df = pd.DataFrame(self.pr_list_dict)
+        self.df = self.records.to_dataframe()
         return self.df
 
     def get_uniques_list(self):
@@ -113,51 +330,189 @@ class PullRequestList:
             df = self.to_dataframe()
         else:
             df = self.df
-        df['pr_id'].unique().tolist()
+        return df['pr_id'].unique().tolist()
 
 
 class Bitbucket:
-    def __init__(self, settings):
+    def __init__(self, settings, instrumentation=None):
+        # Reads the configuration and sets up the (unused) transport; nothing is requested, opened or written until a
+        # method needs it. crawl() runs the full crawl and export. instrumentation may be passed in to attach hooks;
+        # by default a fresh Instrumentation is used.
         self.settings_dict = {}
         self.projects_dict = {}
         self.projects = None
         self.workspace = None
+        self.workspaces = {}
         secret_config = configparser.RawConfigParser()
         secret_config.read(settings["secret-properties"])
-        self.workspace_id = secret_config["atlassian"]["workspace_id"]
-        self.settings = secret_config["atlassian_oauth"]
+        # workspace_id may list several workspaces, crawled concurrently over one connection pool and rate budget.
+        # A workspace with its own OAuth consumer has an [atlassian_oauth:<workspace_id>] section, and an
+        # [atlassian:<workspace_id>] section may override default_project_key_list and default_deploy_repo_list.
+        self.workspace_ids = get_list_setting(secret_config["atlassian"], "workspace_id")
+        self.workspace_id = self.workspace_ids[0]
+        self.settings = secret_config["atlassian_oauth"] if secret_config.has_section("atlassian_oauth") else None
         config = configparser.RawConfigParser()
         config.read(settings["properties"])
         self.version = config["general"]["version"]
-        print(f"Bitbucket version {self.version}")
-        self.workspace_id = secret_config["atlassian"]["workspace_id"]
-        self.oauth2 = BbOauth2(self.settings)
-        self.access_token = self.oauth2.get_access_token()
+        if "max_concurrency" in config["general"]:
+            self.max_concurrency = int(config["general"]["max_concurrency"])
+        else:
+            self.max_concurrency = DEFAULT_MAX_CONCURRENCY
+        self.repo_concurrency = config["general"].getint("repo_concurrency", fallback=DEFAULT_REPO_CONCURRENCY)
+        self.workspace_concurrency = max(1, config["general"].getint("workspace_concurrency",
+                                                                     fallback=DEFAULT_WORKSPACE_CONCURRENCY))
+        self.keep_raw_json = config["general"].getboolean("keep_raw_json", fallback=False)
+        # Raw JSON is kept for debugging, so it defaults to the full payloads
+        self.field_projection = config["general"].getboolean("field_projection", fallback=not self.keep_raw_json)
+        if "api_base_url" in config["general"]:
+            self.api_base_url = config["general"]["api_base_url"].rstrip("/")
+        else:
+            self.api_base_url = API_BASE_URL
+        # Optional enrichment stage: each PR's diffstat, activity and statuses, on a pool of its own
+        self.enrichment_kinds = []
+        self.enrichment_concurrency = DEFAULT_ENRICHMENT_CONCURRENCY
+        if config.has_section("enrichment") and config["enrichment"].getboolean("enabled", fallback=False):
+            self.enrichment_kinds = get_list_setting(config["enrichment"], "kinds") \
+                if "kinds" in config["enrichment"] else list(ENRICHMENT_KINDS)
+            unknown_kinds = [kind for kind in self.enrichment_kinds if kind not in ENRICHMENT_KINDS]
+            if len(unknown_kinds) > 0:
+                raise ValueError(f"Unknown enrichment kinds {unknown_kinds}, expected some of {ENRICHMENT_KINDS}")
+            self.enrichment_concurrency = config["enrichment"].getint("max_concurrency",
+                                                                      fallback=DEFAULT_ENRICHMENT_CONCURRENCY)
+        if "pool_size" in config["general"]:
+            self.pool_size = int(config["general"]["pool_size"])
+        else:
+            concurrent_workspaces = min(len(self.workspace_ids), self.workspace_concurrency)
+            enrichment_concurrency = self.enrichment_concurrency if len(self.enrichment_kinds) > 0 else 0
+            self.pool_size = max(DEFAULT_POOL_SIZE, (self.max_concurrency + self.repo_concurrency +
+                                                     enrichment_concurrency) * concurrent_workspaces)
+        self.instrumentation = instrumentation if instrumentation is not None else Instrumentation()
+        self.print_profile = True
+        self.profile_file = None
+        if config.has_section("instrumentation"):
+            self.print_profile = config["instrumentation"].getboolean("print_summary", fallback=True)
+            self.profile_file = config["instrumentation"].get("summary_file", None) or None
+        self.response_cache = None
+        if config.has_section("cache") and config["cache"].getboolean("enabled", fallback=False):
+            self.response_cache = ResponseCache(
+                config["cache"].get("path", "pybitbucket_cache.sqlite"),
+                ttl_seconds=config["cache"].getint("ttl_seconds", fallback=DEFAULT_CACHE_TTL_SECONDS),
+                max_bytes=config["cache"].getint("max_mb", fallback=DEFAULT_CACHE_MAX_BYTES // (1024 * 1024)) *
+                1024 * 1024)
+        self.datastore = None
+        self.datastore_path = None
+        self.datastore_lock = threading.Lock()
+        if config.has_section("datastore") and config["datastore"].getboolean("enabled", fallback=False):
+            self.datastore_path = config["datastore"].get("path", DEFAULT_DATASTORE_PATH)
+        if config.has_section("rate_limit"):
+            rate_limit_config = config["rate_limit"]
+            self.scheduler = RequestScheduler(
+                requests_per_hour=rate_limit_config.getint("requests_per_hour", fallback=DEFAULT_REQUESTS_PER_HOUR),
+                burst=rate_limit_config.getint("burst", fallback=None),
+                max_attempts=rate_limit_config.getint("max_attempts", fallback=DEFAULT_MAX_ATTEMPTS),
+                backoff_base_seconds=rate_limit_config.getfloat("backoff_base_seconds",
+                                                                fallback=DEFAULT_BACKOFF_BASE_SECONDS),
+                backoff_max_seconds=rate_limit_config.getfloat("backoff_max_seconds",
+                                                               fallback=DEFAULT_BACKOFF_MAX_SECONDS),
+                instrumentation=self.instrumentation)
+        else:
+            self.scheduler = RequestScheduler(instrumentation=self.instrumentation)
+        self.transport = BbTransport(pool_size=self.pool_size, cache=self.response_cache, scheduler=self.scheduler,
+                                     instrumentation=self.instrumentation)
+        # One token provider per OAuth consumer. Each workspace gets a view of the shared transport that authenticates
+        # with its consumer's provider.
+        self.oauth2_by_section = {}
+        self.workspace_transports = {}
+        for workspace_id in self.workspace_ids:
+            oauth_section = f"atlassian_oauth:{workspace_id}"
+            if not secret_config.has_section(oauth_section):
+                oauth_section = "atlassian_oauth"
+            if oauth_section not in self.oauth2_by_section and "access_token" in secret_config[oauth_section]:
+                self.oauth2_by_section[oauth_section] = BbOauth2Test(secret_config[oauth_section],
+                                                                     transport=self.transport)
+            elif oauth_section not in self.oauth2_by_section:
+                # The first request fetches the token
+                self.oauth2_by_section[oauth_section] = BbOauth2(
+                    secret_config[oauth_section], transport=self.transport,
+                    token_uri=config["general"].get("token_url", TOKEN_URL),
+                    refresh_margin_seconds=config["general"].getint("token_refresh_margin_seconds",
+                                                                    fallback=DEFAULT_TOKEN_REFRESH_MARGIN_SECONDS),
+                    failure_retry_seconds=config["general"].getint("token_failure_retry_seconds",
+                                                                   fallback=DEFAULT_TOKEN_FAILURE_RETRY_SECONDS))
+            self.workspace_transports[workspace_id] = \
+                self.transport.with_token_provider(self.oauth2_by_section[oauth_section])
+        self.oauth2 = self.workspace_transports[self.workspace_id].token_provider
+        # The transport asks the provider for a token on every request, so refreshes are seen everywhere at once
+        self.transport.set_token_provider(self.oauth2)
         self.prs_file = None
         self.commits_file = None
+        self.pr_commits_file = None
 
         # Initialize the workspace and grab all projects therein
 
         if "prs_file" in secret_config["general"]:
             self.prs_file = secret_config["general"]["prs_file"]
         if "commits_file" in secret_config["general"]:
-            self.prs_file = secret_config["general"]["commits_file"]
+            self.commits_file = secret_config["general"]["commits_file"]
+        # normalize_commits writes each unique commit once to the commits output and the PR memberships to pr_commits
+        self.normalize_commits = secret_config["general"].getboolean("normalize_commits", fallback=False)
+        if "pr_commits_file" in secret_config["general"]:
+            self.pr_commits_file = secret_config["general"]["pr_commits_file"]
+        self.export_format = secret_config["general"].get("export_format", EXPORT_CSV)
+        self.export_dir = secret_config["general"].get("export_dir", "export")
+        self.incremental_sync = secret_config["general"].getboolean("incremental_sync", fallback=False)
+        self.checkpoint_dir = secret_config["general"].get("checkpoint_dir", None)
+        self.workspace_output = secret_config["general"].get("workspace_output", WORKSPACE_OUTPUT_COMBINED)
+        if self.workspace_output not in (WORKSPACE_OUTPUT_COMBINED, WORKSPACE_OUTPUT_PER_WORKSPACE):
+            raise ValueError(f"Unknown workspace_output {self.workspace_output}, expected "
+                             f"{WORKSPACE_OUTPUT_COMBINED} or {WORKSPACE_OUTPUT_PER_WORKSPACE}")
+        self.sync_state = None
+        self.sync_state_file = secret_config["general"].get("sync_state_file", "sync_state.json")
         if "default_deploy_repo_list" in secret_config["atlassian"]:
-            self.default_deploy_repo_list = secret_config["atlassian"]["default_deploy_repo_list"].split(",")
+            self.default_deploy_repo_list = [repo_name.strip() for repo_name in
+                                             secret_config["atlassian"]["default_deploy_repo_list"].split(",")
+                                             if repo_name.strip() != ""]
         else:
             self.default_deploy_repo_list = []
         if "default_project_key_list" in secret_config["atlassian"]:
-            self.default_project_keys_list = secret_config["atlassian"]["default_project_key_list"].split(",")
+            self.default_project_keys_list = [project_key.strip() for project_key in
+                                              secret_config["atlassian"]["default_project_key_list"].split(",")
+                                              if project_key.strip() != ""]
         else:
             self.default_project_keys_list = []
+        self.workspace_settings = {}
+        for workspace_id in self.workspace_ids:
+            workspace_section = secret_config[f"atlassian:{workspace_id}"] \
+                if secret_config.has_section(f"atlassian:{workspace_id}") else {}
+            self.workspace_settings[workspace_id] = {
+                "default_project_keys_list": get_list_setting(workspace_section, "default_project_key_list")
+                if "default_project_key_list" in workspace_section else self.default_project_keys_list,
+                "default_deploy_repo_list": get_list_setting(workspace_section, "default_deploy_repo_list")
+                if "default_deploy_repo_list" in workspace_section else self.default_deploy_repo_list}
 
         if "get_prs_updated_since_utc" in secret_config["atlassian"]:
             self.get_prs_updated_since_utc = secret_config["atlassian"]["get_prs_updated_since_utc"]
             self.get_prs_updated_since_datetime = datetime.strptime(
                 self.get_prs_updated_since_utc, '%Y-%m-%dT%H:%M:%S%z')
         else:
+            self.get_prs_updated_since_utc = None
             self.get_prs_updated_since_datetime = None
 
+        # The PR states to crawl, all in one listing per repo; each record carries its PR's state
+        self.pr_states = [state.upper() for state in get_list_setting(secret_config["atlassian"], "pr_states")] \
+            if "pr_states" in secret_config["atlassian"] else ["MERGED"]
+        unknown_states = [state for state in self.pr_states if state not in PR_STATES]
+        if len(self.pr_states) == 0 or len(unknown_states) > 0:
+            raise ValueError(f"Unknown pr_states {unknown_states}, expected some of {list(PR_STATES)}")
+
+        if "jira_project_keys" in secret_config["atlassian"]:
+            self.jira_project_keys = [jira_key.strip() for jira_key in
+                                      secret_config["atlassian"]["jira_project_keys"].split(",")
+                                      if jira_key.strip() != ""]
+        else:
+            self.jira_project_keys = []
+        self.jira_key_extractor = JiraKeyExtractor(self.jira_project_keys)
+
         if "require_jira_issue_id_in_commit_message" in secret_config["atlassian"]:
             self.require_jira_issue_id_in_commit_message = bool(
                 secret_config["atlassian"]["require_jira_issue_id_in_commit_message"])
@@ -166,84 +521,304 @@ class Bitbucket:
 
         self.settings_dict = {"version": self.version,
                               "workspace_id": self.workspace_id,
+                              "workspace_ids": self.workspace_ids,
+                              "workspace_concurrency": self.workspace_concurrency,
+                              "workspace_output": self.workspace_output,
                               "default_deploy_repo_list": self.default_deploy_repo_list,
                               "default_project_keys_list": self.default_project_keys_list,
                               "get_prs_updated_since_utc": self.get_prs_updated_since_utc,
                               "get_prs_updated_since_datetime": self.get_prs_updated_since_datetime,
-                              "require_jira_issue_id_in_commit_message": self.require_jira_issue_id_in_commit_message
+                              "pr_states": self.pr_states,
+                              "require_jira_issue_id_in_commit_message": self.require_jira_issue_id_in_commit_message,
+                              "jira_project_keys": self.jira_project_keys,
+                              "max_concurrency": self.max_concurrency,
+                              "repo_concurrency": self.repo_concurrency,
+                              "keep_raw_json": self.keep_raw_json,
+                              "field_projection": self.field_projection,
+                              "pool_size": self.pool_size,
+                              "incremental_sync": self.incremental_sync,
+                              "export_format": self.export_format,
+                              "normalize_commits": self.normalize_commits,
+                              "checkpoint_dir": self.checkpoint_dir,
+                              "response_cache": self.response_cache is not None,
+                              "datastore": self.datastore_path,
+                              "enrichment": self.enrichment_kinds,
+                              "requests_per_hour": self.scheduler.requests_per_hour,
+                              "api_base_url": self.api_base_url
                               }
-        print(f"pybitbucket settings: {self.settings_dict}")
+        self.deploy_index = None
+        self.metrics = None
+        self.journal = None
+        self.df_prs = None
+        self.df_commits = None
+        self.outputs_by_workspace = {}
 
-        self.workspace = self.get_workspace()
-
-        if len(self.default_project_keys_list) > 0:
-            for project_key in self.default_project_keys_list:
-                print(f"Default project: {project_key} (getting PRs for all repos)")
-                project = self.workspace.get_project(project_key)
-                # Get the list of repos for the default project
-                repos_dict = project.get_repos()
-                # print(f"default project repos {repos_dict}")
-                for repo_name, repo in repos_dict.items():
-                    repo.get_pull_requests(default_deploy_repo_list=self.default_deploy_repo_list,
-                                           get_prs_updated_since_utc=self.get_prs_updated_since_utc,
-                                           require_jira_issue_id_in_commit_message=self.require_jira_issue_id_in_commit_message)
+    def crawl(self):
+        # Crawls every configured workspace, writes the outputs (and the datastore) and returns (df_prs, df_commits)
+        from src.pybitbucket.journal import CrawlJournal
+
+        print(f"Bitbucket version {self.version}")
+        print(f"pybitbucket settings: {self.settings_dict}")
+        self.deploy_index = None
+        self.metrics = None
+        if self.incremental_sync:
+            self.sync_state = SyncState(self.sync_state_file)
+        if self.checkpoint_dir is not None:
+            self.journal = CrawlJournal(self.checkpoint_dir)
+            if self.sync_state is not None:
+                # High-water marks of pages persisted before the interruption
+                for repo_key, updated_on in self.journal.repo_updated_on.items():
+                    if get_sync_key(repo_key, self.pr_states) is not None:
+                        self.sync_state.observe(get_sync_key(repo_key, self.pr_states), updated_on)
+
+        # Each workspace is discovered and crawled on its own worker; all of them share the transport's connection
+        # pool, response cache and rate budget
+        with ThreadPoolExecutor(max_workers=self.workspace_concurrency,
+                                thread_name_prefix="pybitbucket-workspaces") as executor:
+            workspaces = list(executor.map(self.crawl_workspace, self.workspace_ids))
+        self.workspaces = {workspace.slug: workspace for workspace in workspaces if workspace is not None}
+        if len(self.workspaces) == 0:
+            raise ValueError(f"None of the workspaces {self.workspace_ids} could be loaded")
+        # The first configured workspace that loaded
+        self.workspace = next(workspace for workspace in workspaces if workspace is not None)
+
+        with self.instrumentation.stage("build_dataframes"):
+            self.df_commits = concat_dataframes([workspace.commit_list.to_dataframe()
+                                                 for workspace in self.workspaces.values()])
+            self.df_prs = concat_dataframes([workspace.pr_list.to_dataframe()
+                                             for workspace in self.workspaces.values()])
+        if self.journal is not None:
+            self.df_prs, self.df_commits = self.journal.merge_previous_records(self.df_prs, self.df_commits)
+
+        # Output files: one set for all workspaces, or one per workspace with the slug added to each path
+        if self.workspace_output == WORKSPACE_OUTPUT_PER_WORKSPACE:
+            self.outputs_by_workspace = {}
+            for slug, workspace in self.workspaces.items():
+                self.outputs_by_workspace[slug] = (self.df_prs[self.df_prs["workspace"] == workspace.name],
+                                                   self.df_commits[self.df_commits["workspace"] == workspace.name])
         else:
-            self.workspace.get_projects()
-
-        # print(f"Dataframe {self.workspace.commit_list.to_dataframe().to_csv(self.commits_file)}")
-        # print(f"Dataframe {self.workspace.pr_list.to_dataframe().to_csv(self.commits_file)}")
-        self.df_commits = self.workspace.commit_list.to_dataframe()
-        # df_commits.to_csv(self.commits_file)
-        self.df_prs = self.workspace.pr_list.to_dataframe()
-        # df_prs.to_csv(self.prs_file)
-        df = pd.concat([self.df_prs, self.df_commits], ignore_index=True)
-        df.to_csv("df.csv")
-
-    def get_workspace(self):
+            self.outputs_by_workspace = {None: (self.df_prs, self.df_commits)}
+        for slug, (df_prs, df_commits) in self.outputs_by_workspace.items():
+            self.outputs_by_workspace[slug] = self.export(df_prs, df_commits, slug)
+        self.df_prs = concat_dataframes([df_prs for df_prs, df_commits in self.outputs_by_workspace.values()])
+        self.df_commits = concat_dataframes([df_commits for df_prs, df_commits in self.outputs_by_workspace.values()])
+        if self.datastore_path is not None:
+            with self.instrumentation.stage("datastore", count=len(self.df_prs) + len(self.df_commits)):
+                for workspace in self.workspaces.values():
+                    self.get_datastore().write_workspace(workspace)
+                self.get_datastore().write_records(self.df_prs, self.df_commits)
+        if self.incremental_sync:
+            # Only advance the high-water marks once the data behind them has been written
+            self.sync_state.commit()
+        if self.journal is not None:
+            self.journal.finish()
+        if self.print_profile:
+            print(self.instrumentation.format_summary(self.get_instrumentation_extra()))
+        if self.profile_file is not None:
+            self.instrumentation.write_json(self.profile_file, self.get_instrumentation_extra())
+        return self.df_prs, self.df_commits
+
+    def get_dataframes(self):
+        # The crawled (and merged) frames, crawling first if that has not happened yet
+        if self.df_prs is None:
+            self.crawl()
+        return self.df_prs, self.df_commits
+
+    def crawl_workspace(self, workspace_id):
+        # None if the workspace cannot be loaded or its credentials are rejected; the other workspaces still crawl
+        try:
+            workspace = self.get_workspace(workspace_id)
+            if workspace is None:
+                return None
+            workspace_settings = self.workspace_settings[workspace_id]
+            # Discovery: the default projects (or every project in the workspace) and all of their repos,
+            # concurrently
+            with self.instrumentation.stage("discovery"):
+                projects = workspace.discover(workspace_settings["default_project_keys_list"])
+            for project in projects:
+                print(f"Project: {workspace.slug}/{project.key} ({len(project.get_repos())} repos, "
+                      f"getting PRs for all repos)")
+            with self.instrumentation.stage("crawl"):
+                workspace.crawl_pull_requests(
+                    projects, default_deploy_repo_list=workspace_settings["default_deploy_repo_list"],
+                    get_prs_updated_since_utc=self.get_prs_updated_since_utc,
+                    require_jira_issue_id_in_commit_message=self.require_jira_issue_id_in_commit_message,
+                    state=self.pr_states, sync_state=self.sync_state, journal=self.journal)
+                workspace.commit_fetcher.shutdown()
+                if workspace.enrichment_fetcher is not None:
+                    workspace.enrichment_fetcher.shutdown()
+            return workspace
+        except BitbucketAuthError as e:
+            print(f"Workspace {workspace_id} skipped: {e}")
+            return None
+
+    def export(self, df_prs, df_commits, slug=None):
+        # Writes one set of output files (per workspace when slug is given) and returns the rows written
+        prs_file = self.prs_file if slug is None else get_workspace_path(self.prs_file, slug)
+        commits_file = self.commits_file if slug is None else get_workspace_path(self.commits_file, slug)
+        pr_commits_file = self.pr_commits_file if slug is None else get_workspace_path(self.pr_commits_file, slug)
+        export_dir = self.export_dir if slug is None else get_workspace_path(self.export_dir, slug)
+        df_pr_commits = None
+        if self.normalize_commits:
+            df_commits, df_pr_commits = normalize_commits(df_commits)
+        with self.instrumentation.stage("merge_previous_records"):
+            if self.incremental_sync and self.export_format == EXPORT_CSV:
+                # Merge this run's delta into the previously saved CSVs; dataset exports append the delta (below).
+                # This run listed every PR still open, so earlier open PRs that were not listed again (and their
+                # commit rows) are dropped.
+                volatile_states = get_volatile_states(self.pr_states)
+                df_prs = merge_records(prs_file, df_prs, PR_KEY_COLUMNS, volatile_states)
+                if self.normalize_commits:
+                    df_commits = merge_records(commits_file, df_commits, COMMIT_HASH_KEY_COLUMNS)
+                    df_pr_commits = merge_records(pr_commits_file, df_pr_commits, COMMIT_KEY_COLUMNS)
+                    if len(volatile_states) > 0:
+                        df_pr_commits = filter_pull_request_rows(df_pr_commits, df_prs)
+                else:
+                    df_commits = merge_records(commits_file, df_commits, COMMIT_KEY_COLUMNS)
+                    if len(volatile_states) > 0:
+                        df_commits = filter_pull_request_rows(df_commits, df_prs)
+        with self.instrumentation.stage("export", count=len(df_prs) + len(df_commits) +
+                                        (len(df_pr_commits) if df_pr_commits is not None else 0)):
+            # An incremental dataset export appends the delta, except for PRs in a volatile state: their files are
+            # replaced, since this run listed all of them
+            exporter = get_exporter(self.export_format, prs_file=prs_file, commits_file=commits_file,
+                                    export_dir=export_dir,
+                                    append=self.incremental_sync and self.export_format != EXPORT_CSV,
+                                    pr_commits_file=pr_commits_file,
+                                    volatile_states=get_volatile_states(self.pr_states) if self.incremental_sync
+                                    else ())
+            exporter.write(df_prs, df_commits, df_pr_commits)
+            exporter.close()
+        if self.normalize_commits:
+            # df_commits keeps one row per (PR, commit) for the deploy index and metrics
+            df_commits = denormalize_commits(df_commits, df_pr_commits, [name for name, kind in CommitList.schema])
+        return df_prs, df_commits
+
+    def get_instrumentation_extra(self):
+        extra = {"scheduler": self.scheduler.stats(), "transport": self.transport.stats(),
+                 "settings": self.settings_dict}
+        if self.response_cache is not None:
+            extra["response_cache"] = self.response_cache.stats()
+        return extra
+
+    def get_instrumentation_summary(self):
+        # Structured profile of the run so far: per-endpoint requests/latency/bytes/retries/cache hits and stage times
+        return self.instrumentation.summary(self.get_instrumentation_extra())
+
+    def get_workspace(self, workspace_id=None):
         workspace = None
 
-        if self.workspace is not None:
-            return self.workspace
+        if workspace_id is None:
+            if self.workspace is not None:
+                return self.workspace
+            workspace_id = self.workspace_id
+        if workspace_id not in self.workspace_transports:
+            raise ValueError(f"Workspace {workspace_id} is not configured; workspace_id lists "
+                             f"{', '.join(self.workspace_ids)}")
+        transport = self.workspace_transports[workspace_id]
+        url = "{api_base_url}/workspaces/{{{workspace}}}".format(api_base_url=self.api_base_url,
+                                                                 workspace=workspace_id)
+
+        workspace_dict = transport.get_json(url)
+        if workspace_dict is not None:
+            workspace_settings = self.workspace_settings[workspace_id]
+            workspace = Workspace(workspace_dict, transport.token_provider,
+                                  workspace_settings["default_project_keys_list"],
+                                  workspace_settings["default_deploy_repo_list"], max_concurrency=self.max_concurrency,
+                                  api_base_url=self.api_base_url, transport=transport,
+                                  keep_raw_json=self.keep_raw_json, repo_concurrency=self.repo_concurrency,
+                                  jira_key_extractor=self.jira_key_extractor,
+                                  field_projection=self.field_projection, instrumentation=self.instrumentation,
+                                  datastore=self.get_datastore() if self.datastore_path is not None else None,
+                                  enrichment_kinds=self.enrichment_kinds,
+                                  enrichment_concurrency=self.enrichment_concurrency)
+            print(f"get workspace {workspace.name}")
         else:
-            url = "https://api.bitbucket.org/2.0/workspaces/{{{workspace}}}".format(workspace=self.workspace_id)
-
-            headers = {
-                "Accept": "application/json",
-                "Authorization": "Bearer {access_token}".format(access_token=self.access_token)
-            }
-
-            response = requests.request(
-                "GET",
-                url,
-                headers=headers
-            )
-            if response:
-                if response.status_code == 200:
-                    workspace = Workspace(response.json(), self.access_token, self.default_project_keys_list,
-                                          self.default_deploy_repo_list)
+            print(f"get workspace {workspace_id} failed")
+        return workspace
 
-            print(f"get workspace {workspace.name}")
-            return workspace
+    def get_deploy_index(self):
+        # Built on first use from the crawled (and merged) frames, then reused for every deploy lookup
+        from src.pybitbucket.backtrack import DeployIndex
+
+        if self.deploy_index is None:
+            self.deploy_index = DeployIndex(*self.get_dataframes())
+        return self.deploy_index
+
+    def get_metrics(self):
+        # Aggregates over the crawled (and merged) frames; computed aggregates are cached by the engine
+        from src.pybitbucket.metrics import MetricsEngine
+
+        if self.metrics is None:
+            self.metrics = MetricsEngine(*self.get_dataframes())
+        return self.metrics
+
+    def get_datastore(self):
+        # Opened on first use
+        if self.datastore_path is None:
+            raise ValueError("Queries need the datastore: set enabled=1 in the [datastore] section of the properties")
+        with self.datastore_lock:
+            if self.datastore is None:
+                self.datastore = Datastore(self.datastore_path)
+        return self.datastore
+
+    def query_pull_requests(self, **filters):
+        # Filtered slices of the datastore across all workspaces, see Datastore.query_pull_requests/query_commits
+        return self.get_datastore().query_pull_requests(**filters)
+
+    def query_commits(self, **filters):
+        return self.get_datastore().query_commits(**filters)
 
     def get_settings(self):
         return self.settings_dict
 
 
 class Workspace:
-    def __init__(self, workspace_dict, access_token, default_project_keys_list=[], default_deploy_repo_list=[]):
+    def __init__(self, workspace_dict, access_token, default_project_keys_list=[], default_deploy_repo_list=[],
+                 max_concurrency=DEFAULT_MAX_CONCURRENCY, api_base_url=API_BASE_URL, transport=None,
+                 keep_raw_json=False, repo_concurrency=DEFAULT_REPO_CONCURRENCY, jira_key_extractor=default_extractor,
+                 field_projection=True, api_fields=API_FIELDS, max_pagelen=MAX_PAGELEN, instrumentation=None,
+                 datastore=None, enrichment_kinds=[], enrichment_concurrency=DEFAULT_ENRICHMENT_CONCURRENCY):
         self.commit_list_df = None
         self.pr_list_df = None
-        self.access_token = access_token
         self.default_project_keys_list = default_project_keys_list
         self.dict_urls = None
         self.slug = None
         self.name = None
         self.uuid = None
         self.projects_dict = {}
-        self.commit_list = CommitList()
-        self.pr_list = PullRequestList()
+        self.commit_list = CommitList(default_deploy_repo_list)
+        self.pr_list = PullRequestList(enrichment=len(enrichment_kinds) > 0)
         self.default_deploy_repo_list = default_deploy_repo_list
-        self.workspace_dict = workspace_dict
+        self.deploy_repo_names = set(default_deploy_repo_list)
+        self.keep_raw_json = keep_raw_json
+        self.workspace_dict = workspace_dict if keep_raw_json else None
+        self.api_base_url = api_base_url
+        if instrumentation is None:
+            instrumentation = transport.instrumentation if transport is not None else None
+        self.instrumentation = instrumentation if instrumentation is not None else Instrumentation()
+        if transport is None:
+            # access_token is either a BbOauth2 token provider or a plain token string
+            transport = BbTransport(pool_size=max(DEFAULT_POOL_SIZE, max_concurrency),
+                                    instrumentation=self.instrumentation)
+            if isinstance(access_token, str):
+                transport.set_access_token(access_token)
+            else:
+                transport.set_token_provider(access_token)
+        self.transport = transport
+        self.commit_fetcher = PullRequestCommitFetcher(max_concurrency)
+        self.enrichment_fetcher = None
+        if len(enrichment_kinds) > 0:
+            self.enrichment_fetcher = PullRequestEnrichmentFetcher(enrichment_kinds, enrichment_concurrency)
+            # The PR listing must also carry the links the stage follows
+            api_fields = dict(api_fields, pullrequests=api_fields["pullrequests"] +
+                              [f"links.{kind}.href" for kind in enrichment_kinds])
+        self.repo_concurrency = max(1, int(repo_concurrency))
+        self.jira_key_extractor = jira_key_extractor
+        self.field_projection = field_projection
+        self.api_fields = api_fields
+        self.max_pagelen = max_pagelen
+        self.datastore = datastore
 
         try:
             self.dict_urls = workspace_dict["links"]
@@ -253,53 +828,38 @@ class Workspace:
 
         except (IndexError, KeyError, TypeError) as e:
             print(f"Exception {e}")
-            print(f"Repository: {self.workspace_dict}")
+            print(f"Workspace: {workspace_dict}")
+
+    @property
+    def access_token(self):
+        return self.transport.get_access_token()
 
     def get_project(self, key):
         project = None
         if key in self.projects_dict:
             project = self.projects_dict[key]
         else:
-            url = f"https://api.bitbucket.org/2.0/workspaces/{self.slug}/projects/{key}"
+            url = f"{self.api_base_url}/workspaces/{self.slug}/projects/{key}"
             # print(f"get_project {key} url={url}")
 
-            headers = {
-                "Accept": "application/json",
-                "Authorization": "Bearer {access_token}".format(access_token=self.access_token)
-            }
-
-            response = requests.request(
-                "GET",
-                url,
-                headers=headers
-            )
-            if response:
-                if response.status_code == 200:
-                    project_dict = response.json()
-                    project = Project(self, project_dict)
+            project_dict = self.transport.get_json(url)
+            if project_dict is not None:
+                project = Project(self, project_dict)
+                self.projects_dict[key] = project
 
             # print(json.dumps(json.loads(response.text), sort_keys=True, indent=4, separators=(",", ": ")))
         return project
 
     def get_projects(self):
-        url = self.dict_urls["projects"]["href"]
+        url = self.get_list_url(self.dict_urls["projects"]["href"], "projects")
         print("get_projects: {url}".format(url=url))
 
-        headers = {
-            "Accept": "application/json",
-            "Authorization": "Bearer {access_token}".format(access_token=self.access_token)
-        }
-
-        response = requests.request(
-            "GET",
-            url,
-            headers=headers
-        )
-        if response:
-            if response.status_code == 200:
-                self.projects_dict = response.json()
+        has_more_pages = True
+        while has_more_pages:
+            projects_response = self.transport.get_json(url, cache_policy=CACHE_TTL)
+            if projects_response is not None:
                 try:
-                    projects_list = self.projects_dict["values"]
+                    projects_list = projects_response["values"]
 
                 except (IndexError, KeyError, TypeError) as e:
                     print(f"Exception {e}")
@@ -309,9 +869,107 @@ class Workspace:
                     new_project = Project(self, project)
                     self.projects_dict[new_project.key] = new_project
 
-        # print(json.dumps(json.loads(response.text), sort_keys=True, indent=4, separators=(",", ": ")))
+                if "next" not in projects_response:
+                    has_more_pages = False
+                else:
+                    url = projects_response["next"]
+            # print(json.dumps(json.loads(response.text), sort_keys=True, indent=4, separators=(",", ": ")))
+            else:
+                print("No workspace")
+                has_more_pages = False
+        return self.projects_dict
+
+    def get_list_url(self, url, kind):
+        return get_list_url(url, kind, self.field_projection, self.api_fields, self.max_pagelen)
+
+    def get_repository(self, slug):
+        # One repository by slug (with its project), without paging through the project's repositories
+        url = f"{self.api_base_url}/repositories/{self.slug}/{slug}"
+        repo_dict = self.transport.get_json(url)
+        if repo_dict is None:
+            return None
+        project_key = (repo_dict.get("project") or EMPTY_DICT).get("key")
+        project = self.get_project(project_key) if project_key is not None else None
+        if project is not None and slug in project.repos_dict:
+            return project.repos_dict[slug]
+        repo = Repository(self, project=project, repo_dict=repo_dict)
+        if project is not None:
+            project.repos_dict[repo.name] = repo
+        return repo
+
+    def discover(self, project_keys=None):
+        # Fetches the given projects (or pages through every project in the workspace), then pages the repositories
+        # of all of them concurrently. Returns the projects in a stable order.
+        if project_keys is None:
+            project_keys = self.default_project_keys_list
+        with ThreadPoolExecutor(max_workers=self.repo_concurrency,
+                                thread_name_prefix="pybitbucket-discovery") as executor:
+            if len(project_keys) > 0:
+                projects = [project for project in executor.map(self.get_project, project_keys) if project is not None]
+            else:
+                projects = list(self.get_projects().values())
+            list(executor.map(lambda project: project.load_repos(), projects))
+        return projects
+
+    def add_pull_request(self, pr):
+        # Appends a PR and its commits to the workspace's columnar lists; only ever called from one thread
+        with self.instrumentation.stage("append_records", count=1 + len(pr.get_commits())):
+            if pr.is_valid:
+                self.pr_list.add(pr)
+            for commit in pr.get_commits():
+                if commit.is_valid:
+                    self.commit_list.add(commit)
+        return pr.is_valid
+
+    def crawl_pull_requests(self, projects, **kwargs):
+        # Crawls the PRs of every repo of the given projects on a bounded pool of repo workers. Each repo's PRs are
+        # added to pr_list/commit_list in project/repo order once that repo completes, so output stays deterministic.
+        kwargs.setdefault("default_deploy_repo_list", self.default_deploy_repo_list)
+        repos = [repo for project in projects for repo in project.get_repos().values()]
+        pr_count = 0
+        with ThreadPoolExecutor(max_workers=self.repo_concurrency,
+                                thread_name_prefix="pybitbucket-repos") as executor:
+            futures = [executor.submit(lambda repo: list(repo.iter_pull_requests(**kwargs)), repo) for repo in repos]
+            for future in futures:
+                for pr in future.result():
+                    if self.add_pull_request(pr):
+                        pr_count = pr_count + 1
+        return pr_count
+
+    def iter_projects(self, project_keys=None):
+        if project_keys is None:
+            project_keys = self.default_project_keys_list
+        if len(project_keys) > 0:
+            for project_key in project_keys:
+                project = self.get_project(project_key)
+                if project is not None:
+                    yield project
         else:
-            print("No workspace")
+            if len(self.projects_dict) == 0:
+                self.get_projects()
+            yield from list(self.projects_dict.values())
+
+    def iter_pull_requests(self, project_keys=None, **kwargs):
+        # Lazily yields PullRequest objects (with their commits) across projects and repos, page by page.
+        # Nothing is added to pr_list/commit_list, so memory stays bounded by what the caller keeps.
+        kwargs.setdefault("default_deploy_repo_list", self.default_deploy_repo_list)
+        for project in self.iter_projects(project_keys):
+            yield from project.iter_pull_requests(**kwargs)
+
+    def iter_commits(self, project_keys=None, **kwargs):
+        for pr in self.iter_pull_requests(project_keys, **kwargs):
+            yield from pr.get_commits()
+
+    def query_pull_requests(self, **filters):
+        # This workspace's slice of the datastore
+        if self.datastore is None:
+            raise ValueError(f"Workspace {self.name} has no datastore")
+        return self.datastore.query_pull_requests(workspace=self.name, **filters)
+
+    def query_commits(self, **filters):
+        if self.datastore is None:
+            raise ValueError(f"Workspace {self.name} has no datastore")
+        return self.datastore.query_commits(workspace=self.name, **filters)
 
 
 class Project:
@@ -320,6 +978,7 @@ class Project:
         self.workspace = workspace
         self.repos = None
         self.repos_dict = {}
+        self.repos_loaded = False
         self.key = None
         self.links = None
         self.description = None
@@ -339,46 +998,53 @@ class Project:
             self.avatar_url = project_dict["links"]["avatar"]["href"]
         except (IndexError, KeyError, TypeError) as e:
             print(f"Exception {e}")
-            print(f"Project: {self.project_dict}")
+            print(f"Project: {project_dict}")
 
+    def load_repos(self):
+        # Pages through the project's repositories once; later calls reuse repos_dict
+        if self.repos_loaded:
+            return self.repos_dict
+        self.repos_loaded = True
         if self.repos_url is not None:
-            repos_url = self.repos_url
+            repos_url = self.workspace.get_list_url(self.repos_url, "repositories")
             has_more_pages = True
             while has_more_pages:
                 # print("get repos {repos_url}".format(repos_url=repos_url))
-                headers = {
-                    "Accept": "application/json",
-                    "Authorization": "Bearer {access_token}".format(access_token=self.workspace.access_token)
-                }
+                repos_response = self.workspace.transport.get_json(repos_url, cache_policy=CACHE_TTL)
+                if repos_response is not None:
+                    self.repos = repos_response
 
-                response = requests.request(
-                    "GET",
-                    repos_url,
-                    headers=headers
-                )
-                if response:
-                    if response.status_code == 200:
-                        self.repos = response.json()
+                    try:
+                        repos_list = self.repos["values"]
 
-                        try:
-                            repos_list = self.repos["values"]
+                    except (IndexError, KeyError, TypeError):
+                        repos_list = []
 
-                        except (IndexError, KeyError, TypeError):
-                            repos_list = []
+                    for repo in repos_list:
+                        new_repo = Repository(self.workspace, project=self, repo_dict=repo)
+                        self.repos_dict[new_repo.name] = new_repo
 
-                        for repo in repos_list:
-                            new_repo = Repository(self.workspace, project=self, repo_dict=repo)
-                            self.repos_dict[new_repo.name] = new_repo
-
-                        if "next" not in self.repos:
-                            has_more_pages = False
-                        else:
-                            repos_url = self.repos["next"]
+                    if "next" not in self.repos:
+                        has_more_pages = False
+                    else:
+                        repos_url = self.repos["next"]
+                else:
+                    # Non-retryable failure: stop paging instead of re-requesting the same URL
+                    has_more_pages = False
 
             # print(json.dumps(json.loads(response.text), sort_keys=True, indent=4, separators=(",", ": ")))
+        return self.repos_dict
 
     def get_repos(self):
-        return self.repos_dict
+        return self.load_repos()
+
+    def iter_pull_requests(self, **kwargs):
+        for repo_name, repo in self.get_repos().items():
+            yield from repo.iter_pull_requests(**kwargs)
+
+    def iter_commits(self, **kwargs):
+        for pr in self.iter_pull_requests(**kwargs):
+            yield from pr.get_commits()
 
 
 class Repository:
@@ -386,9 +1052,8 @@ class Repository:
         pull_request_state = "MERGED"
         self.query_param_pr_sort_str = "-updated_on"  # sort PRs by last updated first
         self.workspace = workspace
-        self.pull_requests_list = []
         self.project = project
-        self.repo_dict = repo_dict
+        self.repo_dict = repo_dict if workspace.keep_raw_json else None
         self.links = None
         self.description = None
         self.name = None
@@ -411,35 +1076,97 @@ class Repository:
             # print(f"Repository {self.name}")
         except (IndexError, KeyError, TypeError) as e:
             print(f"Exception {e}")
-            print(f"Repository: {self.repo_dict}")
+            print(f"Repository: {repo_dict}")
 
     def get_pull_requests(self, default_deploy_repo_list=[], get_prs_updated_since_utc=None,
-                          require_jira_issue_id_in_commit_message=False, state="MERGED"):
-        url_query_parameter = f"?state={state}&sort={self.query_param_pr_sort_str}"
-        if get_prs_updated_since_utc is not None:
-            payload = {"q": f"updated_on>{get_prs_updated_since_utc}"}
-            get_prs_updated_since_utc_urlencoded = urlencode(payload, quote_via=quote_plus)
-            url_query_parameter = f"{url_query_parameter}&{get_prs_updated_since_utc_urlencoded}"
-        url = f"https://api.bitbucket.org/2.0/repositories/{self.workspace.slug}/{self.slug}/pullrequests" + url_query_parameter
+                          require_jira_issue_id_in_commit_message=False, state="MERGED", sync_state=None,
+                          journal=None):
+        # Eager wrapper around iter_pull_requests that appends every PR and commit to the workspace's columnar lists.
+        # The PullRequest/Commit objects themselves are not kept. Returns the number of PRs added.
+        pr_count = 0
+        for pr in self.iter_pull_requests(default_deploy_repo_list=default_deploy_repo_list,
+                                          get_prs_updated_since_utc=get_prs_updated_since_utc,
+                                          require_jira_issue_id_in_commit_message=require_jira_issue_id_in_commit_message,
+                                          state=state, sync_state=sync_state, journal=journal):
+            if self.workspace.add_pull_request(pr):
+                pr_count = pr_count + 1
+        return pr_count
+
+    def get_pull_request(self, pr_id, require_jira_issue_id_in_commit_message=False):
+        # One PR by id; its commits are not fetched (see PullRequest.iter_commits)
+        url = f"{self.workspace.api_base_url}/repositories/{self.workspace.slug}/{self.slug}/pullrequests/{pr_id}"
+        pr_dict = self.workspace.transport.get_json(url)
+        if pr_dict is None:
+            return None
+        return PullRequest(self.workspace, project=self.project, repo=self, pr_dict=pr_dict,
+                           require_jira_issue_id_in_commit_message=require_jira_issue_id_in_commit_message)
+
+    def list_pull_requests(self, get_prs_updated_since_utc=None, state="MERGED",
+                           require_jira_issue_id_in_commit_message=False):
+        # Yields the PRs of the listing, newest update first, without fetching any commits
+        url = self.get_pull_requests_url(get_prs_updated_since_utc, state)[0]
+        while url is not None:
+            pr_response = self.workspace.transport.get_json(url)
+            if pr_response is None:
+                break
+            for pr_dict in pr_response.get("values", []):
+                yield PullRequest(self.workspace, project=self.project, repo=self, pr_dict=pr_dict,
+                                  require_jira_issue_id_in_commit_message=require_jira_issue_id_in_commit_message)
+            url = pr_response.get("next")
+
+    def get_pull_requests_url(self, get_prs_updated_since_utc=None, state="MERGED", sync_state=None):
+        # First page of the PR listing, plus the repo's high-water mark (or None), which lets paging stop at known PRs.
+        # state may be one state or several, listed together in one paged listing (state= is repeated). In
+        # incremental mode the high-water mark replaces the static updated-since timestamp; it only applies to the
+        # closed states, and PRs in a volatile state (OPEN) are all listed on every run.
+        states = get_states(state)
+        volatile_states = get_volatile_states(states)
+        high_water_mark_dt = None
+        condition = f"updated_on>{get_prs_updated_since_utc}" if get_prs_updated_since_utc is not None else None
+        sync_key = get_sync_key(self.full_name, states)
+        if sync_state is not None and sync_key is not None:
+            high_water_mark = sync_state.get_high_water_mark(sync_key)
+            if high_water_mark is not None:
+                high_water_mark_dt = datetime.fromisoformat(high_water_mark)
+                condition = f"updated_on>{high_water_mark}"
+                if len(volatile_states) > 0:
+                    state_conditions = [f'state="{volatile_state}"' for volatile_state in volatile_states]
+                    condition = f"({' OR '.join([condition] + state_conditions)})"
+        params = [("state", state) for state in states] + [("sort", self.query_param_pr_sort_str)]
+        if condition is not None:
+            params.append(("q", condition))
+        url = f"{self.workspace.api_base_url}/repositories/{self.workspace.slug}/{self.slug}/pullrequests?" + \
+            urlencode(params, quote_via=quote_plus)
+        return self.workspace.get_list_url(url, "pullrequests"), high_water_mark_dt
+
+    def iter_pull_requests(self, default_deploy_repo_list=[], get_prs_updated_since_utc=None,
+                           require_jira_issue_id_in_commit_message=False, state="MERGED", sync_state=None,
+                           journal=None):
+        if journal is not None and journal.is_repo_complete(self.full_name):
+            return
+        url, high_water_mark_dt = self.get_pull_requests_url(get_prs_updated_since_utc, state, sync_state)
+        volatile_states = get_volatile_states(state)
+        sync_key = get_sync_key(self.full_name, state)
+        if journal is not None and journal.get_resume_url(self.full_name) is not None:
+            url = journal.get_resume_url(self.full_name)
         # print(f"pull_requests {self.name} url={url}")
 
-        headers = {
-            "Accept": "application/json",
-            "Authorization": f"Bearer {self.workspace.access_token}"
-        }
-
+        # PR commit pages are fetched concurrently while the PR listing is still being paged. PRs are yielded in
+        # listing order once their commits arrive, with at most a bounded window of PRs in flight. With a journal,
+        # the last PR of each listing page carries that page's next URL, and once it is drained the page's records
+        # are checkpointed.
+        pr_commit_futures = deque()
+        page_prs = []
+        listing_failed = False
+        max_in_flight = 2 * self.workspace.commit_fetcher.max_concurrency
         has_more_pages = True
+        reached_known_data = False
         pagenum = 0
         while has_more_pages:
             pagenum = pagenum + 1
             # print(f"get_pull_requests page {pagenum} url={url}")
-            response = requests.request(
-                "GET",
-                url,
-                headers=headers
-            )
-            if response and response.status_code == 200:
-                pr_response = response.json()
+            pr_response = self.workspace.transport.get_json(url)
+            if pr_response is not None:
                 pr_list = []
 
                 try:
@@ -448,165 +1175,289 @@ class Repository:
                 except (IndexError, KeyError, TypeError):
                     print(f"get_pull_requests has no values in returned json {pr_response}")
 
+                page_start = len(pr_commit_futures)
                 for pr_dict in pr_list:
-                    pr = PullRequest(self.workspace, project=self.project,
-                                     repo=self, pr_dict=pr_dict, default_deploy_repo_list=default_deploy_repo_list,
-                                     require_jira_issue_id_in_commit_message=require_jira_issue_id_in_commit_message)
-                    self.pull_requests_list.append(pr)
+                    if high_water_mark_dt is not None and "updated_on" in pr_dict and \
+                            datetime.fromisoformat(pr_dict["updated_on"]) <= high_water_mark_dt:
+                        if len(volatile_states) == 0:
+                            # PRs are sorted by -updated_on, so everything from here on was fetched by an earlier run
+                            reached_known_data = True
+                            break
+                        if pr_dict.get("state") not in volatile_states:
+                            # Known closed PR among the volatile ones, which are listed in full
+                            continue
+                    with self.workspace.instrumentation.stage("parse_pull_requests"):
+                        pr = PullRequest(self.workspace, project=self.project,
+                                         repo=self, pr_dict=pr_dict, default_deploy_repo_list=default_deploy_repo_list,
+                                         require_jira_issue_id_in_commit_message=require_jira_issue_id_in_commit_message)
+                    pr.journal = journal
+                    if sync_state is not None:
+                        sync_state.observe_pull_request(self.full_name, pr)
+                    enrichment_futures = None
+                    if self.workspace.enrichment_fetcher is not None:
+                        enrichment_futures = self.workspace.enrichment_fetcher.submit(pr)
+                    pr_commit_futures.append((pr, self.workspace.commit_fetcher.submit(pr), enrichment_futures, None))
+                    if sync_state is not None and sync_key is not None:
+                        sync_state.observe(sync_key, pr_dict.get("updated_on"))
 
                     # print(f"pr {pr.to_dict()}")
 
-                    # if pr.source_commit_url is not None:
-                    #     print(f"commit: {pr.source_commit_url}")
-
-                if "next" not in pr_response:
+                if reached_known_data or "next" not in pr_response:
                     has_more_pages = False
                 else:
                     url = pr_response["next"]
-        # print(json.dumps(json.loads(response.text), sort_keys=True, indent=4, separators=(",", ": ")))
+                if journal is not None and len(pr_commit_futures) > page_start:
+                    pr, future, enrichment_futures, page_end = pr_commit_futures[-1]
+                    pr_commit_futures[-1] = (pr, future, enrichment_futures,
+                                             {"next_url": url if has_more_pages else None})
+            else:
+                # Non-retryable failure: stop paging instead of re-requesting the same URL
+                has_more_pages = False
+                listing_failed = True
+
+            while len(pr_commit_futures) > max_in_flight:
+                pr = self.drain_pull_request(pr_commit_futures, page_prs, journal, default_deploy_repo_list)
+                yield pr
+
+        while len(pr_commit_futures) > 0:
+            pr = self.drain_pull_request(pr_commit_futures, page_prs, journal, default_deploy_repo_list)
+            yield pr
+        if journal is not None and not listing_failed:
+            journal.complete_repo(self.full_name)
+
+    def drain_pull_request(self, pr_commit_futures, page_prs, journal, default_deploy_repo_list):
+        pr, future, enrichment_futures, page_end = pr_commit_futures.popleft()
+        pr.add_commits(future.result())
+        if enrichment_futures is not None:
+            pr.add_enrichment([(kind, enrichment_future.result()) for kind, enrichment_future in enrichment_futures])
+        if journal is not None:
+            page_prs.append(pr)
+            if page_end is not None:
+                self.checkpoint_page(journal, page_prs, page_end["next_url"], default_deploy_repo_list)
+                page_prs.clear()
+        return pr
+
+    def checkpoint_page(self, journal, prs, next_url, default_deploy_repo_list):
+        pr_list = PullRequestList(enrichment=self.workspace.enrichment_fetcher is not None)
+        commit_list = CommitList(default_deploy_repo_list)
+        for pr in prs:
+            if pr.is_valid:
+                pr_list.add(pr)
+            for commit in pr.get_commits():
+                if commit.is_valid:
+                    commit_list.add(commit)
+        updated_on = max((pr.updated_on for pr in prs if pr.updated_on is not None),
+                         key=datetime.fromisoformat, default=None)
+        journal.complete_page(self.full_name, pr_list.to_dataframe(), commit_list.to_dataframe(), next_url,
+                              updated_on=updated_on)
+
+    def iter_commits(self, **kwargs):
+        for pr in self.iter_pull_requests(**kwargs):
+            yield from pr.get_commits()
+
+
+class PullRequestCommitFetcher:
+    def __init__(self, max_concurrency=DEFAULT_MAX_CONCURRENCY):
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.executor = None
+
+    def submit(self, pr):
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.max_concurrency,
+                                               thread_name_prefix="pybitbucket-pr-commits")
+        return self.executor.submit(pr.fetch_commit_dicts)
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
 
 
 class PullRequest:
+    # Slots instead of a per-instance __dict__: a crawl builds one PullRequest per PR and keeps them until export
+    __slots__ = ["query_param_pr_commits_sort_str", "pr_dict", "workspace", "project", "repo",
+                 "default_deploy_repo_list", "title", "id", "created_on_str", "created_on_dt", "updated_on",
+                 "updated_on_dt", "description", "source_branch", "source_commit_hash", "source_commit_url",
+                 "destination_branch", "destination_commit_hash", "destination_commit_url", "author", "url", "links",
+                 "state", "merge_commit", "merge_commit_hash", "merge_commit_url", "pr_commits_list", "commits_url",
+                 "journal", "jira_id", "require_jira_issue_id_in_commit_message", "commits_unchanged", "diffstat_url",
+                 "activity_url", "statuses_url", "enrichment", "is_valid"]
+
     def __init__(self, workspace, project, repo, pr_dict, default_deploy_repo_list=[],
                  require_jira_issue_id_in_commit_message=False):
-        # print(f"PullRequest{pr_dict}")
+        # Parses the listing payload in one pass; no network I/O happens here (commits are fetched separately)
         self.query_param_pr_commits_sort_str = "-updated_on"  # sort PR commits by last updated first
-        self.pr_dict = pr_dict
+        self.pr_dict = pr_dict if workspace.keep_raw_json else None
         self.workspace = workspace
         self.project = project
         self.repo = repo
         self.default_deploy_repo_list = default_deploy_repo_list
-        self.title = None
-        self.id = None
-        self.created_on_str = None
-        self.created_on_dt = None
-        self.description = None
-        self.source_branch = None
-        self.source_commit_hash = None
-        self.source_commit_url = None
-        self.destination_branch = None
-        self.destination_commit_hash = None
-        self.destination_commit_url = None
-        self.author = None
-        self.url = None
-        self.links = None
-        self.state = None
-        self.merge_commit = None
-        self.merge_commit_url = None
         self.pr_commits_list = []
-        self.jira_id = None
-        self.pr_list = workspace.pr_list
-
-        # print(f"Pull Request dict {pr_dict}")
+        self.journal = None
+        self.require_jira_issue_id_in_commit_message = require_jira_issue_id_in_commit_message
+        # Set when an incremental sync already holds this PR's commits, so its commit pages are not fetched again
+        self.commits_unchanged = False
+        # Filled in by add_enrichment when the workspace has an enrichment stage
+        self.enrichment = None
+        self.is_valid = False
 
         try:
-            if "title" in pr_dict:
-                self.title = pr_dict["title"]
-                if require_jira_issue_id_in_commit_message:
-                    jira_id = find_jira_id(self.title)
-                    if jira_id is not None:
-                        self.jira_id = jira_id
-            if "id" in pr_dict:
-                self.id = pr_dict["id"]
-            if "created_on" in pr_dict:
-                self.created_on_str = pr_dict["created_on"]
-                self.created_on_dt = datetime.fromisoformat(self.created_on_str)
-            if "updated_on" in pr_dict:
-                self.updated_on = pr_dict["updated_on"]
-                self.updated_on_dt = datetime.fromisoformat(self.updated_on)
-            if "description" in pr_dict:
-                self.description = pr_dict["description"]
-
-            if "source" in pr_dict and "branch" in pr_dict["source"] and "name" in pr_dict["source"]["branch"]:
-                self.source_branch = pr_dict["source"]["branch"]["name"]
-                if self.jira_id is None and require_jira_issue_id_in_commit_message and "-" in self.source_branch:
-                    jira_id_in_branch_list = self.source_branch.split("-")
-                    if len(jira_id_in_branch_list) > 1:
-                        jira_id_str_test = f"{jira_id_in_branch_list[0]}-{jira_id_in_branch_list[1]}"
-                        self.jira_id = find_jira_id(jira_id_str_test)
-                if "commit" in pr_dict["source"] and "links" in pr_dict["source"]["commit"]:
-                    self.source_commit_hash = pr_dict["source"]["commit"]["hash"]
-                    self.source_commit_url = pr_dict["source"]["commit"]["links"]["self"]["href"]
-            if "destination" in pr_dict and "branch" in pr_dict["destination"] and "name" in pr_dict["destination"]["branch"]:
-                self.destination_branch = pr_dict["destination"]["branch"]["name"]
-                if "commit" in pr_dict["destination"] and "links" in pr_dict["destination"]["commit"]:
-                    self.destination_commit_hash = pr_dict["destination"]["commit"]["hash"]
-                    self.destination_commit_url = pr_dict["destination"]["commit"]["links"]["self"]["href"]
-            if "author" in pr_dict and "display_name" in pr_dict["author"]:
-                self.author = pr_dict["author"]["display_name"]
-
-            if "links" in pr_dict:
-                self.links = pr_dict["links"]
-                if "self" in self.links and "href" in pr_dict["links"]["self"]:
-                    self.url = pr_dict["links"]["self"]["href"]
-
-                # Get the commits related to the pull request
-                if "commits" in self.links and "href" in self.links["commits"]:
-                    self.commits_url = self.links["commits"]["href"]
-                    self.list_commits = []
-                    headers = {
-                        "Authorization": f"Bearer {self.workspace.access_token}"
-                    }
-
-                    url = self.commits_url
-                    has_more_pages = True
-                    pagenum = 0
-                    while has_more_pages:
-                        pagenum = pagenum + 1
-                        # print(f"get PR commits page {pagenum} url={url}")
-
-                        pr_commits_response = requests.request(
-                            "GET",
-                            url,
-                            headers=headers
-                        )
-                        if pr_commits_response and pr_commits_response.status_code == 200:
-                            pr_commits_response = pr_commits_response.json()
-                            pr_commits_list = []
-                            # print(f"PR commits: {pr_commits_response}")
-
-                            try:
-                                if "values" in pr_commits_response:
-                                    pr_commits_list = pr_commits_response["values"]
-
-                            except (IndexError, KeyError, TypeError):
-                                print(f"get_pr_commits has no values in returned json {pr_commits_response}")
-
-                            for pr_commit_dict in pr_commits_list:
-                                # print(f"pr_commit_dict {pr_commit_dict}")
-                                commit = Commit(self.workspace, project=self.project,
-                                                pr=self, pr_commit_dict=pr_commit_dict,
-                                                require_jira_issue_id_in_commit_message=require_jira_issue_id_in_commit_message)
-                                self.pr_commits_list.append(commit)
-                                # print(f"commit {commit.message}")
-
-                                # if pr.source_commit_url is not None:
-                                #     print(f"commit: {pr.source_commit_url}")
-
-                            if "next" not in pr_commits_response:
-                                has_more_pages = False
-                            else:
-                                url = pr_commits_response["next"]
-            if "state" in pr_dict:
-                self.state = pr_dict["state"]
-            if "merge_commit" in pr_dict:
-                self.merge_commit = pr_dict["merge_commit"]
-                if "links" in pr_dict["merge_commit"] and "self" in pr_dict["merge_commit"]["links"] and \
-                        "href" in pr_dict["merge_commit"]["links"]["self"]:
-                    self.merge_commit_url = pr_dict["merge_commit"]["links"]["self"]["href"]
-
-            if self.pr_list is not None:
-                self.pr_list.add(self)
+            get = pr_dict.get
+            self.title = get("title")
+            self.id = get("id")
+            self.created_on_str = get("created_on")
+            self.created_on_dt = parse_timestamp(self.created_on_str) if self.created_on_str is not None else None
+            self.updated_on = get("updated_on")
+            self.updated_on_dt = parse_timestamp(self.updated_on) if self.updated_on is not None else None
+            self.description = get("description")
+            self.state = get("state")
+            self.author = intern_string((get("author") or EMPTY_DICT).get("display_name"))
+
+            source = get("source") or EMPTY_DICT
+            self.source_branch = intern_string((source.get("branch") or EMPTY_DICT).get("name"))
+            source_commit = source.get("commit") or EMPTY_DICT
+            self.source_commit_hash = source_commit.get("hash")
+            self.source_commit_url = get_href(source_commit.get("links"), "self")
+            destination = get("destination") or EMPTY_DICT
+            self.destination_branch = intern_string((destination.get("branch") or EMPTY_DICT).get("name"))
+            destination_commit = destination.get("commit") or EMPTY_DICT
+            self.destination_commit_hash = destination_commit.get("hash")
+            self.destination_commit_url = get_href(destination_commit.get("links"), "self")
+
+            links = get("links") or EMPTY_DICT
+            self.url = get_href(links, "self")
+            # The commits related to the pull request are fetched separately by PullRequestCommitFetcher
+            self.commits_url = get_href(links, "commits")
+            # Followed by the enrichment stage; every PR also serves them under its own URL
+            self.diffstat_url = get_href(links, "diffstat") or (f"{self.url}/diffstat" if self.url else None)
+            self.activity_url = get_href(links, "activity") or (f"{self.url}/activity" if self.url else None)
+            self.statuses_url = get_href(links, "statuses") or (f"{self.url}/statuses" if self.url else None)
+            merge_commit = get("merge_commit") or EMPTY_DICT
+            # Bitbucket abbreviates the merge commit hash to 12 characters
+            self.merge_commit_hash = merge_commit.get("hash")
+            self.merge_commit_url = get_href(merge_commit.get("links"), "self")
+            # Sub-dicts of the payload are only kept along with the raw JSON
+            self.links = get("links") if workspace.keep_raw_json else None
+            self.merge_commit = get("merge_commit") if workspace.keep_raw_json else None
+
+            self.jira_id = None
+            if require_jira_issue_id_in_commit_message:
+                self.jira_id = workspace.jira_key_extractor.find(self.title)
+                if self.jira_id is None and self.source_branch is not None and "-" in self.source_branch:
+                    self.jira_id = workspace.jira_key_extractor.find(self.source_branch)
+            self.is_valid = True
 
-        except (IndexError, KeyError, TypeError) as e:
+        except (AttributeError, IndexError, KeyError, TypeError, ValueError) as e:
             print(f"Exception in PullRequest {e}")
             print(traceback.format_exc())
             print(f"PullRequest: {pr_dict}")
-            print(f"Merge Commit {self.merge_commit}")
+            for name in self.__slots__:
+                if not hasattr(self, name):
+                    setattr(self, name, None)
+
+    def get_commits_cache_policy(self):
+        # The commits of a merged PR never change, so its pages can be cached indefinitely
+        return CACHE_IMMUTABLE if self.state == "MERGED" else CACHE_TTL
+
+    def fetch_commit_dicts(self):
+        # Runs on a PullRequestCommitFetcher worker thread: only network I/O and JSON decoding happen here
+        pr_commit_dicts = []
+        if self.commits_url is None or self.commits_unchanged:
+            return pr_commit_dicts
+
+        commits_cache_policy = self.get_commits_cache_policy()
+        url = self.workspace.get_list_url(self.commits_url, "commits")
+        journal_key = f"{self.repo.full_name}#{self.id}"
+        if self.journal is not None and self.journal.get_commit_progress(journal_key) is not None:
+            # Resume this PR's commit paging where the interrupted run stopped
+            pr_commit_dicts, url = self.journal.get_commit_progress(journal_key)
+            pr_commit_dicts = list(pr_commit_dicts)
+            if url is None:
+                return pr_commit_dicts
+        has_more_pages = True
+        pagenum = 0
+        while has_more_pages:
+            pagenum = pagenum + 1
+            # print(f"get PR commits page {pagenum} url={url}")
+
+            pr_commits_response = self.workspace.transport.get_json(url, cache_policy=commits_cache_policy)
+            if pr_commits_response is not None:
+
+                try:
+                    if "values" in pr_commits_response:
+                        pr_commit_dicts.extend(pr_commits_response["values"])
+
+                except (IndexError, KeyError, TypeError):
+                    print(f"get_pr_commits has no values in returned json {pr_commits_response}")
+
+                if "next" not in pr_commits_response:
+                    has_more_pages = False
+                else:
+                    url = pr_commits_response["next"]
+                if self.journal is not None:
+                    self.journal.record_commit_page(journal_key, pr_commits_response.get("values", []),
+                                                    url if has_more_pages else None)
+            else:
+                # Non-retryable failure: stop paging instead of re-requesting the same URL
+                has_more_pages = False
+        return pr_commit_dicts
+
+    def fetch_enrichment_values(self, kind):
+        # Runs on a PullRequestEnrichmentFetcher worker thread: all pages of one enrichment endpoint, or None if any
+        # page failed. A merged PR's diffstat is cached like its commit pages; approvals, comments and builds can
+        # still change after the merge, so activity and statuses are always revalidated.
+        url = getattr(self, f"{kind}_url")
+        if url is None:
+            return None
+        values = []
+        cache_policy = self.get_commits_cache_policy() if kind == ENRICHMENT_DIFFSTAT else CACHE_REVALIDATE
+        url = self.workspace.get_list_url(url, kind)
+        while url is not None:
+            response = self.workspace.transport.get_json(url, cache_policy=cache_policy)
+            if response is None:
+                return None
+            values.extend(response.get("values", []))
+            url = response.get("next")
+        return values
+
+    def add_enrichment(self, results):
+        # results are [(kind, values or None)] from fetch_enrichment_values
+        with self.workspace.instrumentation.stage("parse_enrichment"):
+            self.enrichment = PullRequestEnrichment()
+            for kind, values in results:
+                if values is None:
+                    continue
+                if kind == ENRICHMENT_DIFFSTAT:
+                    self.enrichment.add_diffstat(values)
+                elif kind == ENRICHMENT_ACTIVITY:
+                    self.enrichment.add_activity(values, self.author)
+                elif kind == ENRICHMENT_STATUSES:
+                    self.enrichment.add_statuses(values)
+
+    def add_commits(self, pr_commit_dicts):
+        with self.workspace.instrumentation.stage("parse_commits", count=len(pr_commit_dicts)):
+            for pr_commit_dict in pr_commit_dicts:
+                # print(f"pr_commit_dict {pr_commit_dict}")
+                commit = Commit(self.workspace, project=self.project,
+                                pr=self, pr_commit_dict=pr_commit_dict,
+                                require_jira_issue_id_in_commit_message=self.require_jira_issue_id_in_commit_message)
+                self.pr_commits_list.append(commit)
 
     def get_commits(self):
         return self.pr_commits_list
 
+    def iter_commits(self):
+        # Streams this PR's commits page by page without keeping them on the PR
+        url = self.workspace.get_list_url(self.commits_url, "commits") if self.commits_url is not None else None
+        while url is not None:
+            pr_commits_response = self.workspace.transport.get_json(url, cache_policy=self.get_commits_cache_policy())
+            if pr_commits_response is None:
+                break
+            for pr_commit_dict in pr_commits_response.get("values", []):
+                yield Commit(self.workspace, project=self.project, pr=self, pr_commit_dict=pr_commit_dict,
+                             require_jira_issue_id_in_commit_message=self.require_jira_issue_id_in_commit_message)
+            url = pr_commits_response.get("next")
+
     def to_dict(self):
         return {
             "type": "PR",
@@ -621,45 +1472,45 @@ class PullRequest:
             "state": self.state,
             "source_branch": self.source_branch,
             "destination_branch": self.destination_branch,
-            "jira_id": self.jira_id
+            "jira_id": self.jira_id,
+            "merge_commit_hash": self.merge_commit_hash
         }
 
 
 class Commit:
+    # Slots instead of a per-instance __dict__: commits are the most numerous objects a crawl builds
+    __slots__ = ["workspace", "project", "pr", "pr_commit_dict", "date", "date_utc", "datetime", "message", "hash",
+                 "has_jira_id", "jira_id", "author", "is_valid"]
+
     def __init__(self, workspace, project, pr, pr_commit_dict, require_jira_issue_id_in_commit_message=False):
         self.workspace = workspace
         self.project = project
         self.pr = pr
-        self.pr_commit_dict = pr_commit_dict
+        self.pr_commit_dict = pr_commit_dict if workspace.keep_raw_json else None
         self.date = None
+        self.date_utc = None
+        self.datetime = None
         self.message = None
         self.hash = None
         self.has_jira_id = False
         self.jira_id = None
         self.author = None
-        self.commit_list = workspace.commit_list
+        self.is_valid = False
 
         try:
             self.date_utc = pr_commit_dict["date"]
-            self.datetime = datetime.strptime(
-                self.date_utc, '%Y-%m-%dT%H:%M:%S%z')
+            self.datetime = parse_timestamp(self.date_utc)
             self.message = pr_commit_dict["message"]
-            # print(f"Commit {self.message}")
             self.hash = pr_commit_dict["hash"]
-            self.author = pr_commit_dict["author"]["user"]["display_name"]
-            # print(f"PR Commit {self.date} {self.message}")
+            self.author = intern_string(pr_commit_dict["author"]["user"]["display_name"])
             if require_jira_issue_id_in_commit_message:
-                jira_id = find_jira_id(self.message)
-                # print(f"find_jira_string {has_jira_id}")
-                if jira_id is not None:
-                    self.has_jira_id = True
-                    self.jira_id = jira_id
-            if self.commit_list is not None:
-                self.commit_list.add(self)
+                self.jira_id = workspace.jira_key_extractor.find(self.message)
+                self.has_jira_id = self.jira_id is not None
+            self.is_valid = True
 
-        except (IndexError, KeyError, TypeError) as e:
+        except (IndexError, KeyError, TypeError, ValueError) as e:
             print(f"Exception {e}")
-            print(f"Commit: {self.pr_commit_dict}")
+            print(f"Commit: {pr_commit_dict}")
 
     def to_dict(self):
         return {"type": "Commit",
@@ -674,5 +1525,5 @@ class Commit:
                 "pr_id": self.pr.id,
                 "source_branch": self.pr.source_branch,
                 "destination_branch": self.pr.destination_branch,
-                "is_deploy_repo": (self.pr.repo.name in self.workspace.default_deploy_repo_list)
+                "is_deploy_repo": (self.pr.repo.name in self.workspace.deploy_repo_names)
                 }
@@ -0,0 +1,147 @@
+import sqlite3
+import threading
+import time
+
+# Cache policies for BbTransport.get_json
+CACHE_IMMUTABLE = "immutable"  # never expires (e.g. commit pages of merged PRs)
+CACHE_TTL = "ttl"  # served from cache until ttl_seconds old, then revalidated (e.g. repository listings)
+CACHE_REVALIDATE = "revalidate"  # always sent as a conditional request when an ETag/Last-Modified is known
+
+DEFAULT_CACHE_TTL_SECONDS = 3600
+DEFAULT_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+
+class ResponseCache:
+    def __init__(self, path, ttl_seconds=DEFAULT_CACHE_TTL_SECONDS, max_bytes=DEFAULT_CACHE_MAX_BYTES):
+        # SQLite-backed response store keyed by URL, evicted least-recently-used first once max_bytes is exceeded.
+        # The database is opened on first use, so constructing the cache touches nothing on disk.
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+        self.connection = None
+        self.total_bytes = 0
+
+    def get_connection(self):
+        # Caller holds self.lock
+        if self.connection is None:
+            self.connection = self.connect()
+        return self.connection
+
+    def connect(self):
+        connection = sqlite3.connect(self.path, check_same_thread=False)
+        connection.execute("""CREATE TABLE IF NOT EXISTS responses (
+                                       url TEXT PRIMARY KEY,
+                                       body BLOB NOT NULL,
+                                       etag TEXT,
+                                       last_modified TEXT,
+                                       immutable INTEGER NOT NULL,
+                                       stored_at REAL NOT NULL,
+                                       last_access REAL NOT NULL,
+                                       size INTEGER NOT NULL)""")
+        connection.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+        connection.commit()
+        self.total_bytes = connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        return connection
+
+    def lookup(self, url):
+        with self.lock:
+            connection = self.get_connection()
+            row = connection.execute(
+                "SELECT body, etag, last_modified, immutable, stored_at FROM responses WHERE url = ?", (url,)).fetchone()
+            if row is None:
+                return None
+            connection.execute("UPDATE responses SET last_access = ? WHERE url = ?", (time.time(), url))
+            connection.commit()
+        return {"body": row[0], "etag": row[1], "last_modified": row[2], "immutable": bool(row[3]),
+                "stored_at": row[4]}
+
+    def is_fresh(self, entry, policy):
+        # Only an entry stored as immutable is fresh for good. An entry stored under another policy, e.g. a PR's
+        # commits page cached while the PR was open, is revalidated before the immutable policy trusts it.
+        if entry["immutable"]:
+            return True
+        if policy == CACHE_TTL:
+            return time.time() - entry["stored_at"] < self.ttl_seconds
+        return False
+
+    def conditional_headers(self, entry):
+        headers = {}
+        if entry["etag"] is not None:
+            headers["If-None-Match"] = entry["etag"]
+        if entry["last_modified"] is not None:
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def store(self, url, body, etag=None, last_modified=None, policy=CACHE_TTL):
+        # Revalidate-only responses are not worth storing unless the server gave us a validator to send back
+        if policy == CACHE_REVALIDATE and etag is None and last_modified is None:
+            return
+        size = len(body)
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        with self.lock:
+            connection = self.get_connection()
+            previous = connection.execute("SELECT size FROM responses WHERE url = ?", (url,)).fetchone()
+            if previous is not None:
+                self.total_bytes -= previous[0]
+            connection.execute(
+                "INSERT OR REPLACE INTO responses (url, body, etag, last_modified, immutable, stored_at, last_access, size) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (url, body, etag, last_modified, int(policy == CACHE_IMMUTABLE), now, now, size))
+            self.total_bytes += size
+            self.evict()
+            connection.commit()
+
+    def touch(self, url, policy=CACHE_TTL):
+        # A 304 Not Modified restarts the entry's TTL; revalidated under the immutable policy, it becomes immutable
+        with self.lock:
+            connection = self.get_connection()
+            connection.execute("UPDATE responses SET stored_at = ?, last_access = ?, immutable = MAX(immutable, ?) "
+                               "WHERE url = ?", (time.time(), time.time(), int(policy == CACHE_IMMUTABLE), url))
+            connection.commit()
+
+    def evict(self):
+        # Caller holds self.lock
+        while self.total_bytes > self.max_bytes:
+            rows = self.connection.execute(
+                "SELECT url, size FROM responses ORDER BY last_access LIMIT 100").fetchall()
+            if len(rows) == 0:
+                self.total_bytes = 0
+                break
+            for url, size in rows:
+                self.connection.execute("DELETE FROM responses WHERE url = ?", (url,))
+                self.total_bytes -= size
+                self.evictions += 1
+                if self.total_bytes <= self.max_bytes:
+                    break
+
+    def record_hit(self, revalidated=False):
+        with self.lock:
+            self.hits += 1
+            if revalidated:
+                self.revalidations += 1
+
+    def record_miss(self):
+        with self.lock:
+            self.misses += 1
+
+    def stats(self):
+        requests_seen = self.hits + self.misses
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "revalidations": self.revalidations,
+                "evictions": self.evictions,
+                "hit_ratio": (self.hits / requests_seen) if requests_seen > 0 else 0.0,
+                "total_bytes": self.total_bytes}
+
+    def close(self):
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
@@ -0,0 +1,149 @@
+import argparse
+import contextlib
+import sys
+from itertools import islice
+
+from src.pybitbucket.bitbucket import Bitbucket
+from src.pybitbucket.scheduler import BitbucketRequestError
+
+# Command line entry point: python -m src.pybitbucket <command>. repos, prs and commits make only the requests they
+# need and never import pandas; sync runs the full crawl and export that Bitbucket.crawl() does; export writes data
+# already in the datastore without crawling. Progress messages go to stderr so stdout stays parseable
+# (tab-separated, with a header row).
+DEFAULT_PROPERTIES = "properties.properties"
+DEFAULT_SECRET_PROPERTIES = "secretproperties.properties"
+
+
+def write_row(output, values):
+    output.write("\t".join("" if value is None else str(value) for value in values) + "\n")
+
+
+def get_workspace(bitbucket, args):
+    workspace = bitbucket.get_workspace(args.workspace or bitbucket.workspace_id)
+    if workspace is None:
+        raise ValueError(f"Workspace {args.workspace or bitbucket.workspace_id} could not be loaded")
+    return workspace
+
+
+def get_repository(bitbucket, args):
+    repo = get_workspace(bitbucket, args).get_repository(args.repo)
+    if repo is None:
+        raise ValueError(f"Repository {args.repo} could not be loaded")
+    return repo
+
+
+def run_repos(bitbucket, args, output):
+    workspace = get_workspace(bitbucket, args)
+    write_row(output, ["project", "repo", "full_name"])
+    for project in workspace.discover(args.project):
+        for repo in project.get_repos().values():
+            write_row(output, [project.key, repo.slug, repo.full_name])
+    workspace.commit_fetcher.shutdown()
+
+
+def run_prs(bitbucket, args, output):
+    repo = get_repository(bitbucket, args)
+    if args.id is not None:
+        pr = repo.get_pull_request(args.id, bitbucket.require_jira_issue_id_in_commit_message)
+        if pr is None:
+            raise ValueError(f"Pull request {args.repo}#{args.id} could not be loaded")
+        prs = [pr]
+    else:
+        prs = islice(repo.list_pull_requests(args.since, args.state or ["MERGED"],
+                                             bitbucket.require_jira_issue_id_in_commit_message), args.limit)
+    write_row(output, ["pr_id", "state", "author", "updated_on", "source_branch", "destination_branch", "jira_id",
+                       "title"])
+    for pr in prs:
+        write_row(output, [pr.id, pr.state, pr.author, pr.updated_on, pr.source_branch, pr.destination_branch,
+                           pr.jira_id, pr.title])
+
+
+def run_commits(bitbucket, args, output):
+    repo = get_repository(bitbucket, args)
+    pr = repo.get_pull_request(args.pr, bitbucket.require_jira_issue_id_in_commit_message)
+    if pr is None:
+        raise ValueError(f"Pull request {args.repo}#{args.pr} could not be loaded")
+    write_row(output, ["hash", "date", "author", "jira_id", "message"])
+    for commit in islice(pr.iter_commits(), args.limit):
+        message = commit.message.splitlines()[0] if commit.message else commit.message
+        write_row(output, [commit.hash, commit.date_utc, commit.author, commit.jira_id, message])
+
+
+def run_sync(bitbucket, args, output):
+    df_prs, df_commits = bitbucket.crawl()
+    write_row(output, ["prs", "commits"])
+    write_row(output, [len(df_prs), len(df_commits)])
+
+
+def run_export(bitbucket, args, output):
+    from src.pybitbucket.export import get_exporter
+    from src.pybitbucket.sync import PR_KEY_COLUMNS
+
+    datastore = bitbucket.get_datastore()
+    df_prs = datastore.query_pull_requests(project=args.project, repo=args.repo, updated_since=args.since)
+    df_commits = datastore.query_commits(project=args.project, repo=args.repo)
+    # Only the commits of the exported PRs
+    df_commits = df_commits.merge(df_prs[PR_KEY_COLUMNS], on=PR_KEY_COLUMNS)
+    exporter = get_exporter(args.format or bitbucket.export_format,
+                            prs_file=args.prs_file or bitbucket.prs_file,
+                            commits_file=args.commits_file or bitbucket.commits_file,
+                            export_dir=args.export_dir or bitbucket.export_dir)
+    exporter.write(df_prs, df_commits)
+    exporter.close()
+    write_row(output, ["prs", "commits"])
+    write_row(output, [len(df_prs), len(df_commits)])
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(prog="python -m src.pybitbucket",
+                                     description="Bitbucket Cloud PR and commit crawler")
+    parser.add_argument("--properties", default=DEFAULT_PROPERTIES)
+    parser.add_argument("--secret-properties", default=DEFAULT_SECRET_PROPERTIES)
+    parser.add_argument("--workspace", default=None, help="workspace id (default: the first configured)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    repos = commands.add_parser("repos", help="list the repositories of the configured (or given) projects")
+    repos.add_argument("--project", action="append", default=None, help="project key; may be repeated")
+    repos.set_defaults(run=run_repos)
+
+    prs = commands.add_parser("prs", help="list a repository's pull requests, or show one")
+    prs.add_argument("repo", help="repository slug")
+    prs.add_argument("--id", type=int, default=None, help="show only this pull request")
+    prs.add_argument("--state", action="append", default=None,
+                     help="OPEN, MERGED, DECLINED or SUPERSEDED; may be repeated (default: MERGED)")
+    prs.add_argument("--since", default=None, help="only PRs updated after this ISO 8601 timestamp")
+    prs.add_argument("--limit", type=int, default=None)
+    prs.set_defaults(run=run_prs)
+
+    commits = commands.add_parser("commits", help="list the commits of one pull request")
+    commits.add_argument("repo", help="repository slug")
+    commits.add_argument("pr", type=int, help="pull request id")
+    commits.add_argument("--limit", type=int, default=None)
+    commits.set_defaults(run=run_commits)
+
+    sync = commands.add_parser("sync", help="crawl all configured workspaces and write the configured outputs")
+    sync.set_defaults(run=run_sync)
+
+    export = commands.add_parser("export", help="write PRs and commits from the datastore without crawling")
+    export.add_argument("--project", default=None, help="project name")
+    export.add_argument("--repo", default=None)
+    export.add_argument("--since", default=None, help="only PRs updated at or after this time")
+    export.add_argument("--format", default=None, choices=["csv", "parquet", "arrow"])
+    export.add_argument("--prs-file", default=None)
+    export.add_argument("--commits-file", default=None)
+    export.add_argument("--export-dir", default=None)
+    export.set_defaults(run=run_export)
+    return parser
+
+
+def main(argv=None):
+    args = get_parser().parse_args(argv)
+    output = sys.stdout
+    with contextlib.redirect_stdout(sys.stderr):
+        try:
+            bitbucket = Bitbucket({"properties": args.properties, "secret-properties": args.secret_properties})
+            args.run(bitbucket, args, output)
+        except (ValueError, BitbucketRequestError) as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return 1
+    return 0
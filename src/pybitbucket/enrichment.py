@@ -0,0 +1,116 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from src.pybitbucket.records import INT, DATETIME, CATEGORY
+
+# Optional per-PR enrichment stage: each PR's diffstat, activity and build statuses, fetched from the links of its
+# listing payload on a bounded pool while its commits are fetched. Enabled with the [enrichment] section.
+ENRICHMENT_DIFFSTAT = "diffstat"
+ENRICHMENT_ACTIVITY = "activity"
+ENRICHMENT_STATUSES = "statuses"
+ENRICHMENT_KINDS = [ENRICHMENT_DIFFSTAT, ENRICHMENT_ACTIVITY, ENRICHMENT_STATUSES]
+DEFAULT_ENRICHMENT_CONCURRENCY = 8
+# The fields the extractors below read, requested with fields= like bitbucket.API_FIELDS
+ENRICHMENT_API_FIELDS = {
+    ENRICHMENT_DIFFSTAT: ["status", "lines_added", "lines_removed"],
+    ENRICHMENT_ACTIVITY: ["approval.date", "approval.user.display_name", "comment.created_on",
+                          "comment.user.display_name", "changes_requested.date",
+                          "changes_requested.user.display_name"],
+    ENRICHMENT_STATUSES: ["key", "state"]
+}
+# PR record columns added by the stage, in PullRequestEnrichment.to_values() order. Each stays empty when its kind is
+# not enabled or its fetch failed.
+ENRICHMENT_SCHEMA = [("lines_added", INT),
+                     ("lines_removed", INT),
+                     ("files_changed", INT),
+                     ("approvals", INT),
+                     ("comments", INT),
+                     ("first_review_datetime", DATETIME),  # first comment, approval or change request by a reviewer
+                     ("first_approval_datetime", DATETIME),
+                     ("minutes_to_first_approval", INT),  # from the PR's creation
+                     ("build_status", CATEGORY),
+                     ("builds", INT)]
+# The PR's overall build status is the first of these that any of its statuses has
+BUILD_STATUS_PRIORITY = ["FAILED", "STOPPED", "INPROGRESS", "SUCCESSFUL"]
+
+
+def parse_date(value):
+    return datetime.fromisoformat(value) if value is not None else None
+
+
+def get_user_name(event):
+    return (event.get("user") or {}).get("display_name")
+
+
+class PullRequestEnrichment:
+    __slots__ = ["lines_added", "lines_removed", "files_changed", "approvals", "comments", "first_review_dt",
+                 "first_approval_dt", "build_status", "builds"]
+
+    def __init__(self):
+        for name in self.__slots__:
+            setattr(self, name, None)
+
+    def add_diffstat(self, values):
+        # One entry per changed file; binary files carry no line counts
+        self.files_changed = len(values)
+        self.lines_added = sum(value.get("lines_added") or 0 for value in values)
+        self.lines_removed = sum(value.get("lines_removed") or 0 for value in values)
+
+    def add_activity(self, values, author):
+        # Review events by anyone but the PR's author; approvals are counted once per approver
+        approvers = set()
+        self.comments = 0
+        for value in values:
+            approval = value.get("approval")
+            if approval is not None and get_user_name(approval) != author:
+                approvers.add(get_user_name(approval))
+                self.first_approval_dt = self.get_first(self.first_approval_dt, parse_date(approval.get("date")))
+                self.first_review_dt = self.get_first(self.first_review_dt, parse_date(approval.get("date")))
+            comment = value.get("comment")
+            if comment is not None:
+                self.comments += 1
+                if get_user_name(comment) != author:
+                    self.first_review_dt = self.get_first(self.first_review_dt, parse_date(comment.get("created_on")))
+            changes_requested = value.get("changes_requested")
+            if changes_requested is not None and get_user_name(changes_requested) != author:
+                self.first_review_dt = self.get_first(self.first_review_dt, parse_date(changes_requested.get("date")))
+        self.approvals = len(approvers)
+
+    def add_statuses(self, values):
+        self.builds = len(values)
+        states = set(value.get("state") for value in values)
+        self.build_status = next((state for state in BUILD_STATUS_PRIORITY if state in states), None)
+
+    @staticmethod
+    def get_first(current, candidate):
+        if candidate is None:
+            return current
+        return candidate if current is None or candidate < current else current
+
+    def to_values(self, created_on_dt):
+        minutes_to_first_approval = None
+        if self.first_approval_dt is not None and created_on_dt is not None:
+            minutes_to_first_approval = int((self.first_approval_dt - created_on_dt).total_seconds() // 60)
+        return (self.lines_added, self.lines_removed, self.files_changed, self.approvals, self.comments,
+                self.first_review_dt, self.first_approval_dt, minutes_to_first_approval, self.build_status,
+                self.builds)
+
+
+class PullRequestEnrichmentFetcher:
+    def __init__(self, kinds=ENRICHMENT_KINDS, max_concurrency=DEFAULT_ENRICHMENT_CONCURRENCY):
+        # Its own pool, so enrichment requests never hold up the commit fetches that gate each PR's records
+        self.kinds = list(kinds)
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.executor = None
+
+    def submit(self, pr):
+        # One fetch per enabled kind; returns [(kind, future)]
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.max_concurrency,
+                                               thread_name_prefix="pybitbucket-pr-enrichment")
+        return [(kind, self.executor.submit(pr.fetch_enrichment_values, kind)) for kind in self.kinds]
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
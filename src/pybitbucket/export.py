@@ -0,0 +1,194 @@
+import glob
+import os
+import uuid
+
+from src.pybitbucket.records import CATEGORY, STRING, INT, BOOL, DATETIME
+from src.pybitbucket.sync import is_pull_request_row
+
+EXPORT_CSV = "csv"
+EXPORT_PARQUET = "parquet"
+EXPORT_ARROW = "arrow"
+PARTITION_COLUMNS = ["project", "repo", "month"]
+# Normalized commit output: one row per unique commit (with the project/repo of the first PR that listed it), plus one
+# pr_commits row per (PR, commit) membership
+UNIQUE_COMMIT_COLUMNS = ["type", "hash", "jira_id", "created_datetime", "message", "project", "repo", "workspace",
+                         "author"]
+PR_COMMIT_COLUMNS = ["workspace", "project", "repo", "pr_id", "hash", "created_datetime", "source_branch",
+                     "destination_branch", "is_deploy_repo"]
+DATASET_KINDS = ["prs", "commits", "pr_commits"]
+# Dataset files holding rows of PRs in a volatile state (and their commit rows), replaced by every run
+VOLATILE_BASENAME = "volatile-part"
+
+
+class CsvExporter:
+    def __init__(self, prs_file, commits_file, append=False, pr_commits_file=None):
+        self.files = {"prs": prs_file, "commits": commits_file, "pr_commits": pr_commits_file}
+        self.append = append
+        self.written_kinds = set()
+
+    def write_batch(self, kind, df):
+        path = self.files[kind]
+        if path is None or len(df) == 0:
+            return
+        # A full (non-append) export replaces the file on its first batch; every later batch is appended
+        append = self.append or kind in self.written_kinds
+        mode = "a" if append and os.path.exists(path) else "w"
+        df.to_csv(path, mode=mode, header=(mode == "w"), index=False)
+        self.written_kinds.add(kind)
+
+    def write(self, df_prs, df_commits, df_pr_commits=None):
+        self.write_batch("prs", df_prs)
+        self.write_batch("commits", df_commits)
+        if df_pr_commits is not None:
+            self.write_batch("pr_commits", df_pr_commits)
+
+    def close(self):
+        pass
+
+
+class DatasetExporter:
+    def __init__(self, directory, file_format=EXPORT_PARQUET, partition_columns=PARTITION_COLUMNS, append=False,
+                 volatile_states=()):
+        # Writes PRs and commits as separate Parquet (or Arrow IPC) datasets under directory/prs and directory/commits
+        # (and directory/pr_commits for normalized commits), hive-partitioned by project/repo/month. Each batch is a
+        # new file, so batches and incremental runs append. Rows of PRs in volatile_states and their commit rows go
+        # to volatile-part files instead, which the first write deletes: the run lists every such PR again.
+        try:
+            import pyarrow
+            import pyarrow.dataset
+        except ImportError as e:
+            raise ImportError(f"export_format={file_format} requires pyarrow (pip install pyarrow)") from e
+        self.pa = pyarrow
+        self.ds = pyarrow.dataset
+        self.directory = directory
+        self.file_format = "ipc" if file_format == EXPORT_ARROW else "parquet"
+        self.extension = "arrow" if file_format == EXPORT_ARROW else "parquet"
+        self.partition_columns = partition_columns
+        self.append = append
+        self.volatile_states = list(volatile_states)
+        self.written_kinds = set()
+        self.volatile_files_deleted = False
+
+    def write_batch(self, kind, df, volatile=False):
+        if len(df) == 0:
+            return
+        df = df.copy()
+        if "month" in self.partition_columns:
+            df["month"] = df["created_datetime"].dt.strftime("%Y-%m")
+        for column in self.partition_columns:
+            df[column] = df[column].astype(str)
+        table = self.pa.Table.from_pandas(df, schema=self.get_schema(df), preserve_index=False)
+        # A full (non-append) export replaces the partitions it writes, the first time each dataset is written
+        replace = not self.append and kind not in self.written_kinds
+        self.ds.write_dataset(table, os.path.join(self.directory, kind), format=self.file_format,
+                              partitioning=self.partition_columns, partitioning_flavor="hive",
+                              basename_template=f"{VOLATILE_BASENAME if volatile else 'part'}-{uuid.uuid4().hex}-"
+                                                f"{{i}}.{self.extension}",
+                              existing_data_behavior="delete_matching" if replace else "overwrite_or_ignore")
+        self.written_kinds.add(kind)
+
+    def get_schema(self, df):
+        # One fixed Arrow type per record column kind, so every batch and every incremental run writes the same schema.
+        # Inferred types would make an all-None column (merge_commit_hash of OPEN PRs) null, and size category indices
+        # by category count, and a dataset whose files disagree can no longer be read.
+        from src.pybitbucket.bitbucket import PullRequestList, CommitList
+        from src.pybitbucket.enrichment import ENRICHMENT_SCHEMA
+
+        kinds = dict(PullRequestList.schema + ENRICHMENT_SCHEMA + CommitList.schema)
+        types = {CATEGORY: self.pa.dictionary(self.pa.int32(), self.pa.string()), STRING: self.pa.string(),
+                 INT: self.pa.int64(), BOOL: self.pa.bool_(), DATETIME: self.pa.timestamp("s")}
+        inferred = self.pa.Schema.from_pandas(df, preserve_index=False)
+        fields = []
+        for field in inferred:
+            if field.name in self.partition_columns:
+                fields.append(self.pa.field(field.name, self.pa.string()))
+            elif field.name in kinds:
+                fields.append(self.pa.field(field.name, types[kinds[field.name]]))
+            else:
+                fields.append(field)
+        return self.pa.schema(fields)
+
+    def write(self, df_prs, df_commits, df_pr_commits=None):
+        if len(self.volatile_states) == 0:
+            self.write_batch("prs", df_prs)
+            self.write_batch("commits", df_commits)
+            if df_pr_commits is not None:
+                self.write_batch("pr_commits", df_pr_commits)
+            return
+        if not self.volatile_files_deleted:
+            self.delete_volatile_files()
+        df_volatile_prs = df_prs[df_prs["state"].isin(self.volatile_states)]
+        volatile_prs = df_prs.index.isin(df_volatile_prs.index)
+        self.write_batch("prs", df_prs[~volatile_prs])
+        self.write_batch("prs", df_volatile_prs, volatile=True)
+        if df_pr_commits is None:
+            volatile_commits = is_pull_request_row(df_commits, df_volatile_prs)
+        else:
+            volatile_links = is_pull_request_row(df_pr_commits, df_volatile_prs)
+            self.write_batch("pr_commits", df_pr_commits[~volatile_links])
+            self.write_batch("pr_commits", df_pr_commits[volatile_links], volatile=True)
+            # A unique commit is volatile only if no closed PR of the batch lists it
+            volatile_hashes = set(df_pr_commits["hash"][volatile_links]) - set(df_pr_commits["hash"][~volatile_links])
+            volatile_commits = df_commits["hash"].isin(volatile_hashes).to_numpy()
+        self.write_batch("commits", df_commits[~volatile_commits])
+        self.write_batch("commits", df_commits[volatile_commits], volatile=True)
+
+    def delete_volatile_files(self):
+        # The previous run's volatile rows; this run rewrites every PR still in a volatile state
+        for kind in DATASET_KINDS:
+            for path in glob.glob(os.path.join(self.directory, kind, "**", f"{VOLATILE_BASENAME}-*"), recursive=True):
+                os.remove(path)
+        self.volatile_files_deleted = True
+
+    def close(self):
+        pass
+
+
+def get_exporter(export_format=EXPORT_CSV, prs_file=None, commits_file=None, export_dir="export", append=False,
+                 pr_commits_file=None, volatile_states=()):
+    # volatile_states only applies to dataset exports; incremental CSV exports are merged before they are written
+    if export_format == EXPORT_CSV:
+        return CsvExporter(prs_file, commits_file, append=append, pr_commits_file=pr_commits_file)
+    if export_format in (EXPORT_PARQUET, EXPORT_ARROW):
+        return DatasetExporter(export_dir, file_format=export_format, append=append, volatile_states=volatile_states)
+    raise ValueError(f"Unknown export_format {export_format}, expected one of "
+                     f"{EXPORT_CSV}, {EXPORT_PARQUET}, {EXPORT_ARROW}")
+
+
+def normalize_commits(df_commits):
+    # Splits the one-row-per-(PR, commit) frame into its unique commits, keyed by (workspace, hash), and the PR
+    # membership edges
+    df_unique = df_commits.drop_duplicates(subset=["workspace", "hash"])[UNIQUE_COMMIT_COLUMNS]
+    return df_unique.reset_index(drop=True), df_commits[PR_COMMIT_COLUMNS].reset_index(drop=True)
+
+
+def denormalize_commits(df_unique, df_pr_commits, columns):
+    # The inverse of normalize_commits: one row per (PR, commit) edge, in the given column order
+    commit_columns = [column for column in UNIQUE_COMMIT_COLUMNS if column not in PR_COMMIT_COLUMNS]
+    df = df_pr_commits.merge(df_unique[["workspace", "hash"] + commit_columns], on=["workspace", "hash"],
+                             how="left", sort=False)
+    return df[columns]
+
+
+def export_stream(pull_requests, exporter, batch_size=500, default_deploy_repo_list=[], enrichment=False):
+    # Writes PRs (and their commits) from a streaming iterator such as Workspace.iter_pull_requests() in batches of
+    # batch_size PRs, so nothing beyond the current batch is held in memory. Returns the number of PRs written.
+    # enrichment adds the enrichment columns, for PRs from a workspace with an enrichment stage.
+    from src.pybitbucket.bitbucket import PullRequestList, CommitList
+
+    pr_list = PullRequestList(enrichment)
+    commit_list = CommitList(default_deploy_repo_list)
+    pr_count = 0
+    for pr in pull_requests:
+        if pr.is_valid:
+            pr_list.add(pr)
+            pr_count = pr_count + 1
+        for commit in pr.get_commits():
+            if commit.is_valid:
+                commit_list.add(commit)
+        if len(pr_list) >= batch_size:
+            exporter.write(pr_list.to_dataframe(), commit_list.to_dataframe())
+            pr_list = PullRequestList(enrichment)
+            commit_list = CommitList(default_deploy_repo_list)
+    exporter.write(pr_list.to_dataframe(), commit_list.to_dataframe())
+    return pr_count
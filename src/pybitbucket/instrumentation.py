@@ -0,0 +1,225 @@
+import json
+import threading
+import time
+from urllib.parse import urlsplit
+
+# Upper bounds (milliseconds) of the request latency histogram buckets; the last bucket is open-ended
+LATENCY_BUCKETS_MS = [10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+# Path segments that follow these names are identifiers, replaced by placeholders when grouping URLs by endpoint
+ENDPOINT_PLACEHOLDERS = {
+    "repositories": ["{workspace}", "{repo_slug}"],
+    "workspaces": ["{workspace}"],
+    "projects": ["{project_key}"],
+    "pullrequests": ["{pull_request_id}"],
+    "commit": ["{commit}"],
+    "users": ["{user}"]
+}
+
+
+def get_endpoint(url):
+    # "https://api.bitbucket.org/2.0/repositories/ws/repo/pullrequests/12/commits?page=2" ->
+    # "/2.0/repositories/{workspace}/{repo_slug}/pullrequests/{pull_request_id}/commits"
+    parts = urlsplit(url).path.strip("/").split("/")
+    endpoint = []
+    placeholders = []
+    for part in parts:
+        if len(placeholders) > 0:
+            endpoint.append(placeholders.pop(0))
+        else:
+            endpoint.append(part)
+            placeholders = list(ENDPOINT_PLACEHOLDERS.get(part, []))
+    return "/" + "/".join(endpoint)
+
+
+class EndpointStats:
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.cache_hits = 0
+        self.cache_revalidations = 0
+        self.cache_misses = 0
+        self.bytes_received = 0
+        self.bytes_decoded = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.latency_histogram = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+    def add_request(self, status_code, seconds, bytes_received, bytes_decoded):
+        self.requests += 1
+        if status_code is None or status_code >= 400:
+            self.errors += 1
+        self.bytes_received += bytes_received
+        self.bytes_decoded += bytes_decoded
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        milliseconds = seconds * 1000
+        bucket = 0
+        while bucket < len(LATENCY_BUCKETS_MS) and milliseconds > LATENCY_BUCKETS_MS[bucket]:
+            bucket += 1
+        self.latency_histogram[bucket] += 1
+
+    def percentile_ms(self, fraction):
+        # Upper bound of the histogram bucket holding the given fraction of requests
+        target = fraction * self.requests
+        seen = 0
+        for bucket, count in enumerate(self.latency_histogram):
+            seen += count
+            if count > 0 and seen >= target:
+                return LATENCY_BUCKETS_MS[bucket] if bucket < len(LATENCY_BUCKETS_MS) else None
+        return None
+
+    def to_dict(self):
+        histogram = {f"<={bound}ms": count for bound, count in zip(LATENCY_BUCKETS_MS, self.latency_histogram)}
+        histogram[f">{LATENCY_BUCKETS_MS[-1]}ms"] = self.latency_histogram[-1]
+        return {"requests": self.requests,
+                "errors": self.errors,
+                "retries": self.retries,
+                "cache_hits": self.cache_hits,
+                "cache_revalidations": self.cache_revalidations,
+                "cache_misses": self.cache_misses,
+                "bytes_received": self.bytes_received,
+                "bytes_decoded": self.bytes_decoded,
+                "total_seconds": round(self.total_seconds, 6),
+                "mean_ms": round(self.total_seconds * 1000 / self.requests, 3) if self.requests > 0 else None,
+                "p50_ms": self.percentile_ms(0.5),
+                "p95_ms": self.percentile_ms(0.95),
+                "max_ms": round(self.max_seconds * 1000, 3),
+                "latency_histogram": histogram}
+
+
+class StageTimer:
+    def __init__(self, instrumentation, stage, count):
+        self.instrumentation = instrumentation
+        self.stage = stage
+        self.count = count
+        self.started_at = None
+
+    def __enter__(self):
+        self.started_at = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.instrumentation.add_stage_time(self.stage, time.perf_counter() - self.started_at, self.count)
+        return False
+
+
+class Instrumentation:
+    def __init__(self, hooks=None):
+        # Thread-safe counters for every HTTP call (per endpoint) and every timed processing stage. Hooks are
+        # callables that receive each event as a dict: {"event": "request" | "retry" | "cache" | "stage", ...}.
+        self.hooks = list(hooks) if hooks is not None else []
+        self.endpoints = {}
+        self.stages = {}
+        self.throttled_seconds = 0.0
+        self.started_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+
+    def emit(self, event):
+        for hook in self.hooks:
+            try:
+                hook(event)
+            except Exception as e:
+                print(f"Instrumentation hook {hook} failed: {e}")
+
+    def get_endpoint_stats(self, endpoint):
+        # Caller holds self.lock
+        stats = self.endpoints.get(endpoint)
+        if stats is None:
+            stats = EndpointStats()
+            self.endpoints[endpoint] = stats
+        return stats
+
+    def record_request(self, url, status_code, seconds, bytes_received=0, bytes_decoded=0):
+        endpoint = get_endpoint(url)
+        with self.lock:
+            self.get_endpoint_stats(endpoint).add_request(status_code, seconds, bytes_received, bytes_decoded)
+        if self.hooks:
+            self.emit({"event": "request", "endpoint": endpoint, "url": url, "status_code": status_code,
+                       "seconds": seconds, "bytes_received": bytes_received})
+
+    def record_retry(self, url, status_code, delay_seconds):
+        endpoint = get_endpoint(url)
+        with self.lock:
+            self.get_endpoint_stats(endpoint).retries += 1
+        if self.hooks:
+            self.emit({"event": "retry", "endpoint": endpoint, "url": url, "status_code": status_code,
+                       "delay_seconds": delay_seconds})
+
+    def record_throttle(self, seconds):
+        with self.lock:
+            self.throttled_seconds += seconds
+
+    def record_cache(self, url, result):
+        # result is "hit", "revalidated" or "miss"
+        endpoint = get_endpoint(url)
+        with self.lock:
+            stats = self.get_endpoint_stats(endpoint)
+            if result == "hit":
+                stats.cache_hits += 1
+            elif result == "revalidated":
+                stats.cache_revalidations += 1
+            else:
+                stats.cache_misses += 1
+        if self.hooks:
+            self.emit({"event": "cache", "endpoint": endpoint, "url": url, "result": result})
+
+    def stage(self, stage, count=1):
+        # with instrumentation.stage("json_decode"): ... adds the block's wall-clock time to the stage
+        return StageTimer(self, stage, count)
+
+    def add_stage_time(self, stage, seconds, count=1):
+        with self.lock:
+            stage_stats = self.stages.get(stage)
+            if stage_stats is None:
+                stage_stats = {"calls": 0, "items": 0, "seconds": 0.0}
+                self.stages[stage] = stage_stats
+            stage_stats["calls"] += 1
+            stage_stats["items"] += count
+            stage_stats["seconds"] += seconds
+        if self.hooks:
+            self.emit({"event": "stage", "stage": stage, "seconds": seconds, "items": count})
+
+    def summary(self, extra=None):
+        with self.lock:
+            endpoints = {endpoint: stats.to_dict() for endpoint, stats in sorted(self.endpoints.items())}
+            stages = {stage: {"calls": stats["calls"], "items": stats["items"], "seconds": round(stats["seconds"], 6)}
+                      for stage, stats in self.stages.items()}
+            throttled_seconds = self.throttled_seconds
+        totals = {key: sum(stats[key] for stats in endpoints.values())
+                  for key in ["requests", "errors", "retries", "cache_hits", "cache_revalidations", "cache_misses",
+                              "bytes_received", "bytes_decoded"]}
+        totals["throttled_seconds"] = round(throttled_seconds, 6)
+        summary = {"elapsed_seconds": round(time.monotonic() - self.started_at, 6),
+                   "totals": totals,
+                   "endpoints": endpoints,
+                   "stages": stages}
+        if extra is not None:
+            summary.update(extra)
+        return summary
+
+    def write_json(self, path, extra=None):
+        with open(path, "w") as summary_file:
+            json.dump(self.summary(extra), summary_file, indent=2, default=str)
+
+    def format_summary(self, extra=None):
+        summary = self.summary(extra)
+        totals = summary["totals"]
+        lines = [f"pybitbucket crawl profile: {summary['elapsed_seconds']:.2f}s, {totals['requests']} requests, "
+                 f"{totals['bytes_received'] / 1e6:.2f} MB received, {totals['retries']} retries, "
+                 f"{totals['cache_hits'] + totals['cache_revalidations']} cache hits, "
+                 f"{totals['throttled_seconds']:.1f}s throttled"]
+        width = max([len("endpoint")] + [len(endpoint) for endpoint in summary["endpoints"]])
+        lines.append(f"  {'endpoint':<{width}} {'requests':>8} {'errors':>6} {'mean ms':>8} {'p95 ms':>7} {'MB':>7}")
+        for endpoint, stats in summary["endpoints"].items():
+            p95 = stats["p95_ms"] if stats["p95_ms"] is not None else f">{LATENCY_BUCKETS_MS[-1]}"
+            mean = stats["mean_ms"] if stats["mean_ms"] is not None else 0
+            lines.append(f"  {endpoint:<{width}} {stats['requests']:>8} {stats['errors']:>6} {mean:>8.1f} "
+                         f"{p95:>7} {stats['bytes_received'] / 1e6:>7.2f}")
+        lines.append(f"  {'stage':<40} {'calls':>8} {'items':>9} {'seconds':>9}")
+        for stage, stats in summary["stages"].items():
+            lines.append(f"  {stage:<40} {stats['calls']:>8} {stats['items']:>9} {stats['seconds']:>9.3f}")
+        return "\n".join(lines)
@@ -1,10 +1,67 @@
 import re
 
+# A Jira issue key is a project key (an uppercase letter followed by uppercase letters, digits or underscores) and an
+# issue number, e.g. PROJ-123. A key may not touch another letter or digit, which stops matches inside longer tokens
+# such as "xPROJ-1" or "PROJ-1a", but an underscore or any other separator may border it, as in branches named
+# "feature_PROJ-123" or "PROJ-123_fix".
+JIRA_KEY_REGEX = r"[A-Z][A-Z0-9_]+-\d+"
+KEY_START = r"(?<![A-Za-z0-9])"
+KEY_END = r"(?![A-Za-z0-9])"
+# pyarrow's RE2 kernel has no lookarounds: the bordering characters are matched instead, outside the named group
+ARROW_KEY_START = r"(?:^|[^A-Za-z0-9])"
+ARROW_KEY_END = r"(?:[^A-Za-z0-9]|$)"
 
-def find_jira_id(search_string):
-    pattern = re.compile(r"([0-Z]+\-\d+)")
-    match = pattern.search(search_string)
-    if match is not None:
-        return match.group(1)
-    else:
+
+class JiraKeyExtractor:
+    def __init__(self, project_keys=None):
+        # project_keys restricts matches to known Jira projects, which removes false positives such as "UTF-8"
+        self.project_keys = sorted(set(project_keys), key=len, reverse=True) if project_keys else None
+        if self.project_keys is None:
+            key_regex = JIRA_KEY_REGEX
+        else:
+            key_regex = "(?:" + "|".join(re.escape(key) for key in self.project_keys) + r")-\d+"
+        self.regex = f"{KEY_START}({key_regex}){KEY_END}"
+        self.pattern = re.compile(self.regex)
+        self.named_regex = f"{ARROW_KEY_START}(?P<key>{key_regex}){ARROW_KEY_END}"
+
+    def find(self, text):
+        # First Jira key in text, or None
+        if text is None:
+            return None
+        match = self.pattern.search(text)
+        if match is not None:
+            return match.group(1)
         return None
+
+    def find_all(self, text):
+        # Every distinct Jira key in text, in order of first appearance
+        if text is None:
+            return []
+        return list(dict.fromkeys(self.pattern.findall(text)))
+
+    def extract_series(self, series, all_keys=False):
+        # Vectorised extraction over a whole pandas Series of messages in one pass: the first key per row
+        # (missing when there is none), or with all_keys=True the list of every key per row.
+        # The first-key path runs on pyarrow's RE2 kernel when pyarrow is installed.
+        if all_keys:
+            return series.str.findall(self.pattern)
+        try:
+            import pyarrow
+            import pyarrow.compute
+        except ImportError:
+            return series.str.extract(self.pattern, expand=False)
+        messages = pyarrow.array(series, type=pyarrow.string(), from_pandas=True)
+        keys = pyarrow.compute.struct_field(pyarrow.compute.extract_regex(messages, self.named_regex), [0])
+        # Positional, not by label: the input's index need not be a RangeIndex (e.g. a filtered frame)
+        return series.__class__(keys.to_numpy(zero_copy_only=False), index=series.index, name=series.name)
+
+
+default_extractor = JiraKeyExtractor()
+
+
+def find_jira_id(search_string, extractor=default_extractor):
+    return extractor.find(search_string)
+
+
+def find_jira_ids(search_string, extractor=default_extractor):
+    return extractor.find_all(search_string)
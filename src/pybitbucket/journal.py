@@ -0,0 +1,115 @@
+import glob
+import json
+import os
+import shutil
+import threading
+from datetime import datetime
+
+import pandas as pd
+
+from src.pybitbucket.records import concat_dataframes
+
+
+class CrawlJournal:
+    def __init__(self, directory):
+        # Checkpoints of an in-progress crawl, so a restarted run resumes instead of repeating requests:
+        #   state.json          completed repos, the next PR listing URL of each in-progress repo, and the newest
+        #                       PR updated_on already persisted per repo
+        #   batches/            PR and commit rows of every completed PR listing page, one pickle pair per page
+        #   commit_pages.jsonl  commit pages fetched so far for PRs whose listing page is not yet persisted
+        self.directory = directory
+        self.batches_directory = os.path.join(directory, "batches")
+        self.state_path = os.path.join(directory, "state.json")
+        self.commit_pages_path = os.path.join(directory, "commit_pages.jsonl")
+        self.lock = threading.Lock()
+        self.completed_repos = set()
+        self.repo_next_urls = {}
+        self.repo_updated_on = {}
+        self.batch_count = 0
+        self.commit_progress = {}
+        self.previous_batch_count = 0
+        os.makedirs(self.batches_directory, exist_ok=True)
+        if os.path.exists(self.state_path):
+            with open(self.state_path) as state_file:
+                state = json.load(state_file)
+            self.completed_repos = set(state["completed_repos"])
+            self.repo_next_urls = state["repo_next_urls"]
+            self.repo_updated_on = state.get("repo_updated_on", {})
+            self.batch_count = state["batch_count"]
+            print(f"Resuming crawl from {directory}: {len(self.completed_repos)} repos complete, "
+                  f"{len(self.repo_next_urls)} in progress")
+        self.previous_batch_count = self.batch_count
+        if os.path.exists(self.commit_pages_path):
+            with open(self.commit_pages_path) as commit_pages_file:
+                for line in commit_pages_file:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        break  # a torn final line from the interrupted run
+                    values, next_url = self.commit_progress.get(entry["pr"], ([], None))
+                    self.commit_progress[entry["pr"]] = (values + entry["values"], entry["next"])
+        self.commit_pages_file = open(self.commit_pages_path, "a")
+
+    def is_repo_complete(self, repo_key):
+        return repo_key in self.completed_repos
+
+    def get_resume_url(self, repo_key):
+        return self.repo_next_urls.get(repo_key)
+
+    def get_commit_progress(self, pr_key):
+        # (commit dicts fetched so far, next commit page URL or None if the PR's commits were all fetched)
+        with self.lock:
+            return self.commit_progress.get(pr_key)
+
+    def record_commit_page(self, pr_key, values, next_url):
+        with self.lock:
+            self.commit_pages_file.write(json.dumps({"pr": pr_key, "values": values, "next": next_url}) + "\n")
+            self.commit_pages_file.flush()
+
+    def complete_page(self, repo_key, df_prs, df_commits, next_url, updated_on=None):
+        # Persists the rows of a finished PR listing page, then moves the repo's resume point past it
+        with self.lock:
+            self.batch_count = self.batch_count + 1
+            batch_path = os.path.join(self.batches_directory, f"{self.batch_count:08d}")
+            df_prs.to_pickle(f"{batch_path}.prs.pkl")
+            df_commits.to_pickle(f"{batch_path}.commits.pkl")
+            if next_url is None:
+                self.repo_next_urls.pop(repo_key, None)
+            else:
+                self.repo_next_urls[repo_key] = next_url
+            if updated_on is not None:
+                current = self.repo_updated_on.get(repo_key)
+                if current is None or datetime.fromisoformat(updated_on) > datetime.fromisoformat(current):
+                    self.repo_updated_on[repo_key] = updated_on
+            self.save()
+
+    def complete_repo(self, repo_key):
+        with self.lock:
+            self.completed_repos.add(repo_key)
+            self.repo_next_urls.pop(repo_key, None)
+            self.save()
+
+    def save(self):
+        # Caller holds self.lock
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, "w") as state_file:
+            json.dump({"completed_repos": sorted(self.completed_repos),
+                       "repo_next_urls": self.repo_next_urls,
+                       "repo_updated_on": self.repo_updated_on,
+                       "batch_count": self.batch_count}, state_file)
+        os.replace(tmp_path, self.state_path)
+
+    def merge_previous_records(self, df_prs, df_commits):
+        # Prepends the rows persisted by the interrupted run(s) to this run's rows
+        if self.previous_batch_count == 0:
+            return df_prs, df_commits
+        batch_paths = sorted(glob.glob(os.path.join(self.batches_directory, "*.prs.pkl")))[:self.previous_batch_count]
+        previous_prs = [pd.read_pickle(path) for path in batch_paths]
+        previous_commits = [pd.read_pickle(path.replace(".prs.pkl", ".commits.pkl")) for path in batch_paths]
+        return concat_dataframes(previous_prs + [df_prs]), concat_dataframes(previous_commits + [df_commits])
+
+    def finish(self):
+        # The crawl completed and its output was written: the next run starts from scratch
+        with self.lock:
+            self.commit_pages_file.close()
+            shutil.rmtree(self.directory, ignore_errors=True)
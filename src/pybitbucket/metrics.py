@@ -0,0 +1,150 @@
+import numpy as np
+import pandas as pd
+
+from src.pybitbucket.sync import PR_KEY_COLUMNS
+
+# Upper bounds (hours) of the PR cycle time histogram buckets; the last bucket is open-ended. Percentiles are read off
+# the histogram, which keeps every aggregate additive and so updatable incrementally.
+CYCLE_TIME_BUCKETS_HOURS = [1, 4, 8, 24, 48, 72, 168, 336, 720]
+CYCLE_TIME_BUCKET_COLUMNS = [f"cycle_le_{bound}h" for bound in CYCLE_TIME_BUCKETS_HOURS] + \
+    [f"cycle_gt_{CYCLE_TIME_BUCKETS_HOURS[-1]}h"]
+SUM_COLUMNS = ["prs", "merged_prs", "jira_prs", "commits", "jira_commits", "cycle_seconds"] + CYCLE_TIME_BUCKET_COLUMNS
+FACT_COLUMNS = ["project", "author", "state", "created_datetime", "updated_datetime"] + SUM_COLUMNS
+MERGED = "MERGED"
+
+
+def to_datetime_column(series):
+    # Crawled frames already hold datetime64 columns; only frames read back from CSV need parsing
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series
+    return pd.to_datetime(series)
+
+
+def get_commit_counts(df_commits):
+    # Commits and Jira-linked commits per PR key, in one grouped pass
+    if df_commits is None or len(df_commits) == 0:
+        return pd.DataFrame({"commits": pd.Series(dtype=np.int64), "jira_commits": pd.Series(dtype=np.int64)},
+                            index=pd.MultiIndex.from_arrays([[], [], []], names=PR_KEY_COLUMNS))
+    grouped = df_commits.groupby(PR_KEY_COLUMNS, observed=True, sort=False)
+    return pd.DataFrame({"commits": grouped.size(), "jira_commits": grouped["jira_id"].count()})
+
+
+def get_pr_facts(df_prs, commit_counts):
+    # One row per PR, indexed by (workspace, repo, pr_id): its dimensions and its additive contribution to every sum
+    facts = pd.DataFrame(index=pd.MultiIndex.from_frame(df_prs[PR_KEY_COLUMNS]))
+    for column in ["project", "author", "state"]:
+        facts[column] = df_prs[column].to_numpy()
+    created = to_datetime_column(df_prs["created_datetime"])
+    updated = to_datetime_column(df_prs["updated_datetime"])
+    facts["created_datetime"] = created.to_numpy()
+    facts["updated_datetime"] = updated.to_numpy()
+    merged = (df_prs["state"] == MERGED).to_numpy()
+    facts["prs"] = 1
+    facts["merged_prs"] = merged.astype(np.int64)
+    facts["jira_prs"] = df_prs["jira_id"].notna().to_numpy().astype(np.int64)
+    counts = commit_counts.reindex(facts.index)
+    facts["commits"] = counts["commits"].fillna(0).to_numpy().astype(np.int64)
+    facts["jira_commits"] = counts["jira_commits"].fillna(0).to_numpy().astype(np.int64)
+    # Bitbucket has no merged_on, so a merged PR's cycle time runs from creation to its last update (the merge)
+    cycle_seconds = np.where(merged, (updated - created).dt.total_seconds().fillna(0).to_numpy(), 0.0)
+    facts["cycle_seconds"] = cycle_seconds
+    bucket = np.searchsorted(np.array(CYCLE_TIME_BUCKETS_HOURS) * 3600.0, cycle_seconds, side="left")
+    for index, column in enumerate(CYCLE_TIME_BUCKET_COLUMNS):
+        facts[column] = ((bucket == index) & merged).astype(np.int64)
+    return facts
+
+
+def add_derived_metrics(sums):
+    # Ratios and histogram percentiles computed from the additive sums
+    df = sums.copy()
+    merged = df["merged_prs"].to_numpy()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        df["cycle_time_mean_hours"] = np.where(merged > 0, df["cycle_seconds"].to_numpy() / 3600.0 / merged, np.nan)
+        df["commits_per_pr"] = df["commits"] / df["prs"]
+        df["jira_pr_coverage"] = df["jira_prs"] / df["prs"]
+        df["jira_commit_coverage"] = np.where(df["commits"] > 0, df["jira_commits"] / df["commits"], np.nan)
+    cumulative = df[CYCLE_TIME_BUCKET_COLUMNS].to_numpy().cumsum(axis=1)
+    bounds = np.array(CYCLE_TIME_BUCKETS_HOURS + [np.inf], dtype=float)
+    for name, fraction in [("cycle_time_p50_hours", 0.5), ("cycle_time_p90_hours", 0.9)]:
+        bucket = (cumulative >= (merged * fraction)[:, None]).argmax(axis=1) if len(df) > 0 else np.empty(0, int)
+        df[name] = np.where(merged > 0, bounds[bucket], np.nan)
+    return df
+
+
+class MetricsEngine:
+    def __init__(self, df_prs=None, df_commits=None, time_column="updated_datetime"):
+        # PR cycle time, commits per PR, throughput and Jira coverage, grouped by any of workspace, project, repo and
+        # author and by time window (time_column, by default the PR's last update, i.e. its merge for merged PRs).
+        # Per-PR facts are kept so update() can replace re-fetched PRs; every aggregate computed so far is cached and
+        # patched with each update's delta instead of being recomputed.
+        self.time_column = time_column
+        self.facts = None
+        self.sums = {}
+        if df_prs is not None:
+            self.update(df_prs, df_commits)
+
+    def __len__(self):
+        return len(self.facts) if self.facts is not None else 0
+
+    def group_sums(self, facts, by, freq):
+        keys = [facts.index.get_level_values(column) if column in facts.index.names else facts[column]
+                for column in by]
+        names = list(by)
+        if freq is not None:
+            keys.append(facts[self.time_column].dt.to_period(freq).dt.start_time)
+            names.append("window")
+        if len(keys) == 0:
+            return facts[SUM_COLUMNS].sum().to_frame().T
+        sums = facts[SUM_COLUMNS].groupby(keys, observed=True, sort=False).sum()
+        sums.index.names = names
+        return sums
+
+    def update(self, df_prs, df_commits=None):
+        # df_prs rows are the latest version of those PRs and replace any earlier row for the same key; df_commits
+        # holds their complete commit lists (as re-fetched with them) and may add commits to PRs already seen
+        commit_counts = get_commit_counts(df_commits)
+        new_facts = get_pr_facts(df_prs, commit_counts)
+        new_facts = new_facts[~new_facts.index.duplicated(keep="last")]
+        old_facts = None
+        if self.facts is not None:
+            old_facts = self.facts[self.facts.index.isin(new_facts.index)]
+            extra_keys = commit_counts.index[~commit_counts.index.isin(new_facts.index) &
+                                             commit_counts.index.isin(self.facts.index)]
+            if len(extra_keys) > 0:
+                # Commits that arrived without their PR: the PR's existing row gains them
+                extra_facts = self.facts.loc[extra_keys].copy()
+                extra_facts["commits"] += commit_counts.loc[extra_keys, "commits"].to_numpy()
+                extra_facts["jira_commits"] += commit_counts.loc[extra_keys, "jira_commits"].to_numpy()
+                old_facts = pd.concat([old_facts, self.facts.loc[extra_keys]])
+                new_facts = pd.concat([new_facts, extra_facts])
+            self.facts = pd.concat([self.facts[~self.facts.index.isin(new_facts.index)], new_facts])
+        else:
+            self.facts = new_facts
+        for (by, freq), sums in self.sums.items():
+            sums = sums.add(self.group_sums(new_facts, by, freq), fill_value=0)
+            if old_facts is not None and len(old_facts) > 0:
+                sums = sums.sub(self.group_sums(old_facts, by, freq), fill_value=0)
+            self.sums[(by, freq)] = sums[sums["prs"] > 0].astype({column: np.int64 for column in SUM_COLUMNS
+                                                                  if column != "cycle_seconds"})
+        return self
+
+    def aggregate(self, by=("project", "repo"), freq=None):
+        # by: columns among workspace, project, repo, author, state; freq: a pandas period alias ("D", "W", "M",
+        # "Q") that adds a window column of period start times, or None for all time
+        by = tuple(by)
+        if self.facts is None:
+            return add_derived_metrics(pd.DataFrame(columns=SUM_COLUMNS))
+        if (by, freq) not in self.sums:
+            self.sums[(by, freq)] = self.group_sums(self.facts, by, freq)
+        return add_derived_metrics(self.sums[(by, freq)]).sort_index()
+
+    def cycle_time(self, by=("project", "repo"), freq=None):
+        return self.aggregate(by, freq)[["merged_prs", "cycle_time_mean_hours", "cycle_time_p50_hours",
+                                         "cycle_time_p90_hours"]]
+
+    def author_throughput(self, freq="W"):
+        return self.aggregate(("author",), freq)[["prs", "merged_prs", "commits", "commits_per_pr"]]
+
+    def jira_coverage(self, by=("project", "repo"), freq=None):
+        return self.aggregate(by, freq)[["prs", "jira_prs", "jira_pr_coverage", "commits", "jira_commits",
+                                         "jira_commit_coverage"]]
@@ -0,0 +1,165 @@
+from array import array
+
+# numpy and pandas are imported where a column is turned into a Series, so building records (and importing this module)
+# does not load them
+# Column kinds understood by ColumnarRecords
+CATEGORY = "category"  # low-cardinality strings (repo, project, author, branch, workspace), stored as int32 codes
+STRING = "string"  # high-cardinality strings (messages, hashes), stored as references to the parsed str
+INT = "int"  # nullable int64
+BOOL = "bool"
+DATETIME = "datetime"  # timezone-aware datetime, stored as UTC epoch seconds plus the UTC offset in minutes
+
+
+def to_numpy(buffer, dtype):
+    import numpy as np
+
+    # One memcpy of the packed buffer: a live numpy view would stop the array from growing on later appends
+    return np.frombuffer(buffer, dtype=dtype).copy() if len(buffer) > 0 else np.empty(0, dtype=dtype)
+
+
+class CategoryColumn:
+    def __init__(self):
+        self.codes = array("i")
+        self.categories = []
+        self.index = {}
+
+    def append(self, value):
+        if value is None:
+            self.codes.append(-1)
+            return
+        code = self.index.get(value)
+        if code is None:
+            code = len(self.categories)
+            self.index[value] = code
+            self.categories.append(value)
+        self.codes.append(code)
+
+    def to_series(self, name):
+        import numpy as np
+        import pandas as pd
+
+        codes = to_numpy(self.codes, np.int32)
+        return pd.Series(pd.Categorical.from_codes(codes, categories=self.categories), name=name)
+
+
+class StringColumn:
+    def __init__(self):
+        self.values = []
+
+    def append(self, value):
+        self.values.append(value)
+
+    def to_series(self, name):
+        import pandas as pd
+
+        return pd.Series(self.values, name=name, dtype=object)
+
+
+class IntColumn:
+    def __init__(self):
+        self.values = array("q")
+        self.mask = bytearray()
+
+    def append(self, value):
+        if value is None:
+            self.values.append(0)
+            self.mask.append(1)
+        else:
+            self.values.append(value)
+            self.mask.append(0)
+
+    def to_series(self, name):
+        import numpy as np
+        import pandas as pd
+
+        values = to_numpy(self.values, np.int64)
+        mask = to_numpy(self.mask, np.bool_)
+        if not mask.any():
+            return pd.Series(values, name=name)
+        return pd.Series(pd.arrays.IntegerArray(values, mask), name=name)
+
+
+class BoolColumn:
+    def __init__(self):
+        self.values = bytearray()
+
+    def append(self, value):
+        self.values.append(1 if value else 0)
+
+    def to_series(self, name):
+        import numpy as np
+        import pandas as pd
+
+        return pd.Series(to_numpy(self.values, np.bool_), name=name)
+
+
+class DatetimeColumn:
+    def __init__(self):
+        self.utc_seconds = array("q")
+        self.offset_minutes = array("h")
+        self.mask = bytearray()
+
+    def append(self, value):
+        if value is None:
+            self.utc_seconds.append(0)
+            self.offset_minutes.append(0)
+            self.mask.append(1)
+            return
+        offset = value.utcoffset()
+        self.utc_seconds.append(int(value.timestamp()))
+        self.offset_minutes.append(int(offset.total_seconds() // 60) if offset is not None else 0)
+        self.mask.append(0)
+
+    def to_series(self, name):
+        # Wall-clock time in the record's own UTC offset, truncated to seconds, which is what the previous
+        # strftime("%Y-%m-%d %H:%M:%S") rows contained
+        import numpy as np
+        import pandas as pd
+
+        seconds = to_numpy(self.utc_seconds, np.int64) + to_numpy(self.offset_minutes, np.int16).astype(np.int64) * 60
+        wall_clock = seconds.view("datetime64[s]")
+        mask = to_numpy(self.mask, np.bool_)
+        if mask.any():
+            wall_clock[mask] = np.datetime64("NaT")
+        return pd.Series(wall_clock, name=name)
+
+
+COLUMN_TYPES = {CATEGORY: CategoryColumn, STRING: StringColumn, INT: IntColumn, BOOL: BoolColumn,
+                DATETIME: DatetimeColumn}
+
+
+class ColumnarRecords:
+    def __init__(self, schema):
+        # schema is an ordered list of (column name, column kind) pairs
+        self.schema = schema
+        self.columns = {name: COLUMN_TYPES[kind]() for name, kind in schema}
+        self.column_list = [self.columns[name] for name, kind in schema]
+        self.row_count = 0
+
+    def __len__(self):
+        return self.row_count
+
+    def append(self, values):
+        # values are in schema order
+        for column, value in zip(self.column_list, values):
+            column.append(value)
+        self.row_count += 1
+
+    def to_dataframe(self):
+        import pandas as pd
+
+        return pd.DataFrame({name: self.columns[name].to_series(name) for name, kind in self.schema}, copy=False)
+
+
+def concat_dataframes(dfs):
+    # Concatenates frames built by separate ColumnarRecords (e.g. one per workspace); pd.concat alone would turn
+    # category columns whose categories differ into object columns
+    import pandas as pd
+
+    if len(dfs) == 1:
+        return dfs[0]
+    df = pd.concat(dfs, ignore_index=True)
+    for name in dfs[0].columns:
+        if isinstance(dfs[0][name].dtype, pd.CategoricalDtype) and not isinstance(df[name].dtype, pd.CategoricalDtype):
+            df[name] = df[name].astype("category")
+    return df
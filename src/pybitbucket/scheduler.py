@@ -0,0 +1,138 @@
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import requests
+
+DEFAULT_REQUESTS_PER_HOUR = 0  # 0 disables the token bucket
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_BACKOFF_BASE_SECONDS = 1.0
+DEFAULT_BACKOFF_MAX_SECONDS = 60.0
+RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+class BitbucketRequestError(Exception):
+    def __init__(self, url, status_code, attempts, reason=None):
+        self.url = url
+        self.status_code = status_code
+        self.attempts = attempts
+        self.reason = reason
+        super().__init__(f"Giving up on {url} after {attempts} attempts "
+                         f"(last status {status_code}{f': {reason}' if reason else ''})")
+
+
+class BitbucketAuthError(BitbucketRequestError):
+    # No access token could be obtained, so requests are not sent at all: unauthenticated they would only fail with 401
+    def __init__(self, url, status_code, reason=None, attempts=1):
+        self.url = url
+        self.status_code = status_code
+        self.attempts = attempts
+        self.reason = reason
+        Exception.__init__(self, f"Could not get an access token from {url} "
+                                 f"(status {status_code}{f': {reason}' if reason else ''})")
+
+
+class TokenBucket:
+    def __init__(self, requests_per_hour, burst=None):
+        self.rate_per_second = requests_per_hour / 3600.0
+        if burst is None:
+            burst = max(1, requests_per_hour // 60)  # one minute's worth of budget
+        self.capacity = float(burst)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, sleep=time.sleep):
+        # Blocks until a token is available; returns the number of seconds spent waiting
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate_per_second)
+                self.updated_at = now
+                if self.tokens >= 1.0:
+                    self.tokens -= 1.0
+                    return waited
+                wait_seconds = (1.0 - self.tokens) / self.rate_per_second
+            sleep(wait_seconds)
+            waited += wait_seconds
+
+
+class RequestScheduler:
+    def __init__(self, requests_per_hour=DEFAULT_REQUESTS_PER_HOUR, burst=None, max_attempts=DEFAULT_MAX_ATTEMPTS,
+                 backoff_base_seconds=DEFAULT_BACKOFF_BASE_SECONDS, backoff_max_seconds=DEFAULT_BACKOFF_MAX_SECONDS,
+                 sleep=time.sleep, instrumentation=None):
+        # Every HTTP call goes through execute(): it spends a token from the hourly budget, retries 429/5xx and
+        # connection errors with Retry-After or jittered exponential backoff, and gives up after max_attempts.
+        self.requests_per_hour = requests_per_hour
+        self.bucket = TokenBucket(requests_per_hour, burst) if requests_per_hour > 0 else None
+        self.max_attempts = max(1, max_attempts)
+        self.backoff_base_seconds = backoff_base_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+        self.sleep = sleep
+        self.instrumentation = instrumentation
+        self.retries = 0
+        self.throttled_seconds = 0.0
+        self.lock = threading.Lock()
+
+    def execute(self, url, send):
+        status_code = None
+        reason = None
+        for attempt in range(1, self.max_attempts + 1):
+            if self.bucket is not None:
+                waited = self.bucket.acquire(self.sleep)
+                if waited > 0:
+                    with self.lock:
+                        self.throttled_seconds += waited
+                    if self.instrumentation is not None:
+                        self.instrumentation.record_throttle(waited)
+            try:
+                response = send()
+            except (requests.ConnectionError, requests.Timeout) as e:
+                status_code = None
+                reason = str(e)
+                delay = self.backoff_delay(attempt)
+            else:
+                if response.status_code not in RETRYABLE_STATUS_CODES:
+                    return response
+                status_code = response.status_code
+                reason = response.reason
+                delay = self.retry_after_delay(response)
+                if delay is None:
+                    delay = self.backoff_delay(attempt)
+            if attempt < self.max_attempts:
+                print(f"Retrying {url} in {delay:.1f}s (attempt {attempt} of {self.max_attempts}, "
+                      f"status {status_code})")
+                with self.lock:
+                    self.retries += 1
+                if self.instrumentation is not None:
+                    self.instrumentation.record_retry(url, status_code, delay)
+                self.sleep(delay)
+        raise BitbucketRequestError(url, status_code, self.max_attempts, reason)
+
+    def backoff_delay(self, attempt):
+        # "Full jitter" exponential backoff
+        return random.uniform(0, min(self.backoff_max_seconds, self.backoff_base_seconds * (2 ** (attempt - 1))))
+
+    def retry_after_delay(self, response):
+        retry_after = response.headers.get("Retry-After")
+        if retry_after is None:
+            return None
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            pass
+        try:
+            retry_at = parsedate_to_datetime(retry_after)
+        except (TypeError, ValueError):
+            return None
+        if retry_at.tzinfo is None:
+            retry_at = retry_at.replace(tzinfo=timezone.utc)
+        return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+    def stats(self):
+        return {"requests_per_hour": self.requests_per_hour,
+                "retries": self.retries,
+                "throttled_seconds": self.throttled_seconds}
@@ -0,0 +1,211 @@
+import sqlite3
+import threading
+
+from src.pybitbucket.export import normalize_commits
+from src.pybitbucket.enrichment import ENRICHMENT_SCHEMA
+from src.pybitbucket.records import INT, DATETIME
+
+DEFAULT_DATASTORE_PATH = "pybitbucket.sqlite"
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"  # as in the exported CSVs; sorts and compares as text
+
+# Table columns in insert order, and each table's primary key (the upsert conflict target)
+TABLES = {
+    "workspaces": (["workspace", "slug", "uuid"], ["workspace"]),
+    "projects": (["workspace", "project", "project_key", "uuid", "description"], ["workspace", "project"]),
+    "repositories": (["workspace", "repo", "project", "full_name", "slug", "uuid", "description"],
+                     ["workspace", "repo"]),
+    "pull_requests": (["workspace", "repo", "pr_id", "project", "message", "author", "state", "source_branch",
+                       "destination_branch", "jira_id", "merge_commit_hash", "created_datetime", "updated_datetime"] +
+                      [name for name, kind in ENRICHMENT_SCHEMA], ["workspace", "repo", "pr_id"]),
+    "commits": (["workspace", "hash", "jira_id", "created_datetime", "message", "author", "project", "repo"],
+                ["workspace", "hash"]),
+    "pr_commits": (["workspace", "repo", "pr_id", "hash", "project", "source_branch", "destination_branch",
+                    "is_deploy_repo", "created_datetime"], ["workspace", "repo", "pr_id", "hash"])
+}
+COLUMN_TYPES = {"pr_id": "INTEGER", "is_deploy_repo": "INTEGER",
+                **{name: "INTEGER" for name, kind in ENRICHMENT_SCHEMA if kind == INT}}
+INDEXES = [("pull_requests", ["repo", "updated_datetime"]),
+           ("pull_requests", ["author", "updated_datetime"]),
+           ("pull_requests", ["updated_datetime"]),
+           ("pull_requests", ["jira_id"]),
+           ("commits", ["hash"]),
+           ("commits", ["author", "created_datetime"]),
+           ("commits", ["jira_id"]),
+           ("pr_commits", ["repo", "pr_id"]),
+           ("pr_commits", ["hash"]),
+           ("repositories", ["project"])]
+# query_commits returns the columns of Bitbucket.df_commits, one row per (PR, commit)
+COMMIT_QUERY_COLUMNS = ["'Commit' AS type", "c.hash", "c.jira_id", "c.created_datetime", "c.message", "l.project",
+                        "l.repo", "l.workspace", "c.author", "l.pr_id", "l.source_branch", "l.destination_branch",
+                        "l.is_deploy_repo"]
+UNIQUE_COMMIT_QUERY_COLUMNS = ["'Commit' AS type", "c.hash", "c.jira_id", "c.created_datetime", "c.message",
+                               "c.workspace", "c.author"]
+
+
+def to_timestamp_text(value):
+    # Query bounds may be datetimes or any string pandas can parse; aware ones are taken in their own offset
+    import pandas as pd
+
+    if value is None:
+        return None
+    return pd.Timestamp(value).strftime(TIMESTAMP_FORMAT)
+
+
+def to_rows(df, columns):
+    # Frame rows as plain Python tuples: timestamps as text, booleans as 0/1 and missing values as NULL
+    import pandas as pd
+
+    values = []
+    for column in columns:
+        if column not in df.columns:
+            values.append([None] * len(df))
+            continue
+        series = df[column]
+        if pd.api.types.is_datetime64_any_dtype(series):
+            series = series.dt.strftime(TIMESTAMP_FORMAT)
+        elif pd.api.types.is_bool_dtype(series):
+            series = series.astype(int)
+        values.append(series.astype(object).where(series.notna(), None).tolist())
+    return list(zip(*values))
+
+
+def add_filter(where, params, sql, value):
+    if value is not None:
+        where.append(sql)
+        params.append(value)
+
+
+class Datastore:
+    def __init__(self, path=DEFAULT_DATASTORE_PATH):
+        # SQLite copy of the crawled data: workspaces, projects, repositories, pull requests, unique commits and the
+        # PR-commit links, indexed for the query_* slices. Re-runs upsert on each table's key. Can be opened on its
+        # own (without a crawl) to query an existing file. pandas is imported only by the calls that build or read
+        # DataFrames.
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        for table, (columns, key_columns) in TABLES.items():
+            column_sql = ", ".join(f"{column} {COLUMN_TYPES.get(column, 'TEXT')}" for column in columns)
+            self.connection.execute(f"CREATE TABLE IF NOT EXISTS {table} ({column_sql}, "
+                                    f"PRIMARY KEY ({', '.join(key_columns)}))")
+            # Files written by an older version lack the columns added since (e.g. the enrichment columns)
+            existing_columns = set(row[1] for row in self.connection.execute(f"PRAGMA table_info({table})"))
+            for column in columns:
+                if column not in existing_columns:
+                    self.connection.execute(f"ALTER TABLE {table} ADD COLUMN {column} "
+                                            f"{COLUMN_TYPES.get(column, 'TEXT')}")
+        for table, columns in INDEXES:
+            self.connection.execute(f"CREATE INDEX IF NOT EXISTS {table}_{'_'.join(columns)} "
+                                    f"ON {table} ({', '.join(columns)})")
+        self.connection.commit()
+
+    def upsert(self, table, rows, columns=None):
+        # Caller holds self.lock. rows hold the given columns (by default all of the table's); on conflict the others
+        # keep their stored values.
+        table_columns, key_columns = TABLES[table]
+        columns = table_columns if columns is None else columns
+        updates = ", ".join(f"{column} = excluded.{column}" for column in columns if column not in key_columns)
+        self.connection.executemany(
+            f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))}) "
+            f"ON CONFLICT ({', '.join(key_columns)}) DO UPDATE SET {updates}", rows)
+
+    def write_workspace(self, workspace):
+        # The workspace with the projects and repositories discovered so far
+        projects = list(workspace.projects_dict.values())
+        with self.lock:
+            self.upsert("workspaces", [(workspace.name, workspace.slug, workspace.uuid)])
+            self.upsert("projects", [(workspace.name, project.name, project.key, project.uuid, project.description)
+                                     for project in projects])
+            self.upsert("repositories", [(workspace.name, repo.name, project.name, repo.full_name, repo.slug,
+                                          repo.uuid, repo.description)
+                                         for project in projects for repo in project.repos_dict.values()])
+            self.connection.commit()
+
+    def write_records(self, df_prs, df_commits):
+        # df_prs and df_commits as built by Bitbucket (one row per (PR, commit)). A PR that comes with commits gets
+        # exactly those links; a PR without commit rows (e.g. skipped as unchanged by incremental sync) keeps its own.
+        df_unique, df_pr_commits = normalize_commits(df_commits) if len(df_commits) > 0 else (df_commits, df_commits)
+        pr_keys = set(to_rows(df_pr_commits, ["workspace", "repo", "pr_id"])) if len(df_pr_commits) > 0 else set()
+        with self.lock:
+            # A crawl without the enrichment stage leaves earlier enrichment values in place
+            pr_columns = [column for column in TABLES["pull_requests"][0] if column in df_prs.columns]
+            self.upsert("pull_requests", to_rows(df_prs, pr_columns), pr_columns)
+            self.connection.executemany("DELETE FROM pr_commits WHERE workspace = ? AND repo = ? AND pr_id = ?",
+                                        list(pr_keys))
+            if len(df_pr_commits) > 0:
+                self.upsert("commits", to_rows(df_unique, TABLES["commits"][0]))
+                self.upsert("pr_commits", to_rows(df_pr_commits, TABLES["pr_commits"][0]))
+            self.connection.commit()
+
+    def sql(self, query, params=(), parse_dates=None):
+        # Any read-only query over the tables, as a DataFrame
+        import pandas as pd
+
+        with self.lock:
+            return pd.read_sql_query(query, self.connection, params=list(params), parse_dates=parse_dates)
+
+    def query_pull_requests(self, workspace=None, project=None, repo=None, author=None, state=None, jira_id=None,
+                            has_jira_id=None, updated_since=None, updated_before=None, limit=None):
+        # PRs matching every given filter, newest update first. Times are compared with the PRs' wall-clock
+        # timestamps; updated_since is inclusive and updated_before exclusive.
+        where = []
+        params = []
+        add_filter(where, params, "workspace = ?", workspace)
+        add_filter(where, params, "project = ?", project)
+        add_filter(where, params, "repo = ?", repo)
+        add_filter(where, params, "author = ?", author)
+        add_filter(where, params, "state = ?", state)
+        add_filter(where, params, "jira_id = ?", jira_id)
+        add_filter(where, params, "updated_datetime >= ?", to_timestamp_text(updated_since))
+        add_filter(where, params, "updated_datetime < ?", to_timestamp_text(updated_before))
+        if has_jira_id is not None:
+            where.append("jira_id IS NOT NULL" if has_jira_id else "jira_id IS NULL")
+        query = "SELECT 'PR' AS type, pr_id, message, created_datetime, updated_datetime, project, workspace, " \
+                "author, repo, state, source_branch, destination_branch, jira_id, merge_commit_hash, " \
+                f"{', '.join(name for name, kind in ENRICHMENT_SCHEMA)} FROM pull_requests"
+        if len(where) > 0:
+            query = f"{query} WHERE {' AND '.join(where)}"
+        query = f"{query} ORDER BY updated_datetime DESC"
+        if limit is not None:
+            query = f"{query} LIMIT {int(limit)}"
+        return self.sql(query, params, parse_dates=["created_datetime", "updated_datetime"] +
+                        [name for name, kind in ENRICHMENT_SCHEMA if kind == DATETIME])
+
+    def query_commits(self, workspace=None, project=None, repo=None, pr_id=None, author=None, commit_hash=None,
+                      jira_id=None, has_jira_id=None, created_since=None, created_before=None, unique=False,
+                      limit=None):
+        # Commits matching every given filter, one row per (PR, commit) like Bitbucket.df_commits, or one row per
+        # commit with unique=True. Newest first.
+        where = []
+        params = []
+        add_filter(where, params, "l.workspace = ?", workspace)
+        add_filter(where, params, "l.project = ?", project)
+        add_filter(where, params, "l.repo = ?", repo)
+        add_filter(where, params, "l.pr_id = ?", pr_id)
+        add_filter(where, params, "c.author = ?", author)
+        add_filter(where, params, "c.hash = ?", commit_hash)
+        add_filter(where, params, "c.jira_id = ?", jira_id)
+        add_filter(where, params, "c.created_datetime >= ?", to_timestamp_text(created_since))
+        add_filter(where, params, "c.created_datetime < ?", to_timestamp_text(created_before))
+        if has_jira_id is not None:
+            where.append("c.jira_id IS NOT NULL" if has_jira_id else "c.jira_id IS NULL")
+        columns = UNIQUE_COMMIT_QUERY_COLUMNS if unique else COMMIT_QUERY_COLUMNS
+        query = f"SELECT {'DISTINCT ' if unique else ''}{', '.join(columns)} FROM pr_commits l " \
+                "JOIN commits c ON c.workspace = l.workspace AND c.hash = l.hash"
+        if len(where) > 0:
+            query = f"{query} WHERE {' AND '.join(where)}"
+        query = f"{query} ORDER BY c.created_datetime DESC"
+        if limit is not None:
+            query = f"{query} LIMIT {int(limit)}"
+        df = self.sql(query, params, parse_dates=["created_datetime"])
+        if "is_deploy_repo" in df.columns:
+            df["is_deploy_repo"] = df["is_deploy_repo"].astype(bool)
+        return df
+
+    def count(self, table):
+        with self.lock:
+            return self.connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
@@ -0,0 +1,605 @@
+import argparse
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs, urlencode, unquote
+
+# Largest page each endpoint serves, as on Bitbucket Cloud
+MAX_PAGELEN = {"workspaces": 100, "projects": 100, "repositories": 100, "pullrequests": 50, "commits": 100,
+               "diffstat": 500, "activity": 50, "statuses": 100}
+DEFAULT_PAGELEN = 10
+# Statuses returned by randomly injected faults; 429s carry a Retry-After header
+FAULT_STATUSES = (429, 500, 503)
+TOKEN_PATH = "/site/oauth2/access_token"
+
+
+def project_fields(body, fields):
+    # Minimal Bitbucket partial response: keeps only the listed dotted paths (e.g. "values.author.display_name")
+    result = {}
+    for field in fields:
+        copy_path(body, result, field.split("."))
+    return result
+
+
+def copy_path(source, target, keys):
+    if not isinstance(source, dict) or keys[0] not in source:
+        return
+    value = source[keys[0]]
+    if len(keys) == 1 or value is None:
+        target[keys[0]] = value
+    elif isinstance(value, list):
+        items = target.setdefault(keys[0], [{} for item in value])
+        for item, target_item in zip(value, items):
+            copy_path(item, target_item, keys[1:])
+    elif isinstance(value, dict):
+        copy_path(value, target.setdefault(keys[0], {}), keys[1:])
+
+
+def parse_query_filter(q):
+    # The subset of Bitbucket's q= filter language the crawler sends: 'project.key="P1"', 'updated_on>2022-01-01T...'
+    # and conditions joined with AND. Returns a list of (field, operator, value).
+    conditions = []
+    for condition in q.split(" AND "):
+        for operator in (">=", "<=", "!=", ">", "<", "="):
+            if operator in condition:
+                field, value = condition.split(operator, 1)
+                conditions.append((field.strip(), operator, value.strip().strip('"')))
+                break
+    return conditions
+
+
+def parse_query_alternatives(q):
+    # Also a single parenthesised group of conditions joined with OR ('(updated_on>2022-... OR state="OPEN")').
+    # Returns a list of alternatives, each a list of conditions that must all match.
+    q = q.strip()
+    if q.startswith("(") and q.endswith(")"):
+        return [parse_query_filter(alternative) for alternative in q[1:-1].split(" OR ")]
+    return [parse_query_filter(q)]
+
+
+def matches_filter(values, conditions):
+    for field, operator, value in conditions:
+        actual = values.get(field)
+        if actual is None:
+            return False
+        if field.endswith("_on"):
+            actual = datetime.fromisoformat(actual)
+            value = datetime.fromisoformat(value)
+        if operator == "=" and not actual == value or operator == "!=" and not actual != value or \
+                operator == ">" and not actual > value or operator == ">=" and not actual >= value or \
+                operator == "<" and not actual < value or operator == "<=" and not actual <= value:
+            return False
+    return True
+
+
+class SyntheticDataset:
+    def __init__(self, workspace="stub", projects=1, repos=10, prs_per_repo=20, commits_per_pr=10, authors=20,
+                 states=("MERGED",), jira_project_key="PROJ", start=datetime(2022, 1, 1, tzinfo=timezone.utc),
+                 prs_per_change=1):
+        # A deterministic workspace: repos are spread round-robin over the projects P0..Pn-1, and every payload is
+        # derived from its indices, so nothing is stored and any scale costs the same memory. PR n of each repo has
+        # state states[n % len(states)], created an hour after PR n-1 and updated (n % 48) hours after creation.
+        # With prs_per_change > 1, each run of that many consecutive PRs promotes one change through the branches
+        # (feature -> promote-0 -> ... -> main), so they all list the same commits.
+        self.workspace = workspace
+        self.projects = projects
+        self.repos = repos
+        self.prs_per_repo = prs_per_repo
+        self.commits_per_pr = commits_per_pr
+        self.authors = authors
+        self.states = states
+        self.jira_project_key = jira_project_key
+        self.start = start
+        self.prs_per_change = max(1, prs_per_change)
+        self.api_base_url = ""  # set by the server that serves the dataset
+
+    def get_project_keys(self):
+        return [f"P{index}" for index in range(self.projects)]
+
+    def get_repo_indexes(self, project_key=None):
+        indexes = range(self.repos)
+        if project_key is None:
+            return list(indexes)
+        return [index for index in indexes if f"P{index % self.projects}" == project_key]
+
+    def get_repo_index(self, slug):
+        if not slug.startswith("repo-") or not slug[len("repo-"):].isdigit():
+            return None
+        index = int(slug[len("repo-"):])
+        return index if index < self.repos else None
+
+    def count_pull_requests(self, state="MERGED"):
+        return self.repos * sum(1 for pr_id in range(1, self.prs_per_repo + 1) if self.get_state(pr_id) == state)
+
+    def get_state(self, pr_id):
+        return self.states[pr_id % len(self.states)]
+
+    def get_created_on(self, repo_index, pr_id):
+        return self.start + timedelta(hours=pr_id, minutes=repo_index % 60)
+
+    def get_updated_on(self, repo_index, pr_id):
+        return self.get_created_on(repo_index, pr_id) + timedelta(hours=pr_id % 48)
+
+    def user(self, index):
+        account_id = f"557058:00000000-0000-0000-0000-{index:012d}"
+        return {
+            "display_name": f"Stub Author {index}",
+            "type": "user",
+            "uuid": f"{{00000000-0000-0000-0000-{index:012d}}}",
+            "account_id": account_id,
+            "nickname": f"author{index}",
+            "links": {"self": {"href": f"{self.api_base_url}/users/{account_id}"},
+                      "avatar": {"href": f"https://avatar-management.example/{index}/128"},
+                      "html": {"href": f"https://bitbucket.example/author{index}/"}}
+        }
+
+    def workspace_payload(self):
+        workspace_url = f"{self.api_base_url}/workspaces/{self.workspace}"
+        return {
+            "type": "workspace",
+            "slug": self.workspace,
+            "name": self.workspace,
+            "uuid": f"{{{self.workspace}}}",
+            "is_private": True,
+            "links": {"self": {"href": workspace_url},
+                      "projects": {"href": f"{workspace_url}/projects"},
+                      "repositories": {"href": f"{self.api_base_url}/repositories/{self.workspace}"},
+                      "members": {"href": f"{workspace_url}/members"},
+                      "avatar": {"href": ""}}
+        }
+
+    def project(self, key):
+        repositories_url = f"{self.api_base_url}/repositories/{self.workspace}?" + \
+            urlencode({"q": f'project.key="{key}"'})
+        return {
+            "type": "project",
+            "key": key,
+            "name": key,
+            "description": "",
+            "uuid": f"{{{key}}}",
+            "is_private": True,
+            "links": {"self": {"href": f"{self.api_base_url}/workspaces/{self.workspace}/projects/{key}"},
+                      "repositories": {"href": repositories_url},
+                      "avatar": {"href": ""}}
+        }
+
+    def repository(self, index):
+        slug = f"repo-{index}"
+        repo_url = f"{self.api_base_url}/repositories/{self.workspace}/{slug}"
+        return {
+            "type": "repository",
+            "name": slug,
+            "slug": slug,
+            "full_name": f"{self.workspace}/{slug}",
+            "description": "",
+            "uuid": f"{{00000000-0000-0000-0001-{index:012d}}}",
+            "is_private": True,
+            "project": {"type": "project", "key": f"P{index % self.projects}"},
+            "mainbranch": {"type": "branch", "name": "main"},
+            "links": {"self": {"href": repo_url},
+                      "pullrequests": {"href": f"{repo_url}/pullrequests"},
+                      "commits": {"href": f"{repo_url}/commits"},
+                      "avatar": {"href": ""}}
+        }
+
+    def repository_ref(self, index):
+        return {"type": "repository", "full_name": f"{self.workspace}/repo-{index}", "name": f"repo-{index}",
+                "uuid": f"{{00000000-0000-0000-0001-{index:012d}}}"}
+
+    def commit_ref(self, repo_index, commit_hash):
+        commit_url = f"{self.api_base_url}/repositories/{self.workspace}/repo-{repo_index}/commit/{commit_hash}"
+        return {"type": "commit", "hash": commit_hash,
+                "links": {"self": {"href": commit_url}, "html": {"href": f"{commit_url}/html"}}}
+
+    def get_change(self, pr_id):
+        # The PR that started this PR's change, and this PR's position in its promotion chain
+        position = (pr_id - 1) % self.prs_per_change
+        return pr_id - position, position
+
+    def get_jira_id(self, repo_index, pr_id):
+        change_pr_id = self.get_change(pr_id)[0]
+        return f"{self.jira_project_key}-{repo_index * self.prs_per_repo + change_pr_id}"
+
+    def get_branches(self, repo_index, pr_id):
+        change_pr_id, position = self.get_change(pr_id)
+        source = f"promote-{position - 1}" if position > 0 else f"feature/{self.get_jira_id(repo_index, pr_id)}"
+        destination = "main" if position == self.prs_per_change - 1 else f"promote-{position}"
+        return source, destination
+
+    def get_commit_hash(self, repo_index, pr_id, index):
+        change_pr_id = self.get_change(pr_id)[0]
+        return f"{repo_index:08x}{change_pr_id:08x}{index:024x}"
+
+    def get_merge_commit_hash(self, repo_index, pr_id):
+        # Abbreviated to 12 characters, as Bitbucket returns it
+        return f"f{repo_index:05x}{pr_id:06x}"
+
+    def pull_request(self, repo_index, pr_id):
+        pr_url = f"{self.api_base_url}/repositories/{self.workspace}/repo-{repo_index}/pullrequests/{pr_id}"
+        jira_id = self.get_jira_id(repo_index, pr_id)
+        source_branch, destination_branch = self.get_branches(repo_index, pr_id)
+        title = f"{jira_id} change {pr_id} of repo-{repo_index}"
+        description = f"{jira_id}: describes change {pr_id} in a couple of sentences of markdown. " * 3
+        state = self.get_state(pr_id)
+        author = self.user((repo_index + pr_id) % self.authors)
+        return {
+            "type": "pullrequest",
+            "id": pr_id,
+            "title": title,
+            "created_on": self.get_created_on(repo_index, pr_id).isoformat(timespec="microseconds"),
+            "updated_on": self.get_updated_on(repo_index, pr_id).isoformat(timespec="microseconds"),
+            "description": description,
+            "summary": {"type": "rendered", "raw": description, "markup": "markdown", "html": f"<p>{description}</p>"},
+            "rendered": {"title": {"type": "rendered", "raw": title, "markup": "markdown", "html": f"<p>{title}</p>"}},
+            "state": state,
+            "reason": "",
+            "close_source_branch": True,
+            "comment_count": pr_id % 5,
+            "task_count": 0,
+            "author": author,
+            "closed_by": author if state != "OPEN" else None,
+            "source": {"branch": {"name": source_branch},
+                       "commit": self.commit_ref(repo_index, self.get_commit_hash(repo_index, pr_id, 0)[:12]),
+                       "repository": self.repository_ref(repo_index)},
+            "destination": {"branch": {"name": destination_branch},
+                            "commit": self.commit_ref(repo_index, "0123456789ab"),
+                            "repository": self.repository_ref(repo_index)},
+            "merge_commit": self.commit_ref(repo_index, self.get_merge_commit_hash(repo_index, pr_id))
+            if state == "MERGED" else None,
+            "reviewers": [self.user((repo_index + pr_id + 1) % self.authors)],
+            "participants": [{"type": "participant", "role": "REVIEWER", "approved": True, "state": "approved",
+                              "participated_on": self.get_updated_on(repo_index, pr_id).isoformat(),
+                              "user": self.user((repo_index + pr_id + 1) % self.authors)}],
+            "links": {name: {"href": f"{pr_url}/{name}"} for name in
+                      ["commits", "approve", "request-changes", "diff", "diffstat", "comments", "activity", "merge",
+                       "decline", "statuses"]} | {"self": {"href": pr_url}, "html": {"href": f"{pr_url}/html"}}
+        }
+
+    def diffstat(self, repo_index, pr_id):
+        # 1 to 7 changed files; every third PR also adds a file
+        path = f"src/repo_{repo_index}/change_{pr_id}"
+        values = [{"type": "diffstat", "status": "modified", "lines_added": 10 + index * 3 + pr_id % 5,
+                   "lines_removed": index * 2, "old": {"path": f"{path}/file_{index}.py", "type": "commit_file"},
+                   "new": {"path": f"{path}/file_{index}.py", "type": "commit_file"}}
+                  for index in range(1 + pr_id % 7)]
+        if pr_id % 3 == 0:
+            values.append({"type": "diffstat", "status": "added", "lines_added": 25, "lines_removed": 0, "old": None,
+                           "new": {"path": f"{path}/new_file.py", "type": "commit_file"}})
+        return values
+
+    def activity(self, repo_index, pr_id):
+        # Newest first, like Bitbucket: the author comments after 5 minutes, the reviewer comments after
+        # 20 + (pr_id % 4) * 15 minutes and, except on every fourth PR, approves (pr_id % 6) * 10 minutes later
+        created_on = self.get_created_on(repo_index, pr_id)
+        author = self.user((repo_index + pr_id) % self.authors)
+        reviewer = self.user((repo_index + pr_id + 1) % self.authors)
+        pr_ref = {"type": "pullrequest", "id": pr_id, "title": f"change {pr_id} of repo-{repo_index}"}
+        review_minutes = 20 + (pr_id % 4) * 15
+        values = [{"update": {"state": "OPEN", "date": created_on.isoformat(timespec="microseconds"), "author": author,
+                              "title": pr_ref["title"], "description": ""}, "pull_request": pr_ref},
+                  {"comment": {"id": pr_id * 10, "created_on": (created_on + timedelta(minutes=5)).isoformat(),
+                               "user": author, "content": {"raw": "Ready for review"}}, "pull_request": pr_ref},
+                  {"comment": {"id": pr_id * 10 + 1,
+                               "created_on": (created_on + timedelta(minutes=review_minutes)).isoformat(),
+                               "user": reviewer, "content": {"raw": "Looks good"}}, "pull_request": pr_ref}]
+        if pr_id % 4 != 0:
+            approved_on = created_on + timedelta(minutes=review_minutes + (pr_id % 6) * 10)
+            values.append({"approval": {"date": approved_on.isoformat(timespec="microseconds"), "user": reviewer,
+                                        "pullrequest": pr_ref}, "pull_request": pr_ref})
+        values.reverse()
+        return values
+
+    def statuses(self, repo_index, pr_id):
+        # One build per PR, failed on every tenth
+        state = "FAILED" if pr_id % 10 == 0 else "SUCCESSFUL"
+        return [{"type": "build", "key": "ci", "name": "CI", "state": state,
+                 "url": f"https://ci.example/{self.workspace}/repo-{repo_index}/{pr_id}",
+                 "created_on": self.get_created_on(repo_index, pr_id).isoformat(),
+                 "updated_on": self.get_updated_on(repo_index, pr_id).isoformat()}]
+
+    def commit(self, repo_index, pr_id, index):
+        # Newest first, like Bitbucket's PR commit listing
+        # Every PR of a change lists that change's commits
+        change_pr_id = self.get_change(pr_id)[0]
+        commit_hash = self.get_commit_hash(repo_index, pr_id, index)
+        commit_url = f"{self.api_base_url}/repositories/{self.workspace}/repo-{repo_index}/commit/{commit_hash}"
+        jira_id = self.get_jira_id(repo_index, pr_id)
+        message = f"{jira_id} commit {index} of change {change_pr_id}\n"
+        date = self.get_created_on(repo_index, change_pr_id) - timedelta(minutes=index)
+        author = self.user((repo_index + change_pr_id) % self.authors)
+        return {
+            "type": "commit",
+            "hash": commit_hash,
+            "date": date.isoformat(),
+            "message": message,
+            "summary": {"type": "rendered", "raw": message, "markup": "markdown", "html": f"<p>{message}</p>"},
+            "author": {"type": "author", "raw": f"{author['display_name']} <{author['nickname']}@example.com>",
+                       "user": author},
+            "parents": [self.commit_ref(repo_index, self.get_commit_hash(repo_index, pr_id, index + 1))],
+            "repository": self.repository_ref(repo_index),
+            "links": {name: {"href": f"{commit_url}/{name}"} for name in
+                      ["html", "diff", "approve", "comments", "statuses", "patch"]} | {"self": {"href": commit_url}}
+        }
+
+
+class StubBitbucketServer:
+    def __init__(self, dataset=None, page_len=DEFAULT_PAGELEN, latency_seconds=0.0, fault_rate=0.0,
+                 fault_statuses=FAULT_STATUSES, retry_after_seconds=0, seed=0, token_status=200, etags=False):
+        # Local stand-in for the Bitbucket Cloud API serving a SyntheticDataset: the OAuth token endpoint, workspaces,
+        # projects, repositories, pull requests and PR commits, diffstat, activity and statuses, with Bitbucket's
+        # paging (page/pagelen, next links that keep the query), fields= projection and the q=/state=/sort= filters
+        # the crawler uses. Every request sleeps latency_seconds; a fault_rate fraction of GETs fail with one of
+        # fault_statuses, and inject_fault() adds deterministic failures for a path. Any token_status other than 200
+        # rejects every token request, as Bitbucket does for bad OAuth consumer credentials. With etags, responses
+        # carry an ETag of their body and a matching If-None-Match gets a 304.
+        self.dataset = dataset if dataset is not None else SyntheticDataset()
+        self.page_len = page_len
+        self.latency_seconds = latency_seconds
+        self.fault_rate = fault_rate
+        self.fault_statuses = fault_statuses
+        self.retry_after_seconds = retry_after_seconds
+        self.token_status = token_status
+        self.etags = etags
+        self.not_modified_count = 0
+        self.random = random.Random(seed)
+        self.faults = {}
+        self.request_count = 0
+        self.fault_count = 0
+        self.token_count = 0
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), self.make_handler())
+        self.httpd.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self.api_base_url = f"{self.base_url}/2.0"
+        self.token_url = f"{self.base_url}{TOKEN_PATH}"
+        self.dataset.api_base_url = self.api_base_url
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.stop()
+        return False
+
+    def inject_fault(self, path, status=503, count=1):
+        # The next count GETs whose path contains path fail with status
+        with self.lock:
+            self.faults[path] = self.faults.get(path, []) + [status] * count
+
+    def get_fault(self, path):
+        with self.lock:
+            self.request_count += 1
+            for fault_path, statuses in self.faults.items():
+                if fault_path in path and len(statuses) > 0:
+                    self.fault_count += 1
+                    return statuses.pop(0)
+            if self.fault_rate > 0 and self.random.random() < self.fault_rate:
+                self.fault_count += 1
+                return self.random.choice(self.fault_statuses)
+        return None
+
+    def stats(self):
+        with self.lock:
+            return {"requests": self.request_count, "faults": self.fault_count, "tokens": self.token_count,
+                    "not_modified": self.not_modified_count}
+
+    def write_settings(self, directory, general=None, secret_general=None, atlassian=None, rate_limit=None):
+        # Writes a properties/secret-properties pair that points Bitbucket at this server and returns the settings
+        # dict Bitbucket(settings) takes. The dicts add or override keys of the matching sections.
+        os.makedirs(directory, exist_ok=True)
+        sections = {
+            "properties": {
+                "general": {"version": "1.0", "api_base_url": self.api_base_url, "token_url": self.token_url,
+                            **(general or {})},
+                "rate_limit": {"backoff_base_seconds": "0.01", "backoff_max_seconds": "0.1", **(rate_limit or {})},
+                "instrumentation": {"print_summary": "0"}
+            },
+            "secret-properties": {
+                "general": {"prs_file": os.path.join(directory, "prs.csv"),
+                            "commits_file": os.path.join(directory, "commits.csv"), **(secret_general or {})},
+                "atlassian": {"workspace_id": self.dataset.workspace, "default_project_key_list": "",
+                              "default_deploy_repo_list": "", **(atlassian or {})},
+                "atlassian_oauth": {"key": "stub-key", "secret": "stub-secret"}
+            }
+        }
+        settings = {}
+        for name, config in sections.items():
+            path = os.path.join(directory, f"stub.{name}")
+            with open(path, "w") as properties_file:
+                for section, values in config.items():
+                    properties_file.write(f"[{section}]\n")
+                    for key, value in values.items():
+                        properties_file.write(f"{key}={value}\n")
+            settings[name] = path
+        return settings
+
+    def page(self, url_path, query, values, kind):
+        page = int(query.get("page", ["1"])[0])
+        page_len = min(int(query.get("pagelen", [self.page_len])[0]), MAX_PAGELEN[kind])
+        start = (page - 1) * page_len
+        response = {"values": values[start:start + page_len], "page": page, "pagelen": page_len, "size": len(values)}
+        if start + page_len < len(values):
+            # Like Bitbucket, the next link keeps the request's query parameters
+            next_query = [(key, value) for key, values in query.items() if key != "page" for value in values]
+            next_query.append(("page", page + 1))
+            response["next"] = f"{self.base_url}{url_path}?{urlencode(next_query)}"
+        return response
+
+    def list_pull_requests(self, repo_index, query):
+        # Bitbucket lists OPEN PRs unless state= is given; state may be repeated
+        states = query.get("state", ["OPEN"])
+        alternatives = parse_query_alternatives(query["q"][0]) if "q" in query else [[]]
+        prs = []
+        for pr_id in range(1, self.dataset.prs_per_repo + 1):
+            if self.dataset.get_state(pr_id) not in states:
+                continue
+            updated_on = self.dataset.get_updated_on(repo_index, pr_id).isoformat()
+            values = {"updated_on": updated_on, "state": self.dataset.get_state(pr_id)}
+            if any(matches_filter(values, conditions) for conditions in alternatives):
+                prs.append((updated_on, pr_id))
+        sort = query.get("sort", ["id"])[0]
+        if sort.lstrip("-") == "updated_on":
+            prs.sort(key=lambda pr: datetime.fromisoformat(pr[0]), reverse=sort.startswith("-"))
+        else:
+            prs.sort(key=lambda pr: pr[1], reverse=sort.startswith("-"))
+        return [self.dataset.pull_request(repo_index, pr_id) for updated_on, pr_id in prs]
+
+    def route(self, path, query):
+        # (status, body) for a GET
+        dataset = self.dataset
+        parts = [unquote(part) for part in path.strip("/").split("/")]
+        if len(parts) > 0 and parts[0] == "2.0":
+            parts = parts[1:]
+        if parts == ["workspaces"]:
+            # The workspaces the token can see: just the dataset's
+            return 200, self.page(path, query, [dataset.workspace_payload()], "workspaces")
+        if len(parts) < 2 or parts[1].strip("{}") != dataset.workspace:
+            return 404, {"type": "error", "error": {"message": "Not found"}}
+        if parts[0] == "workspaces" and len(parts) == 2:
+            return 200, dataset.workspace_payload()
+        if parts[0] == "workspaces" and len(parts) == 3 and parts[2] == "projects":
+            values = [dataset.project(key) for key in dataset.get_project_keys()]
+            return 200, self.page(path, query, values, "projects")
+        if parts[0] == "workspaces" and len(parts) == 4 and parts[2] == "projects":
+            if parts[3] in dataset.get_project_keys():
+                return 200, dataset.project(parts[3])
+        if parts[0] == "repositories" and len(parts) == 2:
+            conditions = parse_query_filter(query["q"][0]) if "q" in query else []
+            project_keys = [value for field, operator, value in conditions if field == "project.key"]
+            indexes = dataset.get_repo_indexes(project_keys[0] if len(project_keys) > 0 else None)
+            return 200, self.page(path, query, [dataset.repository(index) for index in indexes], "repositories")
+        repo_index = dataset.get_repo_index(parts[2]) if parts[0] == "repositories" and len(parts) > 2 else None
+        if repo_index is not None:
+            if len(parts) == 3:
+                return 200, dataset.repository(repo_index)
+            if len(parts) == 4 and parts[3] == "pullrequests":
+                return 200, self.page(path, query, self.list_pull_requests(repo_index, query), "pullrequests")
+            if len(parts) >= 5 and parts[3] == "pullrequests" and parts[4].isdigit() and \
+                    1 <= int(parts[4]) <= dataset.prs_per_repo:
+                pr_id = int(parts[4])
+                if len(parts) == 5:
+                    return 200, dataset.pull_request(repo_index, pr_id)
+                if len(parts) == 6 and parts[5] == "commits":
+                    values = [dataset.commit(repo_index, pr_id, index) for index in range(dataset.commits_per_pr)]
+                    return 200, self.page(path, query, values, "commits")
+                if len(parts) == 6 and parts[5] in ("diffstat", "activity", "statuses"):
+                    values = getattr(dataset, parts[5])(repo_index, pr_id)
+                    return 200, self.page(path, query, values, parts[5])
+        return 404, {"type": "error", "error": {"message": "Not found"}}
+
+    def make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body are separate writes on a keep-alive connection; Nagle would hold the body back
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def send_json(self, status, body, headers=None):
+                payload = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if urlparse(self.path).path != TOKEN_PATH:
+                    self.send_json(404, {"type": "error", "error": {"message": "Not found"}})
+                    return
+                with server.lock:
+                    server.token_count += 1
+                    token_count = server.token_count
+                if server.token_status != 200:
+                    self.send_json(server.token_status, {"error": "invalid_client",
+                                                         "error_description": "Invalid OAuth client credentials"})
+                    return
+                self.send_json(200, {"access_token": f"stub-token-{token_count}", "token_type": "bearer",
+                                     "refresh_token": "stub-refresh-token", "expires_in": 7200,
+                                     "scopes": "project repository pullrequest"})
+
+            def do_GET(self):
+                time.sleep(server.latency_seconds)
+                parsed = urlparse(self.path)
+                fault = server.get_fault(parsed.path)
+                if fault is not None:
+                    headers = {"Retry-After": str(server.retry_after_seconds)} if fault == 429 else None
+                    self.send_json(fault, {"type": "error", "error": {"message": f"Injected {fault}"}}, headers)
+                    return
+                if not self.headers.get("Authorization", "").startswith("Bearer "):
+                    self.send_json(401, {"type": "error", "error": {"message": "Unauthorized"}})
+                    return
+                query = parse_qs(parsed.query)
+                status, body = server.route(parsed.path, query)
+                if status == 200 and "fields" in query:
+                    body = project_fields(body, query["fields"][0].split(","))
+                if status == 200 and server.etags:
+                    etag = f'"{hashlib.sha1(json.dumps(body, sort_keys=True).encode("utf-8")).hexdigest()}"'
+                    if self.headers.get("If-None-Match") == etag:
+                        with server.lock:
+                            server.not_modified_count += 1
+                        self.send_response(304)
+                        self.send_header("ETag", etag)
+                        self.send_header("Content-Length", "0")
+                        self.end_headers()
+                        return
+                    self.send_json(status, body, {"ETag": etag})
+                    return
+                self.send_json(status, body)
+
+        return Handler
+
+
+def main():
+    # Serves a synthetic workspace until interrupted: python -m src.pybitbucket.stub --repos 100
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workspace", default="stub")
+    parser.add_argument("--projects", type=int, default=1)
+    parser.add_argument("--repos", type=int, default=10)
+    parser.add_argument("--prs", type=int, default=20)
+    parser.add_argument("--commits", type=int, default=10)
+    parser.add_argument("--prs-per-change", type=int, default=1)
+    parser.add_argument("--states", default="MERGED", help="comma separated; PR n gets state n %% len(states)")
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--fault-rate", type=float, default=0.0)
+    parser.add_argument("--settings-dir", default=None)
+    args = parser.parse_args()
+
+    dataset = SyntheticDataset(workspace=args.workspace, projects=args.projects, repos=args.repos,
+                               prs_per_repo=args.prs, commits_per_pr=args.commits,
+                               prs_per_change=args.prs_per_change, states=tuple(args.states.split(",")))
+    server = StubBitbucketServer(dataset, latency_seconds=args.latency, fault_rate=args.fault_rate)
+    print(f"Stub Bitbucket API at {server.api_base_url} (token endpoint {server.token_url})")
+    if args.settings_dir is not None:
+        print(f"Settings: {server.write_settings(args.settings_dir)}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
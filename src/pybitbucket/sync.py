@@ -0,0 +1,132 @@
+import json
+import os
+import threading
+from datetime import datetime
+
+PR_KEY_COLUMNS = ["workspace", "repo", "pr_id"]
+COMMIT_KEY_COLUMNS = ["workspace", "repo", "pr_id", "hash"]
+COMMIT_HASH_KEY_COLUMNS = ["workspace", "hash"]
+DATETIME_COLUMNS = ["created_datetime", "updated_datetime"]
+# PR states whose commit list can no longer change once synced
+CLOSED_STATES = ("MERGED", "DECLINED", "SUPERSEDED")
+# PR states that keep changing: an incremental crawl that includes them lists every such PR on each run, and only the
+# closed states are limited to what changed since the last run
+VOLATILE_STATES = ("OPEN",)
+PR_STATES = VOLATILE_STATES + CLOSED_STATES
+
+
+def get_states(state):
+    # A crawl's state setting is one state or a collection of them
+    return [state] if isinstance(state, str) else list(state)
+
+
+def get_volatile_states(states):
+    return [state for state in get_states(states) if state in VOLATILE_STATES]
+
+
+def get_sync_key(repo_key, states):
+    # High-water marks are kept per set of closed states crawled, so adding a state to the crawl lists that state's
+    # history in full. A MERGED-only crawl keeps the plain repo key. None when no closed state is crawled.
+    closed_states = sorted(state for state in get_states(states) if state in CLOSED_STATES)
+    if len(closed_states) == 0:
+        return None
+    if closed_states == ["MERGED"]:
+        return repo_key
+    return f"{repo_key}?state={','.join(closed_states)}"
+
+
+class SyncState:
+    def __init__(self, path):
+        # High-water marks are the newest PR updated_on seen per repo (keyed by Repository.full_name). Marks observed
+        # during a run stay pending until commit(), so a failed run never advances them past data that was not saved.
+        # The source commit hash of each synced PR (keyed by "<repo full_name>#<pr id>") follows the same rule; a
+        # closed PR re-listed with the same source commit still has the commits saved by the earlier run.
+        self.path = path
+        self.high_water_marks = {}
+        self.pending_high_water_marks = {}
+        self.source_commit_hashes = {}
+        self.pending_source_commit_hashes = {}
+        self.lock = threading.Lock()
+        if path is not None and os.path.exists(path):
+            try:
+                with open(path) as state_file:
+                    state = json.load(state_file)
+                self.high_water_marks = state["high_water_marks"]
+                self.source_commit_hashes = state.get("source_commit_hashes", {})
+            except (ValueError, KeyError, TypeError, AttributeError) as e:
+                print(f"Exception reading sync state {path}: {e}")
+                self.high_water_marks = {}
+                self.source_commit_hashes = {}
+
+    def get_high_water_mark(self, repo_key):
+        return self.high_water_marks.get(repo_key)
+
+    def observe(self, repo_key, updated_on):
+        if updated_on is None:
+            return
+        with self.lock:
+            current = self.pending_high_water_marks.get(repo_key, self.high_water_marks.get(repo_key))
+            if current is None or datetime.fromisoformat(updated_on) > datetime.fromisoformat(current):
+                self.pending_high_water_marks[repo_key] = updated_on
+
+    def observe_pull_request(self, repo_key, pr):
+        # Records the PR's source commit and marks its commits unchanged when the last synced run saw the same one.
+        # Only closed PRs are recorded: the commits of a PR synced while open are replaced along with its row, so an
+        # open PR that has since closed still needs its commits fetched.
+        if pr.id is None or pr.source_commit_hash is None or pr.state not in CLOSED_STATES:
+            return
+        pr_key = f"{repo_key}#{pr.id}"
+        with self.lock:
+            if pr.state in CLOSED_STATES and self.source_commit_hashes.get(pr_key) == pr.source_commit_hash:
+                pr.commits_unchanged = True
+            self.pending_source_commit_hashes[pr_key] = pr.source_commit_hash
+
+    def commit(self):
+        with self.lock:
+            self.high_water_marks.update(self.pending_high_water_marks)
+            self.pending_high_water_marks = {}
+            self.source_commit_hashes.update(self.pending_source_commit_hashes)
+            self.pending_source_commit_hashes = {}
+            if self.path is not None:
+                tmp_path = f"{self.path}.tmp"
+                with open(tmp_path, "w") as state_file:
+                    json.dump({"high_water_marks": self.high_water_marks,
+                               "source_commit_hashes": self.source_commit_hashes}, state_file, indent=2,
+                              sort_keys=True)
+                os.replace(tmp_path, self.path)
+
+
+def merge_records(previous_path, df_delta, key_columns, volatile_states=()):
+    # Merge freshly fetched rows into the previously saved dataset; a re-fetched record replaces its old row. Previous
+    # PR rows in one of volatile_states are dropped, since the run listed every PR still in those states.
+    import pandas as pd
+
+    if previous_path is None or not os.path.exists(previous_path):
+        return df_delta
+    df_previous = pd.read_csv(previous_path)
+    if len(volatile_states) > 0 and "state" in df_previous.columns:
+        df_previous = df_previous[~df_previous["state"].isin(volatile_states)].reset_index(drop=True)
+    for column in DATETIME_COLUMNS:
+        if column in df_previous.columns:
+            # Back to the typed timestamps the fresh rows carry, instead of the CSV strings
+            df_previous[column] = pd.to_datetime(df_previous[column])
+    if len(df_delta) == 0:
+        return df_previous
+    df = pd.concat([df_previous, df_delta], ignore_index=True)
+    key_columns = [column for column in key_columns if column in df.columns]
+    return df.drop_duplicates(subset=key_columns, keep="last").reset_index(drop=True)
+
+
+def is_pull_request_row(df, df_prs):
+    # Boolean mask of the rows of df (commits or PR-commit links) whose PR is in df_prs
+    import pandas as pd
+
+    pr_keys = pd.MultiIndex.from_frame(df_prs[PR_KEY_COLUMNS].astype(object))
+    return pd.MultiIndex.from_frame(df[PR_KEY_COLUMNS].astype(object)).isin(pr_keys)
+
+
+def filter_pull_request_rows(df, df_prs):
+    # The rows of df (commits or PR-commit links) whose PR is in df_prs, e.g. after merge_records dropped PRs
+    if len(df) == 0:
+        return df
+    return df[is_pull_request_row(df, df_prs)].reset_index(drop=True)
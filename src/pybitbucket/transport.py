@@ -0,0 +1,148 @@
+import copy
+import json
+import threading
+import time
+from urllib.parse import urlencode, urlsplit, urlunsplit, parse_qsl
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from src.pybitbucket.cache import CACHE_REVALIDATE
+from src.pybitbucket.scheduler import RequestScheduler
+
+DEFAULT_POOL_SIZE = 10
+
+
+def add_query_params(url, params):
+    # Sets params in url's query string, replacing any values already there
+    parts = urlsplit(url)
+    query = [(key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True) if key not in params]
+    query.extend((key, str(value)) for key, value in params.items())
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+class BbTransport:
+    def __init__(self, access_token=None, pool_size=DEFAULT_POOL_SIZE, cache=None, scheduler=None, instrumentation=None):
+        # One pooled, keep-alive session shared by every Bitbucket API call so TCP+TLS connections are reused
+        self.access_token = access_token
+        self.token_provider = None
+        self.pool_size = max(1, int(pool_size))
+        self.cache = cache
+        if scheduler is None:
+            scheduler = RequestScheduler()
+        self.scheduler = scheduler
+        self.instrumentation = instrumentation
+        # Shared by reference with every view from with_token_provider(); bytes_received is as sent on the wire, i.e.
+        # compressed when the server gzips
+        self.counters = {"requests": 0, "bytes_received": 0, "bytes_decoded": 0}
+        self.counter_lock = threading.Lock()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({
+            "Accept": "application/json",
+            "Accept-Encoding": "gzip, deflate",
+            "Connection": "keep-alive"
+        })
+
+    def set_access_token(self, access_token):
+        self.access_token = access_token
+
+    def set_token_provider(self, token_provider):
+        # A provider (BbOauth2) takes precedence over a fixed access token and is consulted on every request
+        self.token_provider = token_provider
+
+    def with_token_provider(self, token_provider):
+        # A view that shares this transport's session (connection pool), cache, scheduler and counters but
+        # authenticates with its own token provider, e.g. one per workspace OAuth consumer
+        view = copy.copy(self)
+        view.token_provider = token_provider
+        return view
+
+    def get_access_token(self):
+        if self.token_provider is not None:
+            return self.token_provider.get_token()
+        return self.access_token
+
+    def get_json(self, url, params=None, cache_policy=CACHE_REVALIDATE):
+        # The only place the bearer token is injected. Returns the decoded JSON body, or None on failure.
+        access_token = self.get_access_token()
+        headers = {}
+        if access_token is not None:
+            headers["Authorization"] = f"Bearer {access_token}"
+
+        cache_key = None
+        cache_entry = None
+        if self.cache is not None:
+            cache_key = url if not params else f"{url}{'&' if '?' in url else '?'}{urlencode(params, doseq=True)}"
+            cache_entry = self.cache.lookup(cache_key)
+            if cache_entry is not None:
+                if self.cache.is_fresh(cache_entry, cache_policy):
+                    self.cache.record_hit()
+                    if self.instrumentation is not None:
+                        self.instrumentation.record_cache(url, "hit")
+                    return self.decode_json(cache_entry["body"])
+                headers.update(self.cache.conditional_headers(cache_entry))
+
+        response = self.scheduler.execute(url, lambda: self.send_get(url, headers, params))
+        if response.status_code == 401 and self.token_provider is not None:
+            # The token expired or was revoked mid-crawl: refresh it once and transparently retry the request
+            access_token = self.token_provider.invalidate(access_token)
+            if access_token is not None:
+                headers["Authorization"] = f"Bearer {access_token}"
+                response = self.scheduler.execute(url, lambda: self.send_get(url, headers, params))
+        if cache_entry is not None and response.status_code == 304:
+            self.cache.touch(cache_key, cache_policy)
+            self.cache.record_hit(revalidated=True)
+            if self.instrumentation is not None:
+                self.instrumentation.record_cache(url, "revalidated")
+            return self.decode_json(cache_entry["body"])
+        if response and response.status_code == 200:
+            if self.cache is not None:
+                self.cache.record_miss()
+                if self.instrumentation is not None:
+                    self.instrumentation.record_cache(url, "miss")
+                self.cache.store(cache_key, response.content, etag=response.headers.get("ETag"),
+                                 last_modified=response.headers.get("Last-Modified"), policy=cache_policy)
+            return self.decode_json(response.content)
+        print(f"GET {url} failed with status {response.status_code}")
+        return None
+
+    def decode_json(self, body):
+        if self.instrumentation is None:
+            return json.loads(body)
+        with self.instrumentation.stage("json_decode"):
+            return json.loads(body)
+
+    def send_get(self, url, headers, params):
+        started_at = time.perf_counter()
+        return self.count_response(url, self.session.get(url, headers=headers, params=params), started_at)
+
+    def count_response(self, url, response, started_at):
+        decoded_bytes = len(response.content)
+        wire_bytes = int(response.headers.get("Content-Length", decoded_bytes))
+        with self.counter_lock:
+            self.counters["requests"] += 1
+            self.counters["bytes_received"] += wire_bytes
+            self.counters["bytes_decoded"] += decoded_bytes
+        if self.instrumentation is not None:
+            self.instrumentation.record_request(url, response.status_code, time.perf_counter() - started_at,
+                                                wire_bytes, decoded_bytes)
+        return response
+
+    def send_post(self, url, data, auth):
+        started_at = time.perf_counter()
+        return self.count_response(url, self.session.post(url, data=data, auth=auth), started_at)
+
+    def post(self, url, data=None, auth=None):
+        return self.scheduler.execute(url, lambda: self.send_post(url, data, auth))
+
+    def stats(self):
+        with self.counter_lock:
+            return dict(self.counters)
+
+    def close(self):
+        self.session.close()
+        if self.cache is not None:
+            self.cache.close()
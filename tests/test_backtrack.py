@@ -0,0 +1,70 @@
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from src.pybitbucket.backtrack import DeployIndex, MATCH_HASH, MATCH_JIRA_ID, MATCH_MERGE_COMMIT
+
+# Source repo "app" has PRs 1-3; deploy repo "deploy" has PR 10, whose commits come from them: the merge commit of
+# PR 1, a commit of PR 2, a commit that only shares PR 3's Jira key, and one that traces back to nothing.
+START = datetime(2024, 5, 1, 9, 0)
+MERGE_1 = "a1" * 20
+COMMIT_2 = "b2" * 20
+COMMIT_3 = "c3" * 20
+DEPLOY_JIRA = "d4" * 20
+DEPLOY_NONE = "e5" * 20
+
+
+def get_frames():
+    df_prs = pd.DataFrame({"workspace": ["ws"] * 4, "repo": ["app", "app", "app", "deploy"], "pr_id": [1, 2, 3, 10],
+                           "jira_id": ["PROJ-1", "PROJ-2", "PROJ-3", None],
+                           "created_datetime": [START, START, START, START + timedelta(days=2)],
+                           # Bitbucket abbreviates merge commit hashes
+                           "merge_commit_hash": [MERGE_1[:12], None, None, "f6" * 6]})
+    commits = [("app", 1, "11" * 20, "PROJ-1", START + timedelta(hours=1), False),
+               ("app", 2, COMMIT_2, "PROJ-2", START + timedelta(hours=2), False),
+               ("app", 3, COMMIT_3, "PROJ-3", START + timedelta(hours=3), False),
+               ("deploy", 10, MERGE_1, "PROJ-1", START + timedelta(days=3), True),
+               ("deploy", 10, COMMIT_2, "PROJ-2", START + timedelta(days=3), True),
+               ("deploy", 10, DEPLOY_JIRA, "PROJ-3", START + timedelta(days=3), True),
+               ("deploy", 10, DEPLOY_NONE, None, START + timedelta(days=3), True)]
+    df_commits = pd.DataFrame(commits, columns=["repo", "pr_id", "hash", "jira_id", "created_datetime",
+                                                "is_deploy_repo"])
+    df_commits.insert(0, "workspace", "ws")
+    return df_prs, df_commits
+
+
+def test_backtrack_routes():
+    index = DeployIndex(*get_frames())
+    assert index.backtrack(MERGE_1, "PROJ-1") == [(MATCH_MERGE_COMMIT, ("ws", "app", 1))]
+    assert index.backtrack(COMMIT_2, "PROJ-2") == [(MATCH_HASH, ("ws", "app", 2))]
+    assert index.backtrack(DEPLOY_JIRA, "PROJ-3") == [(MATCH_JIRA_ID, ("ws", "app", 3))]
+    assert index.backtrack(DEPLOY_NONE) == []
+    # The deploy PR's own merge commit is not a source
+    assert index.backtrack("f6" * 20) == []
+    assert index.get_pull_request_for_merge_commit(MERGE_1) == ("ws", "app", 1)
+    assert len(index.get_commits(COMMIT_2[:12])) == 2
+
+
+def test_backtrack_deploys():
+    df = DeployIndex(*get_frames()).backtrack_deploys().set_index("deploy_hash")
+    assert df.loc[MERGE_1, "match"] == MATCH_MERGE_COMMIT
+    assert df.loc[COMMIT_2, "match"] == MATCH_HASH
+    assert df.loc[DEPLOY_JIRA, "match"] == MATCH_JIRA_ID
+    assert pd.isna(df.loc[DEPLOY_NONE, "match"])
+    assert list(df["pr_id"].dropna()) == [1, 2, 3]
+    assert df.loc[COMMIT_2, "jira_id"] == "PROJ-2"
+    assert df.loc[COMMIT_2, "commits"] == 1
+    # From the source PR's first commit to the deploy commit
+    assert df.loc[COMMIT_2, "lead_time"] == timedelta(days=3) - timedelta(hours=2)
+    assert pd.isna(df.loc[DEPLOY_NONE, "lead_time"])
+
+
+def test_frames_read_back_from_csv(tmp_path):
+    # Timestamps come back as strings, and missing Jira keys as NaN
+    df_prs, df_commits = get_frames()
+    df_prs.to_csv(tmp_path / "prs.csv", index=False)
+    df_commits.to_csv(tmp_path / "commits.csv", index=False)
+    index = DeployIndex(pd.read_csv(tmp_path / "prs.csv"), pd.read_csv(tmp_path / "commits.csv"))
+    df = index.backtrack_deploys().set_index("deploy_hash")
+    assert df.loc[COMMIT_2, "lead_time"] == timedelta(days=3) - timedelta(hours=2)
+    assert df.loc[DEPLOY_JIRA, "match"] == MATCH_JIRA_ID
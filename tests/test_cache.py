@@ -0,0 +1,102 @@
+from src.pybitbucket import cache as cache_module
+from src.pybitbucket.cache import ResponseCache, CACHE_IMMUTABLE, CACHE_TTL, CACHE_REVALIDATE
+from src.pybitbucket.scheduler import RequestScheduler
+from src.pybitbucket.stub import StubBitbucketServer, SyntheticDataset
+from src.pybitbucket.transport import BbTransport
+
+COMMITS_PATH = "/repositories/stub/repo-0/pullrequests/1/commits"
+
+
+class FakeTime:
+    # Every reading moves on a millisecond, so last_access orders entries
+    def __init__(self):
+        self.now = 1000000.0
+
+    def time(self):
+        self.now += 0.001
+        return self.now
+
+
+def test_ttl_expiry(tmp_path, monkeypatch):
+    clock = FakeTime()
+    monkeypatch.setattr(cache_module, "time", clock)
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"), ttl_seconds=60)
+    cache.store("https://example/a", b"{}", policy=CACHE_TTL)
+    entry = cache.lookup("https://example/a")
+    assert cache.is_fresh(entry, CACHE_TTL)
+    assert not cache.is_fresh(entry, CACHE_REVALIDATE)
+    clock.now += 61
+    assert not cache.is_fresh(entry, CACHE_TTL)
+    cache.touch("https://example/a")
+    assert cache.is_fresh(cache.lookup("https://example/a"), CACHE_TTL)
+    cache.close()
+
+
+def test_immutable_policy_does_not_trust_a_ttl_entry(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"))
+    cache.store("https://example/a", b"{}", policy=CACHE_TTL)
+    assert not cache.is_fresh(cache.lookup("https://example/a"), CACHE_IMMUTABLE)
+    # Re-stored (or revalidated) under the immutable policy, it is fresh for good
+    cache.touch("https://example/a", CACHE_IMMUTABLE)
+    assert cache.is_fresh(cache.lookup("https://example/a"), CACHE_IMMUTABLE)
+    assert cache.is_fresh(cache.lookup("https://example/a"), CACHE_REVALIDATE)
+    cache.store("https://example/b", b"{}", policy=CACHE_IMMUTABLE)
+    assert cache.is_fresh(cache.lookup("https://example/b"), CACHE_TTL)
+    cache.close()
+
+
+def get_transport(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"))
+    return BbTransport(access_token="stub-token", cache=cache, scheduler=RequestScheduler(sleep=lambda seconds: None))
+
+
+def test_commits_cached_while_open_are_refetched_once_merged(tmp_path):
+    # The PR's commits page is cached while it is open; more commits are pushed before it merges
+    dataset = SyntheticDataset(repos=1, prs_per_repo=1, commits_per_pr=2)
+    with StubBitbucketServer(dataset) as server:
+        transport = get_transport(tmp_path)
+        url = f"{server.api_base_url}{COMMITS_PATH}"
+        assert len(transport.get_json(url, cache_policy=CACHE_TTL)["values"]) == 2
+        dataset.commits_per_pr = 3
+        assert len(transport.get_json(url, cache_policy=CACHE_IMMUTABLE)["values"]) == 3
+        requests = server.stats()["requests"]
+        assert len(transport.get_json(url, cache_policy=CACHE_IMMUTABLE)["values"]) == 3
+        assert server.stats()["requests"] == requests
+        transport.close()
+
+
+def test_304_revalidation(tmp_path):
+    with StubBitbucketServer(SyntheticDataset(repos=1, prs_per_repo=1, commits_per_pr=2), etags=True) as server:
+        transport = get_transport(tmp_path)
+        url = f"{server.api_base_url}{COMMITS_PATH}"
+        first = transport.get_json(url, cache_policy=CACHE_REVALIDATE)
+        assert transport.get_json(url, cache_policy=CACHE_REVALIDATE) == first
+        assert server.stats()["not_modified"] == 1
+        # A 304 under the immutable policy makes the entry immutable: the next lookup sends nothing
+        assert transport.get_json(url, cache_policy=CACHE_IMMUTABLE) == first
+        assert server.stats()["not_modified"] == 2
+        requests = server.stats()["requests"]
+        assert transport.get_json(url, cache_policy=CACHE_IMMUTABLE) == first
+        assert server.stats()["requests"] == requests
+        assert transport.cache.stats()["revalidations"] == 2
+        assert transport.cache.stats()["hits"] == 3
+        assert transport.cache.stats()["misses"] == 1
+        transport.close()
+
+
+def test_lru_eviction(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache_module, "time", FakeTime())
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"), max_bytes=30)
+    for name in "abc":
+        cache.store(f"https://example/{name}", b"0123456789")
+    # a is used again, so b is now the least recently used
+    assert cache.lookup("https://example/a") is not None
+    cache.store("https://example/d", b"0123456789")
+    assert cache.lookup("https://example/b") is None
+    assert [cache.lookup(f"https://example/{name}") is not None for name in "acd"] == [True, True, True]
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["total_bytes"] == 30
+    # A body larger than the whole cache is not stored
+    cache.store("https://example/e", b"x" * 31)
+    assert cache.lookup("https://example/e") is None
+    cache.close()
@@ -0,0 +1,30 @@
+from src.pybitbucket.cli import main
+from src.pybitbucket.stub import StubBitbucketServer, SyntheticDataset
+
+
+def run(server, directory, capsys, *argv):
+    settings = server.write_settings(directory)
+    code = main(["--properties", settings["properties"], "--secret-properties", settings["secret-properties"],
+                 *argv])
+    return code, capsys.readouterr()
+
+
+def test_prs_query(tmp_path, capsys):
+    with StubBitbucketServer(SyntheticDataset(repos=2, prs_per_repo=8, commits_per_pr=2)) as server:
+        code, captured = run(server, str(tmp_path), capsys, "prs", "repo-1", "--limit", "5")
+    assert code == 0
+    rows = [line.split("\t") for line in captured.out.splitlines()]
+    assert rows[0][:3] == ["pr_id", "state", "author"]
+    assert len(rows) == 6
+    assert all(row[1] == "MERGED" for row in rows[1:])
+    # Progress messages stay off stdout
+    assert "get workspace" in captured.err
+
+
+def test_repos_in_an_unconfigured_workspace(tmp_path, capsys):
+    with StubBitbucketServer(SyntheticDataset(repos=2, prs_per_repo=2, commits_per_pr=1)) as server:
+        code, captured = run(server, str(tmp_path), capsys, "--workspace", "other", "repos")
+        assert server.stats()["requests"] == 0
+    assert code == 1
+    assert captured.out == ""
+    assert "Error: Workspace other is not configured; workspace_id lists stub" in captured.err
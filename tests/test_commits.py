@@ -0,0 +1,67 @@
+import pandas as pd
+
+from src.pybitbucket.bitbucket import Bitbucket, CommitList
+from src.pybitbucket.export import denormalize_commits, UNIQUE_COMMIT_COLUMNS, PR_COMMIT_COLUMNS
+from src.pybitbucket.stub import StubBitbucketServer, SyntheticDataset
+
+# With prs_per_change=3 every change is promoted through three PRs (feature -> promote-0 -> promote-1 -> main), which
+# all list the same commits
+COMMIT_COLUMNS = [name for name, kind in CommitList.schema]
+
+
+def get_dataset():
+    return SyntheticDataset(repos=2, prs_per_repo=12, commits_per_pr=4, prs_per_change=3)
+
+
+def get_expected_edges(dataset):
+    return {(f"repo-{repo_index}", pr_id, dataset.get_commit_hash(repo_index, pr_id, index))
+            for repo_index in range(dataset.repos) for pr_id in range(1, dataset.prs_per_repo + 1)
+            for index in range(dataset.commits_per_pr)}
+
+
+def crawl(server, directory, secret_general=None):
+    bitbucket = Bitbucket(server.write_settings(directory, secret_general=secret_general))
+    bitbucket.crawl()
+    return bitbucket
+
+
+def test_shared_commits_are_stored_once(tmp_path):
+    dataset = get_dataset()
+    with StubBitbucketServer(dataset) as server:
+        bitbucket = crawl(server, str(tmp_path))
+    commit_list = bitbucket.workspace.commit_list
+    edges = get_expected_edges(dataset)
+    assert len(commit_list) == len(edges) == 96
+    assert commit_list.count_unique() == len({commit_hash for repo, pr_id, commit_hash in edges}) == 32
+    # to_dataframe() still has one row per (PR, commit), in schema order
+    df = bitbucket.df_commits
+    assert list(df.columns) == COMMIT_COLUMNS
+    assert set(zip(df["repo"], df["pr_id"], df["hash"])) == edges
+    assert len(df) == 96
+    # Rows of a shared commit carry its own fields and each PR's branches
+    df_shared = df[df["hash"] == dataset.get_commit_hash(0, 1, 0)]
+    assert sorted(df_shared["pr_id"]) == [1, 2, 3]
+    assert df_shared["message"].nunique() == 1
+    assert sorted(df_shared["destination_branch"].astype(str)) == ["main", "promote-0", "promote-1"]
+
+
+def test_normalized_csv_export(tmp_path):
+    dataset = get_dataset()
+    with StubBitbucketServer(dataset) as server:
+        crawl(server, str(tmp_path / "plain"))
+        normalized = crawl(server, str(tmp_path / "normalized"), secret_general={
+            "normalize_commits": "1", "pr_commits_file": str(tmp_path / "normalized" / "pr_commits.csv")})
+    df_unique = pd.read_csv(tmp_path / "normalized" / "commits.csv")
+    df_pr_commits = pd.read_csv(tmp_path / "normalized" / "pr_commits.csv")
+    assert list(df_unique.columns) == UNIQUE_COMMIT_COLUMNS
+    assert list(df_pr_commits.columns) == PR_COMMIT_COLUMNS
+    assert len(df_unique) == 32
+    assert not df_unique.duplicated(["workspace", "hash"]).any()
+    assert len(df_pr_commits) == 96
+    # Joined back together, the two files are the plain one-row-per-(PR, commit) output
+    key = ["repo", "pr_id", "hash"]
+    df_joined = denormalize_commits(df_unique, df_pr_commits, COMMIT_COLUMNS).sort_values(key).reset_index(drop=True)
+    df_plain = pd.read_csv(tmp_path / "plain" / "commits.csv").sort_values(key).reset_index(drop=True)
+    pd.testing.assert_frame_equal(df_joined, df_plain)
+    # The crawl's own frame keeps one row per (PR, commit)
+    assert len(normalized.df_commits) == 96
@@ -0,0 +1,69 @@
+import pandas as pd
+
+from src.pybitbucket.bitbucket import Bitbucket
+from src.pybitbucket.stub import StubBitbucketServer, SyntheticDataset
+
+
+def crawl(server, directory):
+    settings = server.write_settings(directory)
+    with open(settings["properties"], "a") as properties_file:
+        properties_file.write("[enrichment]\nenabled=1\n")
+        properties_file.write(f"[cache]\nenabled=1\npath={directory}/cache.sqlite\n")
+    bitbucket = Bitbucket(settings)
+    df_prs, df_commits = bitbucket.crawl()
+    return df_prs.drop_duplicates(["repo", "pr_id"]).set_index(["repo", "pr_id"]).sort_index()
+
+
+def get_expected(pr_id):
+    # The stub's diffstat, activity and statuses payloads (see SyntheticDataset) reduced by hand
+    files = 1 + pr_id % 7
+    review_minutes = 20 + (pr_id % 4) * 15
+    approval_minutes = review_minutes + (pr_id % 6) * 10 if pr_id % 4 != 0 else None
+    return {"lines_added": sum(10 + index * 3 + pr_id % 5 for index in range(files)) + (25 if pr_id % 3 == 0 else 0),
+            "lines_removed": sum(index * 2 for index in range(files)),
+            "files_changed": files + (1 if pr_id % 3 == 0 else 0),
+            "approvals": 0 if approval_minutes is None else 1,
+            "comments": 2,
+            "review_minutes": review_minutes,
+            "minutes_to_first_approval": approval_minutes,
+            "build_status": "FAILED" if pr_id % 10 == 0 else "SUCCESSFUL",
+            "builds": 1}
+
+
+def test_extracted_fields(tmp_path):
+    with StubBitbucketServer(SyntheticDataset(repos=2, prs_per_repo=12, commits_per_pr=1)) as server:
+        df = crawl(server, str(tmp_path))
+    assert len(df) == 24
+    for (repo, pr_id), row in df.iterrows():
+        expected = get_expected(pr_id)
+        for column in ["lines_added", "lines_removed", "files_changed", "approvals", "comments", "build_status",
+                       "builds"]:
+            assert row[column] == expected[column], (repo, pr_id, column)
+        # The author's own comment is not a review
+        assert row["first_review_datetime"] - row["created_datetime"] == \
+            pd.Timedelta(minutes=expected["review_minutes"])
+        if expected["minutes_to_first_approval"] is None:
+            assert pd.isna(row["first_approval_datetime"])
+            assert pd.isna(row["minutes_to_first_approval"])
+        else:
+            assert row["minutes_to_first_approval"] == expected["minutes_to_first_approval"]
+            assert row["first_approval_datetime"] - row["created_datetime"] == \
+                pd.Timedelta(minutes=expected["minutes_to_first_approval"])
+
+
+def test_merged_pr_activity_and_statuses_are_revalidated(tmp_path):
+    dataset = SyntheticDataset(repos=1, prs_per_repo=6, commits_per_pr=1)
+    with StubBitbucketServer(dataset, etags=True) as server:
+        df = crawl(server, str(tmp_path))
+        # A build is re-run after the merge and fails. The diffstat is changed too, to show it is served from cache.
+        statuses, diffstat = dataset.statuses, dataset.diffstat
+        dataset.statuses = lambda repo_index, pr_id: [dict(status, state="FAILED")
+                                                      for status in statuses(repo_index, pr_id)]
+        dataset.diffstat = lambda repo_index, pr_id: diffstat(repo_index, pr_id)[:1]
+        not_modified = server.stats()["not_modified"]
+        df_again = crawl(server, str(tmp_path))
+        # Every PR's activity came back 304
+        assert server.stats()["not_modified"] - not_modified >= 6
+    assert (df_again["build_status"] == "FAILED").all()
+    assert list(df_again["files_changed"]) == list(df["files_changed"])
+    assert list(df_again["approvals"]) == list(df["approvals"])
@@ -0,0 +1,43 @@
+from datetime import datetime, timezone
+
+import pandas as pd
+import pytest
+
+from src.pybitbucket.bitbucket import PullRequestList
+from src.pybitbucket.enrichment import ENRICHMENT_SCHEMA
+from src.pybitbucket.export import DatasetExporter, EXPORT_PARQUET, EXPORT_ARROW
+from src.pybitbucket.records import ColumnarRecords
+
+CREATED_ON = datetime(2024, 5, 1, 10, 0, tzinfo=timezone.utc)
+
+
+def get_prs(first_pr_id, state, merge_commit_hash, build_status=None):
+    records = ColumnarRecords(PullRequestList.schema + ENRICHMENT_SCHEMA)
+    for pr_id in range(first_pr_id, first_pr_id + 3):
+        records.append(("PR", pr_id, "title", CREATED_ON, CREATED_ON, "P0", "stub", "Stub Author 1", "repo-0", state,
+                        "feature", "main", None, merge_commit_hash) +
+                       (None,) * (len(ENRICHMENT_SCHEMA) - 2) + (build_status, None))
+    return records.to_dataframe()
+
+
+def read_dataset(directory, file_format):
+    import pyarrow.dataset
+
+    dataset = pyarrow.dataset.dataset(directory, format="ipc" if file_format == EXPORT_ARROW else "parquet",
+                                      partitioning="hive")
+    return dataset.to_table().to_pandas()
+
+
+@pytest.mark.parametrize("file_format", [EXPORT_PARQUET, EXPORT_ARROW])
+def test_appended_batches_share_one_schema(tmp_path, file_format):
+    pytest.importorskip("pyarrow")
+    # An OPEN-only delta has no merge commit hashes or build statuses; the next run's delta has both
+    DatasetExporter(str(tmp_path), file_format=file_format, append=True).write_batch("prs", get_prs(1, "OPEN", None))
+    DatasetExporter(str(tmp_path), file_format=file_format, append=True).write_batch(
+        "prs", get_prs(4, "MERGED", "abc123", "SUCCESSFUL"))
+    df = read_dataset(str(tmp_path / "prs"), file_format).sort_values("pr_id").reset_index(drop=True)
+    assert list(df["pr_id"]) == [1, 2, 3, 4, 5, 6]
+    assert list(df["merge_commit_hash"].isna()) == [True] * 3 + [False] * 3
+    assert list(df["build_status"].astype(object).fillna("")) == [""] * 3 + ["SUCCESSFUL"] * 3
+    if file_format == EXPORT_PARQUET:
+        assert len(pd.read_parquet(str(tmp_path / "prs"))) == 6
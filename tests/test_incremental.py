@@ -0,0 +1,74 @@
+from datetime import timedelta
+
+import pytest
+
+from src.pybitbucket.bitbucket import Bitbucket
+from src.pybitbucket.stub import StubBitbucketServer, SyntheticDataset
+
+STATES = ("MERGED", "OPEN", "DECLINED")
+
+
+class ChangingDataset(SyntheticDataset):
+    # The PR ids in merged_pr_ids have been merged since, and updated a month later
+    merged_pr_ids = set()
+
+    def get_state(self, pr_id):
+        if pr_id in self.merged_pr_ids:
+            return "MERGED"
+        return super().get_state(pr_id)
+
+    def get_updated_on(self, repo_index, pr_id):
+        updated_on = super().get_updated_on(repo_index, pr_id)
+        return updated_on + timedelta(days=30) if pr_id in self.merged_pr_ids else updated_on
+
+
+def crawl(server, directory, export_format, normalize_commits=False):
+    settings = server.write_settings(directory, secret_general={
+        "incremental_sync": "1", "sync_state_file": f"{directory}/sync_state.json", "export_format": export_format,
+        "export_dir": f"{directory}/export", "normalize_commits": "1" if normalize_commits else "0"},
+        atlassian={"pr_states": ",".join(STATES)})
+    Bitbucket(settings).crawl()
+
+
+def read_rows(directory, export_format, kind):
+    import pyarrow.dataset
+
+    dataset = pyarrow.dataset.dataset(f"{directory}/export/{kind}", partitioning="hive",
+                                      format="ipc" if export_format == "arrow" else "parquet")
+    return dataset.to_table().to_pandas()
+
+
+def get_counts(directory, export_format, normalize_commits):
+    df_prs = read_rows(directory, export_format, "prs")
+    df_links = read_rows(directory, export_format, "pr_commits" if normalize_commits else "commits")
+    assert not df_prs.duplicated(["repo", "pr_id"]).any()
+    assert not df_links.duplicated(["repo", "pr_id", "hash"]).any()
+    return df_prs["state"].astype(str).value_counts().to_dict(), len(df_links)
+
+
+@pytest.mark.parametrize("export_format,normalize_commits", [("parquet", False), ("arrow", False),
+                                                              ("parquet", True)])
+def test_dataset_reruns_replace_open_pull_requests(tmp_path, export_format, normalize_commits):
+    pytest.importorskip("pyarrow")
+    dataset = ChangingDataset(repos=3, prs_per_repo=12, commits_per_pr=2, states=STATES)
+    ChangingDataset.merged_pr_ids = set()
+    directory = str(tmp_path)
+    with StubBitbucketServer(dataset) as server:
+        crawl(server, directory, export_format, normalize_commits)
+        first = get_counts(directory, export_format, normalize_commits)
+        assert first == ({"MERGED": 12, "OPEN": 12, "DECLINED": 12}, 72)
+        # Nothing changed upstream: the open PRs are listed again and replace their earlier rows
+        crawl(server, directory, export_format, normalize_commits)
+        assert get_counts(directory, export_format, normalize_commits) == first
+        crawl(server, directory, export_format, normalize_commits)
+        assert get_counts(directory, export_format, normalize_commits) == first
+        # Open PRs 1 and 4 of every repo are merged
+        ChangingDataset.merged_pr_ids = {1, 4}
+        crawl(server, directory, export_format, normalize_commits)
+        assert get_counts(directory, export_format, normalize_commits) == \
+            ({"MERGED": 18, "OPEN": 6, "DECLINED": 12}, 72)
+        ChangingDataset.merged_pr_ids = set()
+    if normalize_commits:
+        df_commits = read_rows(directory, export_format, "commits")
+        assert not df_commits.duplicated(["workspace", "hash"]).any()
+        assert len(df_commits) == 72
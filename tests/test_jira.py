@@ -0,0 +1,32 @@
+import pandas as pd
+import pytest
+
+from src.pybitbucket.jira import JiraKeyExtractor
+
+MESSAGES = ["PROJ-12 fix the build", "ABC-123_foo", "feature_ABC-7", "merge xPROJ-1 and PROJ-1a", "no key here",
+            None, "see UTF-8 and PROJ-9, PROJ-10"]
+FIRST_KEYS = ["PROJ-12", "ABC-123", "ABC-7", None, None, None, "UTF-8"]
+
+
+def test_find():
+    extractor = JiraKeyExtractor()
+    assert [extractor.find(message) for message in MESSAGES] == FIRST_KEYS
+    assert extractor.find_all("PROJ-9,PROJ-10 PROJ-9_x ABC-1") == ["PROJ-9", "PROJ-10", "ABC-1"]
+
+
+def test_find_with_project_keys():
+    extractor = JiraKeyExtractor(["PROJ", "ABC"])
+    assert [extractor.find(message) for message in MESSAGES] == \
+        ["PROJ-12", "ABC-123", "ABC-7", None, None, None, "PROJ-9"]
+
+
+@pytest.mark.parametrize("project_keys", [None, ["PROJ", "ABC", "UTF"]])
+def test_extract_series_keeps_a_non_default_index(project_keys):
+    # As in a filtered or concatenated frame
+    extractor = JiraKeyExtractor(project_keys)
+    series = pd.Series(MESSAGES, index=range(10, 10 + len(MESSAGES)), name="message")
+    keys = extractor.extract_series(series)
+    assert list(keys.index) == list(series.index)
+    assert keys.name == "message"
+    assert [None if pd.isna(key) else key for key in keys] == [extractor.find(message) for message in MESSAGES]
+    assert list(extractor.extract_series(series, all_keys=True).index) == list(series.index)
@@ -0,0 +1,51 @@
+import os
+
+import pytest
+
+from src.pybitbucket.bitbucket import Bitbucket
+from src.pybitbucket.scheduler import BitbucketRequestError
+from src.pybitbucket.stub import StubBitbucketServer, SyntheticDataset
+
+# A crawl with a checkpoint_dir is killed partway through by a PR commits request that keeps failing, then resumed
+# against the same stub server. The resumed output must match an uninterrupted crawl, with no PR or commit duplicated
+# or missing.
+FAULT_PATH = "/repositories/stub/repo-2/pullrequests/40/commits"
+
+
+def crawl(server, directory, checkpoint_dir=None):
+    secret_general = {"checkpoint_dir": checkpoint_dir} if checkpoint_dir is not None else None
+    settings = server.write_settings(directory, secret_general=secret_general, rate_limit={"max_attempts": "1"})
+    bitbucket = Bitbucket(settings)
+    bitbucket.crawl()
+    return bitbucket
+
+
+def sort_rows(df, columns):
+    return df.sort_values(columns).reset_index(drop=True)
+
+
+def test_resume_after_interruption(tmp_path):
+    dataset = SyntheticDataset(repos=4, prs_per_repo=120, commits_per_pr=3)
+    with StubBitbucketServer(dataset) as server:
+        reference = crawl(server, str(tmp_path / "reference"))
+
+        checkpoint_dir = str(tmp_path / "run" / "checkpoint")
+        server.inject_fault(FAULT_PATH, status=503)
+        with pytest.raises(BitbucketRequestError):
+            crawl(server, str(tmp_path / "run"), checkpoint_dir)
+        assert os.path.exists(os.path.join(checkpoint_dir, "state.json"))
+        assert len(os.listdir(os.path.join(checkpoint_dir, "batches"))) > 0
+
+        resumed = crawl(server, str(tmp_path / "run"), checkpoint_dir)
+        assert not os.path.exists(checkpoint_dir)
+
+    pr_columns = ["repo", "pr_id"]
+    commit_columns = ["repo", "pr_id", "hash"]
+    assert len(resumed.df_prs) == dataset.repos * dataset.prs_per_repo
+    assert not resumed.df_prs.duplicated(pr_columns).any()
+    assert not resumed.df_commits.duplicated(commit_columns).any()
+    assert sort_rows(resumed.df_prs, pr_columns).equals(sort_rows(reference.df_prs, pr_columns))
+    assert sort_rows(resumed.df_commits, commit_columns).equals(sort_rows(reference.df_commits, commit_columns))
+    # Rows from the interrupted run keep their categorical columns
+    assert resumed.df_prs.dtypes.equals(reference.df_prs.dtypes)
+    assert resumed.df_commits.dtypes.equals(reference.df_commits.dtypes)
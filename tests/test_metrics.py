@@ -0,0 +1,73 @@
+from datetime import datetime, timedelta
+
+import pandas as pd
+import pytest
+
+from src.pybitbucket.metrics import MetricsEngine
+
+START = datetime(2024, 1, 1, 9, 0)
+AGGREGATES = [(("project", "repo"), None), (("author",), "W"), ((), None), (("state",), "M"),
+              (("workspace", "project"), "D")]
+
+
+def get_prs(pr_ids, state_of, hours_of, jira_of):
+    rows = []
+    for pr_id in pr_ids:
+        created = START + timedelta(hours=7 * pr_id)
+        rows.append({"workspace": "ws", "project": f"P{pr_id % 2}", "repo": f"repo-{pr_id % 3}", "pr_id": pr_id,
+                     "author": f"author-{pr_id % 4}", "state": state_of(pr_id), "created_datetime": created,
+                     "updated_datetime": created + timedelta(hours=hours_of(pr_id)), "jira_id": jira_of(pr_id)})
+    return pd.DataFrame(rows)
+
+
+def get_commits(pr_ids, count_of):
+    rows = []
+    for pr_id in pr_ids:
+        for index in range(count_of(pr_id)):
+            rows.append({"workspace": "ws", "repo": f"repo-{pr_id % 3}", "pr_id": pr_id, "hash": f"{pr_id}-{index}",
+                         "jira_id": f"PROJ-{pr_id}" if index % 2 == 0 else None})
+    return pd.DataFrame(rows)
+
+
+def test_update_matches_a_fresh_engine():
+    base_ids = range(1, 41)
+    df_prs = get_prs(base_ids, lambda pr_id: "OPEN" if pr_id % 3 == 0 else "MERGED",
+                     lambda pr_id: (pr_id * 5) % 200, lambda pr_id: f"PROJ-{pr_id}" if pr_id % 4 else None)
+    df_commits = get_commits(base_ids, lambda pr_id: pr_id % 5)
+    # PRs 5-14 are re-fetched: merged much later, with a Jira key and a new commit list; PRs 41-50 are new; and
+    # PR 20 gains commits without its PR row
+    delta_ids = list(range(5, 15)) + list(range(41, 51))
+    df_delta_prs = get_prs(delta_ids, lambda pr_id: "MERGED" if pr_id % 2 else "DECLINED",
+                           lambda pr_id: 24 * 40 + pr_id, lambda pr_id: f"PROJ-{pr_id}")
+    df_delta_commits = pd.concat([get_commits(delta_ids, lambda pr_id: pr_id % 7 + 1),
+                                  get_commits([20], lambda pr_id: 3).assign(hash=lambda df: "extra-" + df["hash"])],
+                                 ignore_index=True)
+
+    engine = MetricsEngine(df_prs, df_commits)
+    for by, freq in AGGREGATES:
+        engine.aggregate(by, freq)
+    engine.cycle_time()
+    engine.update(df_delta_prs, df_delta_commits)
+
+    merged_prs = pd.concat([df_prs[~df_prs["pr_id"].isin(delta_ids)], df_delta_prs], ignore_index=True)
+    merged_commits = pd.concat([df_commits[~df_commits["pr_id"].isin(delta_ids)], df_delta_commits],
+                               ignore_index=True)
+    fresh = MetricsEngine(merged_prs, merged_commits)
+    assert len(engine) == len(fresh) == 50
+    for by, freq in AGGREGATES:
+        pd.testing.assert_frame_equal(engine.aggregate(by, freq), fresh.aggregate(by, freq), check_dtype=False)
+    pd.testing.assert_frame_equal(engine.cycle_time(), fresh.cycle_time(), check_dtype=False)
+    pd.testing.assert_frame_equal(engine.jira_coverage(), fresh.jira_coverage(), check_dtype=False)
+    totals = engine.aggregate(())
+    assert totals["commits"].iloc[0] == len(merged_commits)
+    assert totals["prs"].iloc[0] == 50
+
+
+def test_percentiles_from_the_histogram():
+    # Cycle times of 2h, 10h, 30h and 100h: the p50 falls in the (8h, 24h] bucket and the p90 in (72h, 168h]
+    df_prs = get_prs([1, 2, 3, 4], lambda pr_id: "MERGED", lambda pr_id: [2, 10, 30, 100][pr_id - 1],
+                     lambda pr_id: None)
+    cycle_time = MetricsEngine(df_prs, None).cycle_time(by=())
+    assert cycle_time["cycle_time_mean_hours"].iloc[0] == pytest.approx(35.5)
+    assert cycle_time["cycle_time_p50_hours"].iloc[0] == 24
+    assert cycle_time["cycle_time_p90_hours"].iloc[0] == 168
@@ -0,0 +1,46 @@
+import pytest
+
+from src.pybitbucket.bitbucket import Bitbucket, BbOauth2
+from src.pybitbucket.scheduler import BitbucketAuthError, RequestScheduler
+from src.pybitbucket.stub import StubBitbucketServer, SyntheticDataset
+from src.pybitbucket.transport import BbTransport
+
+
+def get_provider(server, **oauth_args):
+    transport = BbTransport(scheduler=RequestScheduler(sleep=lambda seconds: None))
+    oauth2 = BbOauth2({"key": "stub-key", "secret": "stub-secret"}, transport=transport, token_uri=server.token_url,
+                      **oauth_args)
+    transport.set_token_provider(oauth2)
+    return transport, oauth2
+
+
+def test_rejected_credentials_send_no_api_requests():
+    with StubBitbucketServer(SyntheticDataset(repos=1), token_status=401) as server:
+        transport, oauth2 = get_provider(server)
+        for attempt in range(5):
+            with pytest.raises(BitbucketAuthError) as error:
+                transport.get_json(f"{server.api_base_url}/repositories/stub/repo-0")
+            assert error.value.status_code == 401
+        # One token request in all, and no unauthenticated API calls
+        assert server.stats()["requests"] == 0
+        assert server.stats()["tokens"] == 1
+
+
+def test_token_request_is_retried_after_the_failure_interval():
+    with StubBitbucketServer(SyntheticDataset(repos=1), token_status=401) as server:
+        transport, oauth2 = get_provider(server, failure_retry_seconds=0)
+        with pytest.raises(BitbucketAuthError):
+            transport.get_json(f"{server.api_base_url}/repositories/stub/repo-0")
+        server.token_status = 200
+        assert transport.get_json(f"{server.api_base_url}/repositories/stub/repo-0")["slug"] == "repo-0"
+        assert server.stats()["tokens"] == 2
+
+
+def test_crawl_with_rejected_credentials(tmp_path, capsys):
+    with StubBitbucketServer(SyntheticDataset(repos=2), token_status=401) as server:
+        bitbucket = Bitbucket(server.write_settings(str(tmp_path)))
+        with pytest.raises(ValueError):
+            bitbucket.crawl()
+        assert server.stats()["requests"] == 0
+        assert server.stats()["tokens"] == 1
+    assert "Could not get an access token" in capsys.readouterr().out
@@ -0,0 +1,79 @@
+import pytest
+
+from src.pybitbucket import scheduler as scheduler_module
+from src.pybitbucket.scheduler import BitbucketRequestError, RequestScheduler
+from src.pybitbucket.stub import StubBitbucketServer, SyntheticDataset
+from src.pybitbucket.transport import BbTransport
+
+# RequestScheduler and BbTransport against the local stub server, which injects 429s (with Retry-After) and 503s.
+# Sleeps are recorded instead of taken, and the token bucket runs on a fake clock, so nothing here waits.
+REPO_PATH = "/repositories/stub/repo-0"
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def server():
+    with StubBitbucketServer(SyntheticDataset(repos=1, prs_per_repo=1), retry_after_seconds=7) as stub_server:
+        yield stub_server
+
+
+def get_transport(clock, **scheduler_args):
+    return BbTransport(access_token="stub-token", scheduler=RequestScheduler(sleep=clock.sleep, **scheduler_args))
+
+
+def test_retry_after_is_honoured(server):
+    clock = FakeClock()
+    server.inject_fault(REPO_PATH, status=429, count=2)
+    transport = get_transport(clock, backoff_base_seconds=1.0, backoff_max_seconds=2.0)
+    assert transport.get_json(f"{server.api_base_url}{REPO_PATH}")["slug"] == "repo-0"
+    # Retry-After wins over the (much shorter) backoff
+    assert clock.sleeps == [7.0, 7.0]
+    assert transport.scheduler.stats()["retries"] == 2
+    assert server.stats()["requests"] == 3
+
+
+def test_backoff_is_bounded(server):
+    clock = FakeClock()
+    server.inject_fault(REPO_PATH, status=503, count=6)
+    transport = get_transport(clock, max_attempts=7, backoff_base_seconds=1.0, backoff_max_seconds=2.5)
+    assert transport.get_json(f"{server.api_base_url}{REPO_PATH}")["slug"] == "repo-0"
+    assert len(clock.sleeps) == 6
+    for attempt, delay in enumerate(clock.sleeps, start=1):
+        assert 0.0 <= delay <= min(2.5, 1.0 * 2 ** (attempt - 1))
+
+
+def test_gives_up_after_max_attempts(server):
+    clock = FakeClock()
+    server.inject_fault(REPO_PATH, status=503, count=10)
+    transport = get_transport(clock, max_attempts=3, backoff_base_seconds=0.5, backoff_max_seconds=1.0)
+    with pytest.raises(BitbucketRequestError) as error:
+        transport.get_json(f"{server.api_base_url}{REPO_PATH}")
+    assert error.value.attempts == 3
+    assert error.value.status_code == 503
+    # No sleep after the last attempt
+    assert len(clock.sleeps) == 2
+    assert server.stats()["requests"] == 3
+
+
+def test_token_bucket_budget_holds(server, monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(scheduler_module, "time", clock)
+    # 3600 requests an hour is one a second, after a burst of 2
+    transport = get_transport(clock, requests_per_hour=3600, burst=2)
+    for request in range(6):
+        assert transport.get_json(f"{server.api_base_url}{REPO_PATH}") is not None
+    assert clock.now == pytest.approx(4.0)
+    assert transport.scheduler.stats()["throttled_seconds"] == pytest.approx(4.0)
+    assert server.stats()["requests"] == 6
@@ -0,0 +1,93 @@
+import sqlite3
+
+import pandas as pd
+
+from src.pybitbucket.bitbucket import Bitbucket
+from src.pybitbucket.store import Datastore
+from src.pybitbucket.stub import StubBitbucketServer, SyntheticDataset
+
+ENRICHMENT_COLUMNS = ["lines_added", "lines_removed", "files_changed", "approvals", "build_status"]
+
+
+def crawl(server, directory, datastore_path, enrichment=False):
+    settings = server.write_settings(directory, atlassian={"jira_project_keys": "PROJ",
+                                                           "require_jira_issue_id_in_commit_message": "1"})
+    with open(settings["properties"], "a") as properties_file:
+        properties_file.write(f"[datastore]\nenabled=1\npath={datastore_path}\n")
+        if enrichment:
+            properties_file.write("[enrichment]\nenabled=1\n")
+    bitbucket = Bitbucket(settings)
+    bitbucket.crawl()
+    return bitbucket
+
+
+def get_counts(datastore):
+    return {table: datastore.count(table) for table in ["workspaces", "projects", "repositories", "pull_requests",
+                                                        "commits", "pr_commits"]}
+
+
+def test_recrawl_upserts_and_keeps_enrichment(tmp_path):
+    dataset = SyntheticDataset(projects=2, repos=4, prs_per_repo=10, commits_per_pr=3, prs_per_change=2)
+    datastore_path = str(tmp_path / "store.sqlite")
+    with StubBitbucketServer(dataset) as server:
+        bitbucket = crawl(server, str(tmp_path), datastore_path, enrichment=True)
+        datastore = bitbucket.get_datastore()
+        first_counts = get_counts(datastore)
+        enriched = datastore.query_pull_requests().set_index(["repo", "pr_id"])[ENRICHMENT_COLUMNS].sort_index()
+        # The second crawl has no enrichment stage: it only updates the columns it provides
+        bitbucket = crawl(server, str(tmp_path), datastore_path)
+        datastore = bitbucket.get_datastore()
+        assert get_counts(datastore) == first_counts
+    assert first_counts == {"workspaces": 1, "projects": 2, "repositories": 4, "pull_requests": 40,
+                            "commits": 60, "pr_commits": 120}
+    assert enriched["lines_added"].notna().all()
+    assert enriched["build_status"].notna().all()
+    after = datastore.query_pull_requests().set_index(["repo", "pr_id"])[ENRICHMENT_COLUMNS].sort_index()
+    pd.testing.assert_frame_equal(after, enriched)
+
+
+def test_query_filters(tmp_path):
+    dataset = SyntheticDataset(repos=3, prs_per_repo=10, commits_per_pr=2, authors=4)
+    with StubBitbucketServer(dataset) as server:
+        bitbucket = crawl(server, str(tmp_path), str(tmp_path / "store.sqlite"))
+    datastore = bitbucket.get_datastore()
+    df_prs = bitbucket.df_prs
+    df = datastore.query_pull_requests(repo="repo-1")
+    assert sorted(df["pr_id"]) == list(range(1, 11))
+    author = df_prs["author"].iloc[0]
+    assert len(datastore.query_pull_requests(author=author)) == (df_prs["author"] == author).sum()
+    jira_id = df_prs["jira_id"].iloc[0]
+    assert jira_id.startswith("PROJ-")
+    df = datastore.query_pull_requests(jira_id=jira_id)
+    assert list(zip(df["repo"], df["pr_id"])) == list(zip(df_prs[df_prs["jira_id"] == jira_id]["repo"],
+                                                          df_prs[df_prs["jira_id"] == jira_id]["pr_id"]))
+    # updated_since is inclusive, updated_before exclusive; newest first
+    since, before = df_prs["updated_datetime"].sort_values().iloc[[5, 20]]
+    df = datastore.query_pull_requests(updated_since=since, updated_before=before)
+    expected = df_prs[(df_prs["updated_datetime"] >= since) & (df_prs["updated_datetime"] < before)]
+    assert len(df) == len(expected) > 0
+    assert df["updated_datetime"].is_monotonic_decreasing
+    assert len(datastore.query_pull_requests(repo="repo-1", limit=3)) == 3
+    assert len(datastore.query_commits(repo="repo-2")) == 20
+    assert len(datastore.query_commits(repo="repo-2", pr_id=4)) == 2
+    assert len(datastore.query_commits(unique=True)) == 60
+
+
+def test_migrates_a_file_without_enrichment_columns(tmp_path):
+    path = str(tmp_path / "old.sqlite")
+    connection = sqlite3.connect(path)
+    connection.execute("CREATE TABLE pull_requests (workspace TEXT, repo TEXT, pr_id INTEGER, project TEXT, "
+                       "message TEXT, author TEXT, state TEXT, source_branch TEXT, destination_branch TEXT, "
+                       "jira_id TEXT, merge_commit_hash TEXT, created_datetime TEXT, updated_datetime TEXT, "
+                       "PRIMARY KEY (workspace, repo, pr_id))")
+    connection.execute("INSERT INTO pull_requests VALUES ('stub', 'repo-0', 1, 'P0', 'title', 'Stub Author 1', "
+                       "'MERGED', 'feature', 'main', 'PROJ-1', 'f00000000001', '2022-01-01 10:00:00', "
+                       "'2022-01-01 11:00:00')")
+    connection.commit()
+    connection.close()
+    datastore = Datastore(path)
+    df = datastore.query_pull_requests()
+    assert len(df) == 1
+    assert df["jira_id"].iloc[0] == "PROJ-1"
+    assert df["lines_added"].isna().all()
+    datastore.close()
@@ -0,0 +1,41 @@
+import asyncio
+
+import pandas as pd
+import pytest
+
+from src.pybitbucket.bitbucket import Bitbucket
+from src.pybitbucket.stub import StubBitbucketServer, SyntheticDataset
+
+
+def test_crawl_exports_every_row(tmp_path):
+    dataset = SyntheticDataset(projects=2, repos=5, prs_per_repo=30, commits_per_pr=4, states=("MERGED", "OPEN"))
+    with StubBitbucketServer(dataset) as server:
+        settings = server.write_settings(str(tmp_path), atlassian={"pr_states": "MERGED,OPEN"})
+        bitbucket = Bitbucket(settings)
+        bitbucket.crawl()
+    df_prs = pd.read_csv(tmp_path / "prs.csv")
+    df_commits = pd.read_csv(tmp_path / "commits.csv")
+    assert len(df_prs) == dataset.repos * dataset.prs_per_repo
+    assert df_prs["state"].value_counts().to_dict() == {"MERGED": dataset.count_pull_requests("MERGED"),
+                                                        "OPEN": dataset.count_pull_requests("OPEN")}
+    assert len(df_commits) == dataset.repos * dataset.prs_per_repo * dataset.commits_per_pr
+    assert sorted(df_prs["repo"].unique()) == [f"repo-{index}" for index in range(dataset.repos)]
+
+
+def test_async_workspaces_and_crawl():
+    pytest.importorskip("aiohttp")
+    from src.pybitbucket.aio import AsyncBitbucket
+
+    dataset = SyntheticDataset(repos=3, prs_per_repo=12, commits_per_pr=2)
+
+    async def crawl(server):
+        async with AsyncBitbucket(dataset.workspace, "stub-token", api_base_url=server.api_base_url) as bitbucket:
+            workspaces = [workspace async for workspace in bitbucket.iter_workspaces()]
+            df_prs, df_commits = await bitbucket.crawl_pull_requests()
+        return workspaces, df_prs, df_commits
+
+    with StubBitbucketServer(dataset) as server:
+        workspaces, df_prs, df_commits = asyncio.run(crawl(server))
+    assert [workspace.slug for workspace in workspaces] == [dataset.workspace]
+    assert len(df_prs) == dataset.repos * dataset.prs_per_repo
+    assert len(df_commits) == dataset.repos * dataset.prs_per_repo * dataset.commits_per_pr
@@ -0,0 +1,24 @@
+import pytest
+
+from src.pybitbucket.bitbucket import Bitbucket
+from src.pybitbucket.stub import StubBitbucketServer, SyntheticDataset
+
+
+def test_first_workspace_fails(tmp_path):
+    # The stub only serves "stub", so the first configured workspace cannot be loaded
+    with StubBitbucketServer(SyntheticDataset(repos=2, prs_per_repo=5, commits_per_pr=2)) as server:
+        bitbucket = Bitbucket(server.write_settings(str(tmp_path), atlassian={"workspace_id": "missing,stub"}))
+        df_prs, df_commits = bitbucket.crawl()
+    assert list(bitbucket.workspaces) == ["stub"]
+    assert bitbucket.workspace.slug == "stub"
+    assert bitbucket.get_workspace() is bitbucket.workspace
+    assert len(df_prs) == 10
+    assert len(df_commits) == 20
+
+
+def test_every_workspace_fails(tmp_path):
+    with StubBitbucketServer(SyntheticDataset(repos=1)) as server:
+        bitbucket = Bitbucket(server.write_settings(str(tmp_path), atlassian={"workspace_id": "missing,other"}))
+        with pytest.raises(ValueError):
+            bitbucket.crawl()
+        assert bitbucket.workspace is None